@@ -13,18 +13,94 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import timeit
+
+# Startup time, measured from here to the menu being built
+startup_start = timeit.default_timer()
+
+import functools
+import json
 import os
 import webbrowser
 import maya.cmds as cmds
 import maya.mel as mel
-import pymel.core as pymel
-import CoDMayaTools
-import SEToolsPlugin
+import CoDCharacterToolsSE
+
+# pymel, CoDMayaTools and SEToolsPlugin are slow to import, they're imported by the functions that use them
+
+# Only test animations with this in their name are shown in the menu
+animation_filter = ""
+
+# Checkpoints made with create_checkpoint, by name
+checkpoints = {}
+
+# Checkpoints with more weight data than this (in bytes) are written to disk
+checkpoint_spill_size = 256 * 1024 * 1024
+
+# Deformation QA flags vertices whose edges stretch or squash by more than this ratio, or that keep less than this much of their volume
+qa_stretch_limit = 1.3
+qa_volume_limit = 0.7
+
+# Target rig the skeleton was last compared to, and the job comparing it again on every save
+compare_target = None
+compare_job = None
+
+# Skin weight files written by save_weights
+weights_file_magic = b"CoDWeights"
+weights_file_version = 1
+
+# Most bones one surface can use, split_surfaces splits meshes that use more
+surface_bone_budget = 128
+
+# Vertices whose weights move more than this when they're quantized for export are flagged
+quantize_error_limit = 0.01
+
+# Jobs waiting to run and the one that's running, see queue_job
+jobs = []
+job_state = None
+
+# Threads for reading files while Maya carries on, see run_in_background, and what they've been asked to read ahead
+background_pool = None
+background_threads = 4
+target_rig_prefetches = {}
+
+# What's in the targets and animations directories, kept up to date by watch_directories, None until they've been looked at
+target_rig_files = None
+animation_index = None
+
+# Target rig joints already read, dropped when the rig's file changes
+target_rigs = {}
+
+# The character namespace everything is limited to, None for the whole scene, see set_character
+character_namespace = None
+
+# Log how long every operation takes, see CoDCharacterToolsTelemetry
+telemetry_enabled = True
+
+# Vertices are only counted for operations that took longer than this (in seconds), counting them takes a while on big characters
+telemetry_vertex_threshold = 1.0
+
+# How many errors have been shown, see run_next_job_step
+error_count = 0
 
 def error( message ):
+    # Counted, so a job step that failed this way can be told apart from one that worked
+    global error_count
+
+    error_count += 1
+
+    # No dialogs in batch mode (mayapy, benchmarks), print instead
+    if cmds.about( batch = True ):
+        print( "Error: " + message )
+        return
+
     cmds.confirmDialog( title = "An error has occurred", message = message )
 
 def confirm_dialog( message ):
+    if cmds.about( batch = True ):
+        print( message )
+        return
+
     cmds.confirmDialog( title = "Confirmation", message = message )
 
 def prompt_dialog( title, message ):
@@ -35,17 +111,251 @@ def prompt_dialog( title, message ):
 
     return None
 
+# How many operations deep we are, only the outermost one does anything
+operation_depth = 0
+
+class OperationError( Exception ):
+    # Raised when an operation can't carry on after it's changed the scene, the operation is undone and the message shown
+    pass
+
+def operation( name ):
+    # Wraps a top level operation so it runs with the viewport refresh suspended, the evaluation
+    # manager in DG mode so it isn't rebuilding its graph after every change, and as one undo chunk
+    # If it fails, the chunk is undone so the scene is left how it was
+    def decorator( function ):
+        @functools.wraps( function )
+        def wrapper( *args, **kwargs ):
+            global operation_depth
+
+            # Operations that call other operations are already covered
+            if operation_depth > 0:
+                return function( *args, **kwargs )
+
+            evaluation_mode = cmds.evaluationManager( query = True, mode = True )[0]
+            undo_enabled = cmds.undoInfo( query = True, state = True )
+            failed = False
+            message = None
+            scale = None
+            scope = None
+
+            # Not being able to measure it mustn't stop the operation
+            if telemetry_enabled:
+                try:
+                    scale = get_operation_scale()
+                except Exception:
+                    pass
+
+            cmds.evaluationManager( mode = "off" )
+            cmds.undoInfo( openChunk = True, chunkName = name )
+            cmds.refresh( suspend = True )
+            start = timeit.default_timer()
+
+            # Last before the try, anything before it failing would leave every later operation thinking it's nested
+            operation_depth += 1
+
+            try:
+                scope = enter_character_scope()
+
+                return function( *args, **kwargs )
+            except OperationError as exception:
+                failed = True
+                message = str( exception )
+            except:
+                failed = True
+                raise
+            finally:
+                duration = timeit.default_timer() - start
+                cmds.refresh( suspend = False )
+                cmds.undoInfo( closeChunk = True )
+                cmds.evaluationManager( mode = evaluation_mode )
+                operation_depth -= 1
+
+                # Relative names are only on while the operation runs, names from outside it are looked up from the root again
+                if scope != None:
+                    leave_character_scope( scope )
+
+                if scale != None:
+                    log_operation( name, scale, duration, failed )
+
+                if failed:
+                    # Without undo there's nothing to roll back to
+                    if message != None and undo_enabled:
+                        cmds.undo()
+                        error( message + "\n\nThe scene has been put back how it was." )
+                    elif message != None:
+                        error( message )
+                    elif undo_enabled:
+                        cmds.undo()
+                        error( name + " failed, the scene has been put back how it was.\n\nCheck the script editor for details." )
+                    else:
+                        error( name + " failed.\n\nCheck the script editor for details." )
+
+        return wrapper
+
+    return decorator
+
+def get_telemetry_dir():
+    return cmds.internalVar( userScriptDir = True ) + "CoDCharacterTools/Telemetry/"
+
+def get_operation_scale():
+    # What an operation was run on, so the analyzer can tell how the time grows with it
+    # Only what's cheap to count, this runs before every operation
+    return len( get_joints() ), len( cmds.ls( get_meshes(), type = "transform" ) )
+
+def log_operation( name, scale, duration, failed ):
+    # Written in the background by CoDCharacterToolsTelemetry, so this costs next to nothing
+    # The vertices are counted after the operation, and only when it was slow enough for them to matter
+    import time
+    import CoDCharacterToolsTelemetry
+
+    vertices = None
+
+    if duration > telemetry_vertex_threshold:
+        try:
+            vertices = get_mesh_counts( cmds.ls( get_meshes(), type = "transform" ) )[0]
+        except Exception:
+            pass
+
+    CoDCharacterToolsTelemetry.log( get_telemetry_dir(), {
+        "time": time.time(),
+        "operation": name,
+        "character": character_namespace,
+        "joints": scale[0],
+        "meshes": scale[1],
+        "vertices": vertices,
+        "duration": duration,
+        "failed": failed,
+        "maya": cmds.about( version = True )
+    } )
+
+@operation( "Remove all namespaces" )
 def remove_namespaces():
-    if pymel.listNamespaces( recursive = True, internal = False ):
-        namespaces = []
+    # Flattens the namespaces under the character's into it, or into the root without a character
+    # Every new name is worked out first, so nodes that would clash get a name that says where they came from instead of Maya's joint1
+    # Returns { old name: new name } with absolute names, for every node that was moved
+    scope = ":" + character_namespace if character_namespace != None else ":"
+    prefix = scope + ":" if scope != ":" else ":"
+    namespaces = [ namespace for namespace in cmds.namespaceInfo( scope, listOnlyNamespaces = True, recurse = True, absoluteName = True ) or [] if not namespace in ( ":UI", ":shared" ) ]
+
+    if len( namespaces ) < 1:
+        return {}
+
+    # Nodes already in the scope keep their names, then the namespaces closest to it win
+    taken = set( [ get_short_name( node ) for node in cmds.namespaceInfo( scope, listOnlyDependencyNodes = True, absoluteName = True ) or [] ] )
+    nodes = dict( ( namespace, cmds.namespaceInfo( namespace, listOnlyDependencyNodes = True, absoluteName = True ) or [] ) for namespace in namespaces )
+    renames = {}
+    clashes = []
+
+    # A clash's new name mustn't be one a node still to be moved has, or one in the namespace it's renamed in
+    names = set( taken )
+
+    for namespace in namespaces:
+        names.update( [ get_short_name( node ) for node in nodes[namespace] ] )
+
+    for namespace in sorted( namespaces, key = lambda namespace: namespace.count( ":" ) ):
+        for node in nodes[namespace]:
+            name = get_short_name( node )
+            new_name = name
+
+            if new_name in taken:
+                new_name = name + "_" + namespace.split( ":" )[-1]
+                index = 1
+
+                while new_name in names:
+                    index += 1
+                    new_name = name + "_" + namespace.split( ":" )[-1] + str( index )
+
+                clashes.append( ( node, new_name ) )
+
+            taken.add( new_name )
+            names.add( new_name )
+            renames[node] = ( namespace, prefix + new_name )
+
+    # Only the clashes are renamed one by one, inside their own namespace, then each namespace is moved in one go
+    # The map takes the name Maya actually gave it, in case it still had to change it
+    for node, new_name in clashes:
+        new_name = get_short_name( cmds.rename( node, renames[node][0] + ":" + new_name ) )
+        renames[node] = ( renames[node][0], prefix + new_name )
+        print( "Namespace clash: " + node + " is now " + new_name )
+
+    # Deepest first, each one is removed as soon as it's empty, moving a namespace takes the ones under it with it
+    for namespace in sorted( namespaces, key = lambda namespace: -namespace.count( ":" ) ):
+        if not cmds.namespace( exists = namespace ):
+            continue
+
+        cmds.namespace( moveNamespace = ( namespace, scope ), force = True )
+
+        if cmds.namespace( exists = namespace ):
+            cmds.namespace( removeNamespace = namespace )
+
+    return dict( ( node, renames[node][1] ) for node in renames )
+
+def enter_character_scope():
+    # With relative names, "head", "j_wrist_le" and so on are looked up in the character's namespace, and new nodes go in it
+    # Returns the namespace settings from before, for leave_character_scope once the operation's done
+    state = ( cmds.namespaceInfo( currentNamespace = True, absoluteName = True ), cmds.namespace( query = True, relativeNames = True ) )
+
+    if character_namespace == None:
+        return state
+
+    if not cmds.namespace( exists = ":" + character_namespace ):
+        print( "The character namespace " + character_namespace + " doesn't exist anymore, using the whole scene." )
+        set_character( None )
+        return state
 
-        for namespace in pymel.listNamespaces( recursive = True, internal = False ):
-            namespaces.append( namespace )
+    cmds.namespace( setNamespace = ":" + character_namespace )
+    cmds.namespace( relativeNames = True )
 
-        for namespace in reversed( namespaces ):
-            pymel.namespace( removeNamespace = namespace, mergeNamespaceWithRoot = True )
+    return state
 
-        namespaces[:] = []
+def leave_character_scope( state ):
+    namespace, relative = state
+
+    cmds.namespace( relativeNames = relative )
+
+    # The operation may have removed it
+    cmds.namespace( setNamespace = namespace if cmds.namespace( exists = namespace ) else ":" )
+
+def set_character( namespace ):
+    # Limits every operation to one character's namespace, so several can be converted and animated in one scene
+    global character_namespace
+
+    character_namespace = namespace
+
+    if namespace == None:
+        cmds.namespace( setNamespace = ":" )
+        return
+
+    if not cmds.namespace( exists = ":" + namespace ):
+        cmds.namespace( add = namespace, parent = ":" )
+
+    # So the SEModels imported after this go in it, names are only looked up in it during operations
+    cmds.namespace( setNamespace = ":" + namespace )
+
+def get_characters():
+    # Namespaces at the root with joints or SEModel meshes in them
+    characters = []
+
+    for namespace in cmds.namespaceInfo( ":", listOnlyNamespaces = True, absoluteName = True ) or []:
+        if not namespace in ( ":UI", ":shared" ) and len( cmds.ls( namespace + ":*", type = "joint" ) + cmds.ls( namespace + ":*SEModelMesh*" ) ) > 0:
+            characters.append( namespace.lstrip( ":" ) )
+
+    return sorted( characters )
+
+def scene_ls( *args, **kwargs ):
+    # cmds.ls limited to the character's namespace and the ones under it
+    # The names are the same as cmds.ls gives everywhere else, the absolute namespaces are only used to tell which ones are in it
+    names = cmds.ls( *args, **kwargs ) or []
+
+    if character_namespace == None:
+        return names
+
+    scope = ":" + character_namespace
+    kwargs.update( { "showNamespace": True, "absoluteName": True } )
+    result = cmds.ls( *args, **kwargs ) or []
+
+    # Comes back as name, namespace, name, namespace... in the same order
+    return [ names[index // 2] for index in range( 0, len( result ), 2 ) if result[index + 1] == scope or result[index + 1].startswith( scope + ":" ) ]
 
 def set_attribute( node, attribute, value ):
     if cmds.objExists( node ):
@@ -68,17 +378,111 @@ def get_groups():
     return groups
 
 def get_joints():
-    return cmds.ls( type = "joint" )
+    return scene_ls( type = "joint" )
 
 def get_meshes():
-    return cmds.ls( "*SEModelMesh*" )
+    return scene_ls( "*SEModelMesh*" )
 
 def get_skinclusters():
-    return cmds.ls( type = "skinCluster" )
+    return scene_ls( type = "skinCluster" )
 
 def get_skincluster_for_mesh( mesh ):
     return mel.eval( "findRelatedSkinCluster " + mesh )
 
+def get_skincluster_function( skinCluster ):
+    # Returns the skincluster function set and the dag path of the shape it deforms
+    import maya.api.OpenMaya as OpenMaya
+    import maya.api.OpenMayaAnim as OpenMayaAnim
+
+    selection = OpenMaya.MSelectionList()
+    selection.add( skinCluster )
+
+    function = OpenMayaAnim.MFnSkinCluster( selection.getDependNode( 0 ) )
+    shape = OpenMaya.MDagPath.getAPathTo( function.getOutputGeometry()[0] )
+
+    return function, shape
+
+def get_all_vertices( shape ):
+    import maya.api.OpenMaya as OpenMaya
+
+    component = OpenMaya.MFnSingleIndexedComponent()
+    components = component.create( OpenMaya.MFn.kMeshVertComponent )
+    component.setCompleteData( OpenMaya.MFnMesh( shape ).numVertices )
+
+    return components
+
+def get_skincluster_weights( skinCluster ):
+    # Returns the influence names and a ( vertices, influences ) array of weights, read in one go
+    import numpy
+
+    function, shape = get_skincluster_function( skinCluster )
+    influences = [ influence.partialPathName() for influence in function.influenceObjects() ]
+    weights, count = function.getWeights( shape, get_all_vertices( shape ) )
+
+    # fromiter with a count is a lot quicker than numpy.array for these
+    return influences, numpy.fromiter( weights, dtype = numpy.float64, count = len( weights ) ).reshape( -1, max( count, 1 ) )
+
+def set_skincluster_weights( skinCluster, weights ):
+    # Writes a whole ( vertices, influences ) array of weights in one go, the columns are in influence order
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    function, shape = get_skincluster_function( skinCluster )
+    weights = numpy.asarray( weights, dtype = numpy.float64 )
+
+    function.setWeights( shape, get_all_vertices( shape ), OpenMaya.MIntArray( list( range( weights.shape[1] ) ) ), OpenMaya.MDoubleArray( weights.ravel().tolist() ), False )
+
+def get_influenced_vertices( influences, skinClusters = None ):
+    # Returns { skincluster: { "shape", "influences", "vertices", "weights" } } for every skincluster with any of the influences
+    # vertices are the indices with weight on any of them and weights is ( vertices, influences ), in the order of "influences", which leaves out the ones the skincluster doesn't have
+    # Each skincluster's weights are read once and nothing is selected, so it's safe to use in the middle of anything
+    import numpy
+
+    wanted = []
+
+    for influence in influences:
+        if not get_short_name( influence ) in wanted:
+            wanted.append( get_short_name( influence ) )
+
+    result = {}
+
+    for skinCluster in ( get_skinclusters() if skinClusters == None else skinClusters ):
+        # Reading the weights is what's slow, so skinclusters without any of them are skipped first
+        present = set( [ get_short_name( influence ) for influence in cmds.skinCluster( skinCluster, query = True, influence = True ) or [] ] )
+
+        if not any( [ name in present for name in wanted ] ):
+            continue
+
+        names, weights = get_skincluster_weights( skinCluster )
+        columns = dict( ( get_short_name( names[index] ), index ) for index in range( len( names ) ) )
+        found = [ name for name in wanted if name in columns ]
+        weights = weights[:, [ columns[name] for name in found ]]
+        vertices = numpy.nonzero( numpy.any( weights > 0, axis = 1 ) )[0]
+
+        result[skinCluster] = {
+            "shape": ( cmds.skinCluster( skinCluster, query = True, geometry = True ) or [ None ] )[0],
+            "influences": found,
+            "vertices": vertices,
+            "weights": weights[vertices]
+        }
+
+    return result
+
+def get_weighted_influences( influences, skinClusters = None ):
+    # Returns { skincluster: set of the influences with any weight in it }, skinclusters where none of them have weight are left out
+    import numpy
+
+    result = {}
+    queries = get_influenced_vertices( influences, skinClusters )
+
+    for skinCluster in queries:
+        weighted = numpy.any( queries[skinCluster]["weights"] > 0, axis = 0 )
+
+        if numpy.any( weighted ):
+            result[skinCluster] = set( [ queries[skinCluster]["influences"][index] for index in numpy.nonzero( weighted )[0] ] )
+
+    return result
+
 def get_selection():
     return cmds.ls( selection = True )
 
@@ -349,7 +753,10 @@ def import_target_rig( file_name ):
 
     # Import the rig
     cmds.file( file_path, i = True )
-    remove_namespaces()
+    renames = remove_namespaces()
+
+    # Joints that clashed with the scene's got new names, the rig needs the ones it was made with
+    original_names = dict( ( get_short_name( renames[node] ), get_short_name( node ) ) for node in renames )
 
     # Delete the empty group that was created for meshes
     if cmds.objExists( os.path.splitext( file_name )[0] ):
@@ -365,6 +772,10 @@ def import_target_rig( file_name ):
     # Store joints with attributes
     joints_with_attributes = get_joints_with_attributes( joints )
 
+    for joint_with_attributes in joints_with_attributes:
+        joint_with_attributes["name"] = original_names.get( joint_with_attributes["name"], joint_with_attributes["name"] )
+        joint_with_attributes["parent"] = original_names.get( joint_with_attributes["parent"], joint_with_attributes["parent"] )
+
     # Delete after storing joints with attributes
     for group in get_groups():
         if group not in existing_groups:
@@ -373,6 +784,70 @@ def import_target_rig( file_name ):
 
     return joints_with_attributes
 
+def get_target_rig_cache( file_name ):
+    return get_targets_dir() + os.path.splitext( file_name )[0] + ".rig.json"
+
+def read_target_rig_cache( file_path, cache_path ):
+    # The cached joints if the rig hasn't changed since, otherwise None
+    # Doesn't need Maya, so it can be read in the background
+    if os.path.isfile( file_path ) and os.path.isfile( cache_path ):
+        try:
+            with open( cache_path, "r" ) as file:
+                cache = json.load( file )
+
+            if cache["mtime"] == os.path.getmtime( file_path ):
+                return cache["joints"]
+        except ( IOError, OSError, ValueError, KeyError ):
+            pass
+
+    return None
+
+def prefetch_target_rig( file_name ):
+    # Starts reading the target rig's cache so it's ready by the time get_target_rig wants it
+    target_rig_prefetches[file_name] = run_in_background( read_target_rig_cache, ( get_targets_dir() + file_name, get_target_rig_cache( file_name ) ) )
+
+def get_target_rig( file_name ):
+    # Importing the target rig is slow, so the joints are cached next to it until it changes
+    # These are also what CoDCharacterToolsOffline converts to
+    file_path = get_targets_dir() + file_name
+    cache_path = get_target_rig_cache( file_name )
+
+    # Only kept while the targets directory is watched, nothing would notice the rig changing otherwise
+    if file_name in target_rigs:
+        return target_rigs[file_name]
+
+    if file_name in target_rig_prefetches:
+        joints_with_attributes = wait_for( target_rig_prefetches.pop( file_name ) )
+    else:
+        joints_with_attributes = read_target_rig_cache( file_path, cache_path )
+
+    if joints_with_attributes == None:
+        joints_with_attributes = import_target_rig( file_name )
+
+        if joints_with_attributes != None:
+            # Not being able to write it just means we import again next time
+            try:
+                with open( cache_path, "w" ) as file:
+                    json.dump( { "source": file_name, "mtime": os.path.getmtime( file_path ), "joints": joints_with_attributes }, file, indent = 4 )
+            except ( IOError, OSError ):
+                pass
+
+    if joints_with_attributes != None and target_rig_files != None:
+        target_rigs[file_name] = joints_with_attributes
+
+    return joints_with_attributes
+
+def get_target_rig_files( extensions = ( ".ma", ".mb" ) ):
+    # Target rig file names, sorted, from what the watcher last saw or from the directory if it hasn't looked yet
+    if target_rig_files != None:
+        files = target_rig_files
+    elif os.path.isdir( get_targets_dir() ):
+        files = sorted( [ name for name in os.listdir( get_targets_dir() ) if os.path.isfile( get_targets_dir() + name ) ] )
+    else:
+        files = []
+
+    return [ name for name in files if name.endswith( extensions ) ]
+
 def any_node_exists( nodes ):
     for node in nodes:
         if cmds.objExists( node ):
@@ -401,6 +876,7 @@ def is_joint_in_rig( joints_with_attributes, joint ):
 
     return False
 
+@operation( "Mirror rotations" )
 def mirror_joint( joint_to_mirror ):
     # Make sure the joint exists
     if not cmds.objExists( joint_to_mirror ):
@@ -417,9 +893,100 @@ def mirror_joint( joint_to_mirror ):
             set_attribute( joint_with_attributes["name"], "rotateY", joint_with_attributes["rotateY"] )
             set_attribute( joint_with_attributes["name"], "rotateZ", joint_with_attributes["rotateZ"] )
 
-def lock_all_weights( enable = True ):
-    for joint in get_joints():
-        set_attribute( joint, "lockInfluenceWeights", enable )
+def redistribute_weights( weights, source, unlocked ):
+    # Moves the weights in column source onto the unlocked columns ( a boolean mask ), in proportion to what each vertex already has on them
+    # Vertices with nothing on them get it spread evenly, returns False if there's nowhere to put it
+    import numpy
+
+    if not numpy.any( unlocked ):
+        return False
+
+    rows = numpy.nonzero( weights[:, source] )[0]
+    moving = weights[rows, source]
+    weights[rows, source] = 0
+
+    share = weights[numpy.ix_( rows, unlocked )]
+    totals = share.sum( axis = 1 )
+    empty = totals <= 0
+    share[empty] = 1
+    totals[empty] = numpy.count_nonzero( unlocked )
+
+    weights[numpy.ix_( rows, unlocked )] += share * ( moving / totals )[:, None]
+
+    return True
+
+def remove_influences( steps ):
+    # steps are ( joint, joints its weights may go to ) in the order they're removed, None lets them go to any influence that's left like Maya's Delete does
+    # Any other influence counts as locked, this all happens to the weights in memory, so no lockInfluenceWeights attribute is touched
+    # Returns the joints that were removed from every skincluster they were in
+    import numpy
+
+    kept = set()
+
+    for skinCluster in get_skinclusters():
+        influences = [ get_short_name( influence ) for influence in cmds.skinCluster( skinCluster, query = True, influence = True ) or [] ]
+        present = [ step for step in steps if step[0] in influences ]
+
+        if len( present ) < 1:
+            continue
+
+        # Where the weights go has to be an influence, they're added without any weight
+        for joint, targets in present:
+            for target in targets or []:
+                if not target in influences and cmds.objExists( target ):
+                    cmds.skinCluster( skinCluster, edit = True, addInfluence = target, weight = 0 )
+                    influences.append( target )
+
+        names, weights = get_skincluster_weights( skinCluster )
+        columns = dict( ( get_short_name( names[index] ), index ) for index in range( len( names ) ) )
+        remaining = numpy.ones( len( names ), dtype = bool )
+
+        for joint, targets in present:
+            remaining[columns[joint]] = False
+
+            if targets == None:
+                unlocked = remaining.copy()
+            else:
+                unlocked = numpy.zeros( len( names ), dtype = bool )
+                unlocked[[ columns[target] for target in targets if target in columns ]] = True
+                unlocked &= remaining
+
+            if not redistribute_weights( weights, columns[joint], unlocked ):
+                remaining[columns[joint]] = True
+                kept.add( joint )
+
+        set_skincluster_weights( skinCluster, weights )
+
+        # There's no weight left on these, so removing them doesn't change the others
+        removed = [ names[index] for index in range( len( names ) ) if not remaining[index] ]
+
+        if len( removed ) > 0:
+            cmds.skinCluster( skinCluster, edit = True, removeInfluence = removed )
+
+    return [ step[0] for step in steps if not step[0] in kept ]
+
+def restore_locked_weights( skinCluster, before, unlocked ):
+    # Puts back the weights, from get_skincluster_weights before an edit, of every influence unlocked( name ) is False for
+    # The unlocked ones are scaled into what's left, so it's as if the others were locked without touching lockInfluenceWeights
+    import numpy
+
+    names, weights = get_skincluster_weights( skinCluster )
+    columns = dict( ( get_short_name( before[0][index] ), index ) for index in range( len( before[0] ) ) )
+    mask = numpy.array( [ bool( unlocked( get_short_name( name ) ) ) for name in names ] )
+
+    for index in numpy.nonzero( ~mask )[0]:
+        if get_short_name( names[index] ) in columns:
+            weights[:, index] = before[1][:, columns[get_short_name( names[index] )]]
+
+    left = numpy.maximum( 1 - weights[:, ~mask].sum( axis = 1 ), 0 )
+    totals = weights[:, mask].sum( axis = 1 )
+    rows = totals > 0
+    weights[numpy.ix_( rows, mask )] *= ( left[rows] / totals[rows] )[:, None]
+
+    set_skincluster_weights( skinCluster, weights )
+
+def get_depth( node ):
+    return cmds.ls( node, long = True )[0].count( "|" )
 
 def rotate_models():
     # Deselect anything that's already selected
@@ -448,21 +1015,24 @@ def semodel_unique_names():
 
         cmds.rename( mesh, "SEModelMesh_" + str( num ) )
 
-def set_cosmetic_parent( show_message = True ):
-    if not cmds.objExists( "head" ):
-        error( "\"head\" does not exist." )
+@operation( "Set cosmetic parent" )
+def set_cosmetic_parent( show_message = True, joint = "head" ):
+    if not cmds.objExists( joint ):
+        error( "\"" + joint + "\" does not exist." )
         return
     
     if not cmds.objExists( "XModelExporterInfo.Cosmeticbone" ):
+        import CoDMayaTools
         CoDMayaTools.ShowWindow( "xmodel" )
 
-    if cmds.getAttr( "XModelExporterInfo.Cosmeticbone", "head" ) != "head":
-        cmds.setAttr( "XModelExporterInfo.Cosmeticbone", "head", type = "string" )
+    if cmds.getAttr( "XModelExporterInfo.Cosmeticbone" ) != joint:
+        cmds.setAttr( "XModelExporterInfo.Cosmeticbone", joint, type = "string" )
 
         if show_message:
-            confirm_dialog( "\"head\" has now been set as the cosmetic parent." )
-    else:
-        error( "\"head\" is already the cosmetic parent." )
+            confirm_dialog( "\"" + joint + "\" has now been set as the cosmetic parent." )
+    elif show_message:
+        # Only worth telling someone who asked, converting again (or a second character) finds it already set
+        error( "\"" + joint + "\" is already the cosmetic parent." )
 
 def set_skincluster_attributes():
     for skinCluster in get_skinclusters():
@@ -471,11 +1041,75 @@ def set_skincluster_attributes():
         set_attribute( skinCluster, "maintainMaxInfluences", 1 )
         set_attribute( skinCluster, "maxInfluences", 15 )
 
+def get_orig_shape( mesh ):
+    # The shape a skincluster deforms, edits here flow through the skincluster without adding history
+    # Meshes that aren't skinned just have the one shape
+    shapes = cmds.listRelatives( mesh, shapes = True, fullPath = True ) or []
+
+    for shape in shapes:
+        if cmds.getAttr( shape + ".intermediateObject" ) and not cmds.listConnections( shape + ".inMesh", source = True, destination = False ):
+            return shape
+
+    for shape in shapes:
+        if not cmds.getAttr( shape + ".intermediateObject" ):
+            return shape
+
+    return None
+
 def set_vertex_colors():
-    for mesh in get_meshes():
-        cmds.select( mesh )
-        cmds.polyColorPerVertex( alpha = 1, rgb = ( 1, 1, 1 ), colorDisplayOption = True )
-        cmds.select( clear = True )
+    # White with full alpha on every vertex, written straight into the orig shape so no polyColorPerVertex nodes are made
+    import maya.api.OpenMaya as OpenMaya
+
+    for mesh in cmds.ls( get_meshes(), type = "transform" ):
+        shape = get_orig_shape( mesh )
+
+        if shape == None:
+            continue
+
+        selection = OpenMaya.MSelectionList()
+        selection.add( shape )
+        function = OpenMaya.MFnMesh( selection.getDagPath( 0 ) )
+
+        # The exporter only uses the first color set
+        color_sets = function.getColorSetNames()
+
+        if len( color_sets ) < 1:
+            color_sets = [ function.createColorSet( "colorSet1", False ) ]
+
+        for color_set in color_sets[1:]:
+            function.deleteColorSet( color_set )
+
+        function.setCurrentColorSetName( color_sets[0] )
+
+        count = function.numVertices
+        function.setVertexColors( OpenMaya.MColorArray( count, OpenMaya.MColor( ( 1.0, 1.0, 1.0, 1.0 ) ) ), OpenMaya.MIntArray( list( range( count ) ) ) )
+
+        for visible in cmds.listRelatives( mesh, shapes = True, noIntermediate = True, fullPath = True ) or []:
+            cmds.setAttr( visible + ".displayColors", 1 )
+
+def normalize_skin_weights( tolerance = 1e-6 ):
+    # Rows that don't add up to 1 are scaled so they do, only skinclusters that need it are written
+    import numpy
+
+    fixed = 0
+
+    for skinCluster in get_skinclusters():
+        influences, weights = get_skincluster_weights( skinCluster )
+        totals = weights.sum( axis = 1 )
+        rows = ( numpy.abs( totals - 1 ) > tolerance ) & ( totals > 0 )
+
+        if numpy.any( rows ):
+            weights[rows] /= totals[rows, None]
+            set_skincluster_weights( skinCluster, weights )
+            fixed += int( numpy.count_nonzero( rows ) )
+
+    return fixed
+
+def normalize_meshes():
+    # What the exporter expects from every mesh, vertex colors and weights that add up to 1
+    set_vertex_colors()
+
+    return normalize_skin_weights()
 
 def set_zero_rotations( nodes ):
     if len( nodes ) < 1:
@@ -487,6 +1121,7 @@ def set_zero_rotations( nodes ):
         set_attribute( node, "rotateY", 0 )
         set_attribute( node, "rotateZ", 0 )
 
+@operation( "Transfer weight" )
 def transfer_weight( source, target ):
     # Deselect anything that's already selected
     cmds.select( clear = True )
@@ -504,41 +1139,43 @@ def transfer_weight( source, target ):
         error( target + " doesn't exist!" )
         return
 
+    if len( get_weighted_influences( [ source ] ) ) < 1:
+        error( source + " doesn't have any weights to transfer!" )
+        return
+
     # Set skincluster attributes
     set_skincluster_attributes()
 
-    # Check we're in painting mode, if not switch to it.
-    if cmds.currentCtx() != "artAttrSkinContext":
-        mel.eval( "ArtPaintSkinWeightsTool" )
+    # Transfer weight, only the target can take the source's weights
+    remove_influences( [ ( source, [ target ] ) ] )
 
-    # Transfer weight
-    for mesh in get_meshes():
-        influences = cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True )
+@operation( "Select influenced vertices" )
+def select_influenced_vertices( influences, show_message = True ):
+    # Selects every vertex with weight on any of the influences, across all the meshes
+    for influence in influences:
+        if not cmds.objExists( influence ):
+            error( influence + " doesn't exist!" )
+            return
 
-        if source not in influences:
-            continue
+    queries = get_influenced_vertices( influences )
+    components = []
+    lines = []
 
-        # Add target to skincluster if it isn't already
-        if target not in influences:
-            # Lock all weights
-            lock_all_weights( True )
+    for skinCluster in sorted( queries ):
+        query = queries[skinCluster]
 
-            # Add target to skincluster
-            cmds.skinCluster( get_skincluster_for_mesh( mesh ), edit = True, addInfluence = target )
+        if len( query["vertices"] ) > 0:
+            components += get_component_ranges( query["shape"], query["vertices"] )
+            lines.append( get_short_name( query["shape"] ) + ": " + str( len( query["vertices"] ) ) + " vertices" )
 
-            # Unlock all weights
-            lock_all_weights( False )
+    if len( components ) < 1:
+        error( "None of the meshes have weight on " + ", ".join( influences ) + "." )
+        return
 
-        mel.eval( "changeSelectMode -object; select " + mesh )
-        mel.eval( "artSkinSelectInfluence artAttrSkinPaintCtx " + source )
-        mel.eval( "skinCluster -edit -selectInfluenceVerts " + source + " " + get_skincluster_for_mesh( mesh ) )
-        mel.eval( "skinPercent -transformMoveWeights " + source + " -transformMoveWeights " + target + " " + get_skincluster_for_mesh( mesh ) )
-        mel.eval( "skinCluster -e -ri " + source + " " + get_skincluster_for_mesh( mesh ) )
+    cmds.select( components, replace = True )
 
-    # Set tool back to select
-    cmds.setToolTo( "selectSuperContext" )
-    enable_x_ray( False )
-    cmds.select( clear = True )
+    if show_message:
+        confirm_dialog( "Selected the vertices weighted to " + ", ".join( influences ) + "\n\n" + "\n".join( lines ) )
 
 def merge_verts( mesh ):
     if mesh not in get_meshes():
@@ -562,50 +1199,36 @@ def merge_verts( mesh ):
 
         cmds.select( clear = True )
 
+@operation( "Delete non target joints" )
 def delete_non_target_joints():
     # Deletes any joint not in the target rig and transfers the weights to the closest parent
-    target_rig = import_target_rig( "fb_t8_male_and_female.mb" )
-    
-    # Joints to delete
-    joints_to_delete = []
-    
-    # Add the joints we want to delete to the array (non-t7-joints)
-    for joint in get_joints():
-        if not is_joint_in_rig( target_rig, joint ):
-            if joint not in joints_to_delete:
-                joints_to_delete.append( joint )
+    target_rig = get_target_rig( "fb_t8_male_and_female.mb" )
+    steps = []
 
-    # Loop them until they're done
-    while any_node_exists( joints_to_delete ):
-        for joint_to_delete in joints_to_delete:
-            if cmds.objExists( joint_to_delete ):
-                if cmds.listRelatives( joint_to_delete, allDescendents = True ) == None:
-                    parent = cmds.listRelatives( joint_to_delete, parent = True )[0]
+    # Deleting one leaf at a time would move the weights up one parent at a time, so they go straight to the closest parent that's kept
+    # Joints with target joints under them can't be deleted
+    for joint in scene_ls( type = "joint", long = True ):
+        if is_joint_in_rig( target_rig, get_short_name( joint ) ):
+            continue
 
-                    # Lock all weights
-                    lock_all_weights( True )
+        if any( [ is_joint_in_rig( target_rig, get_short_name( child ) ) for child in cmds.listRelatives( joint, allDescendents = True, type = "joint" ) or [] ] ):
+            continue
 
-                    # Make sure parent is also in the skincluster, if not then add it
-                    for mesh in get_meshes():
-                        influences = cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True )
+        parents = [ get_short_name( parent ) for parent in joint.split( "|" )[1:-1] ]
 
-                        for joint in influences:
-                            if joint == joint_to_delete:
-                                if parent not in influences:
-                                    cmds.skinCluster( get_skincluster_for_mesh( mesh ), edit = True, addInfluence = parent, weightDistribution = 1, smoothWeights = 0.5, smoothWeightsMaxIterations = 2 )
+        while len( parents ) > 0 and not is_joint_in_rig( target_rig, parents[-1] ):
+            parents.pop()
 
-                    # Unlock weights for joint and it's parent
-                    set_attribute( parent, "lockInfluenceWeights", False )
-                    set_attribute( joint_to_delete, "lockInfluenceWeights", False )
+        if len( parents ) > 0:
+            steps.append( ( get_short_name( joint ), [ parents[-1] ] ) )
 
-                    # Delete the joint
-                    mel.eval( "select " + joint_to_delete )
-                    mel.eval( "Delete" )
-                    cmds.select( clear = True )
+    remove_influences( steps )
 
-                    # Unlock all weights
-                    lock_all_weights( False )
+    # Deepest first, so nothing has already gone with its parent
+    for joint in sorted( [ step[0] for step in steps ], key = get_depth, reverse = True ):
+        cmds.delete( joint )
 
+@operation( "Rig combiner" )
 def rig_combiner( show_message = True ):
     # Deselect anything that's already selected
     cmds.select( clear = True )
@@ -684,8 +1307,8 @@ def rig_combiner( show_message = True ):
     # Delete unused nodes in hypershade
     mel.eval( "MLdeleteUnused" )
 
-    # Set vertex colors
-    #set_vertex_colors()
+    # Set vertex colors and normalize the weights
+    normalize_meshes()
 
     # Deselect anything that's already selected
     cmds.select( clear = True )
@@ -695,422 +1318,1518 @@ def rig_combiner( show_message = True ):
         print( "Combined SEModels." )
         confirm_dialog( "Combined SEModels." )
 
-def rig_converter( target_rig, rig_name ):
-    # Deselect anything that's already selected
-    cmds.select( clear = True )
+def get_mesh_materials( mesh ):
+    # The shading groups on the mesh, meshes with the same ones can be combined without changing how they look
+    engines = []
 
-    # Make sure the scene isn't empty
-    if len( get_joints() + get_meshes() ) < 1:
-        error( "No SEModels could be found!" )
-        return
+    for shape in cmds.listRelatives( mesh, shapes = True, noIntermediate = True, fullPath = True ) or []:
+        engines += cmds.listConnections( shape, type = "shadingEngine" ) or []
 
-    # Set skincluster attributes
-    set_skincluster_attributes()
+    return tuple( sorted( set( engines ) ) )
 
-    # Combine if the model is in parts and hasn't been combined
-    if len( cmds.ls( "Joints*" ) ) > 1:
-        rig_combiner( False )
-
-    # Joints to rename
-    rename_joints = {
-        "j_wristfronttwist1_le": "j_wristtwist_le",
-        "j_wristfronttwist1_ri": "j_wristtwist_ri",
-        "j_metaindex_le_1": "j_indexbase_le",
-        "j_metaindex_ri_1": "j_indexbase_ri",
-        "j_metaring_le_1": "j_ringbase_le",
-        "j_metaring_ri_1": "j_ringbase_ri",
-        "j_metapinky_le_1": "j_pinkybase_le",
-        "j_metapinky_ri_1": "j_pinkybase_ri"
-    }
+def get_mesh_counts( meshes ):
+    vertices = 0
+    faces = 0
 
-    # Rename joints
-    for joint in rename_joints:
-        if cmds.objExists( joint ):
-            cmds.rename( joint, rename_joints[joint] )
-            cmds.select( clear = True )
+    for mesh in meshes:
+        # Transforms without a poly shape get a message back instead of a number
+        count = cmds.polyEvaluate( mesh, vertex = True, face = True )
 
-    # Get rid of useless joints for viewhands
-    if "Viewhands" in rig_name:
-        if cmds.objExists( "j_clavicle_le" ) and cmds.objExists( "j_shoulder_le" ) and cmds.objExists( "j_clavicle_ri" ) and cmds.objExists( "j_shoulder_ri" ):
-            # Take them out of groups
-            cmds.select( clear = True )
-            cmds.parent( "j_shoulder_le", world = True )
+        if isinstance( count, dict ):
+            vertices += count["vertex"]
+            faces += count["face"]
 
-            cmds.select( clear = True )
-            cmds.parent( "j_shoulder_ri", world = True )
+    return vertices, faces
 
-            # Deleting like this using mel will transfer the weights, because sometimes we have weights on clavicle joints
-            cmds.select( clear = True )
-            cmds.select( "j_clavicle_le" )
-            mel.eval( "Delete" )
+def stack_skin_weights( skins ):
+    # skins is a list of ( influences, weights ) for meshes that are combined in that order
+    # Returns one influence list for all of them and their weights one after the other in its columns
+    import numpy
 
-            cmds.select( clear = True )
-            cmds.select( "j_clavicle_ri" )
-            mel.eval( "Delete" )
+    influences = []
 
-            # Get rid of everything else
-            cmds.select( clear = True )
-            for group in get_groups():
-                if "Joints" in group:
-                    cmds.delete( group )
+    for names, weights in skins:
+        for name in names:
+            if not name in influences:
+                influences.append( name )
 
-            # Create this again now and group because it's expected to be there
-            cmds.select( clear = True )
-            cmds.select( "j_shoulder_le", add = True )
-            cmds.select( "j_shoulder_ri", add = True )
-            cmds.group( name = "Joints" )
-            cmds.select( clear = True )
+    columns = dict( ( influences[index], index ) for index in range( len( influences ) ) )
+    stacked = numpy.zeros( ( sum( [ weights.shape[0] for names, weights in skins ] ), len( influences ) ) )
+    row = 0
 
-    # Source rig
-    source_rig = get_joints_with_attributes()
+    for names, weights in skins:
+        stacked[row:row + weights.shape[0], [ columns[name] for name in names ]] = weights
+        row += weights.shape[0]
 
-    # Move joints mode
-    enable_move_joints( True )
+    return influences, stacked
 
-    # Move all joints to world
-    for joint in get_joints():
-        cmds.parent( joint, world = True )
-        cmds.select( clear = True )
+def bind_mesh( mesh, influences, weights ):
+    # Skins mesh to influences and writes its ( vertices, influences ) weights in one go
+    skinCluster = cmds.skinCluster( influences, mesh, toSelectedBones = True, maximumInfluences = 15, obeyMaxInfluences = False, removeUnusedInfluence = False, normalizeWeights = 1 )[0]
 
-    # Create T7 joints which don't exist
-    for joint_with_attributes in target_rig:
-        if not cmds.objExists( joint_with_attributes["name"] ):
-            # We don't need all of the T7 face joints
-            if not joint_with_attributes["parent"] == "head":
-                cmds.joint( name = joint_with_attributes["name"] )
+    # The skincluster doesn't have to keep the influences in the order they were given
+    columns = dict( ( influences[index], index ) for index in range( len( influences ) ) )
+    order = [ columns[get_short_name( influence )] for influence in cmds.skinCluster( skinCluster, query = True, influence = True ) ]
 
-        cmds.select( clear = True )
+    set_skincluster_weights( skinCluster, weights[:, order] )
 
-    # Parent target joints
-    for joint_with_attributes in target_rig:
-        if cmds.objExists( joint_with_attributes["name"] ):
-            if "Joints" not in joint_with_attributes["parent"]:
-                cmds.parent( joint_with_attributes["name"], joint_with_attributes["parent"] )
-                cmds.select( clear = True )
+    return skinCluster
 
-    # Set translations, rotations for target joints
-    for joint_with_attributes in target_rig:
-        if cmds.objExists( joint_with_attributes["name"] ):
-            set_attribute( joint_with_attributes["name"], "translateX", joint_with_attributes["translateX"] )
-            set_attribute( joint_with_attributes["name"], "translateY", joint_with_attributes["translateY"] )
-            set_attribute( joint_with_attributes["name"], "translateZ", joint_with_attributes["translateZ"] )
-            set_attribute( joint_with_attributes["name"], "rotateX", joint_with_attributes["rotateX"] )
-            set_attribute( joint_with_attributes["name"], "rotateY", joint_with_attributes["rotateY"] )
-            set_attribute( joint_with_attributes["name"], "rotateZ", joint_with_attributes["rotateZ"] )
-            set_attribute( joint_with_attributes["name"], "jointOrientX", joint_with_attributes["jointOrientX"] )
-            set_attribute( joint_with_attributes["name"], "jointOrientY", joint_with_attributes["jointOrientY"] )
-            set_attribute( joint_with_attributes["name"], "jointOrientZ", joint_with_attributes["jointOrientZ"] )
+@operation( "Consolidate meshes" )
+def consolidate_meshes( show_message = True ):
+    # Combines every mesh that uses the same material into one skinned mesh, each one is a draw call in game
+    # The weights are read before combining and written back in one go, the combined vertices are in the same order
+    if len( get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
+        return
 
-    # Parent source joints
-    for joint_with_attributes in source_rig:
-        for joint in get_joints():
-            if joint_with_attributes["name"] == joint:
-                if cmds.listRelatives( joint, parent = True ) == None:
-                    if "Joints" not in joint_with_attributes["parent"]:
-                        # For fullbody, the head joints need to be under "head" instead of "j_head"
-                        if "Fullbody" in rig_name:
-                            if joint_with_attributes["parent"] == "j_head":
-                                joint_with_attributes["parent"] = "head"
-
-                        # Parent them
-                        if cmds.objExists( joint_with_attributes["parent"] ):
-                            cmds.parent( joint_with_attributes["name"], joint_with_attributes["parent"] )
-                            cmds.select( clear = True )
-
-    # Move eyes back to source positions
-    for joint_with_attributes in source_rig:
-        if "j_eyeball" in joint_with_attributes["name"]:
-            if not cmds.listRelatives( joint_with_attributes["name"], parent = True ) == None:
-                parent = cmds.listRelatives( joint_with_attributes["name"], parent = True )[0]
-
-                cmds.parent( joint_with_attributes["name"], world = True )
-                cmds.move( joint_with_attributes["translateXWorld"], joint_with_attributes["translateYWorld"], joint_with_attributes["translateZWorld"] )
-                cmds.parent( joint_with_attributes["name"], parent )
-                cmds.select( clear = True )
+    # The meshes are combined as they're deformed, so they need to be in the bind pose
+    if len( cmds.ls( "*SENotes*" ) ) > 0:
+        error( "You have an animation in the scene,\n\nReset scene first." )
+        return
 
-    # Array for useless joints that we don't need to keep
-    useless = []
+    meshes = cmds.ls( get_meshes(), type = "transform" )
+    before = get_mesh_counts( meshes )
+    groups = {}
+    skipped = []
 
-    # Get rid of useless non-t7 joints with no weights
-    for joint in get_joints():
-        if cmds.listRelatives( joint, allDescendents = True ) == None:
-            if not is_joint_in_rig( target_rig, joint ):
-                if not is_in_a_skincluster( joint ):
-                    if joint not in useless:
-                        useless.append( joint )
-
-    # Delete them
-    if len( useless ) > 0:
-        for joint in useless:
-            if cmds.objExists( joint ):
-                cmds.delete( joint )
-
-    # Move joints mode
-    enable_move_joints( False )
-
-    # Zero all rotations
-    set_zero_rotations( get_joints() )
-
-    # Put them back in group
-    if "Viewhands" in rig_name:
-        set_attribute( "tag_view", "translateX", 0 )
-        set_attribute( "tag_view", "translateY", 0 )
-        set_attribute( "tag_view", "translateZ", 0 )
-
-        set_attribute( "tag_ads", "translateX", 0 )
-        set_attribute( "tag_ads", "translateY", 0 )
-        set_attribute( "tag_ads", "translateZ", 0 )
-
-        set_attribute( "tag_torso", "translateX", 0 )
-        set_attribute( "tag_torso", "translateY", 0 )
-        set_attribute( "tag_torso", "translateZ", 0 )
-
-        set_attribute( "j_shoulder_le", "translateX", -2.652 )
-        set_attribute( "j_shoulder_le", "translateY", 20.266 )
-        set_attribute( "j_shoulder_le", "translateZ", -10.853 )
-
-        set_attribute( "j_shoulder_ri", "translateX", -2.652 )
-        set_attribute( "j_shoulder_ri", "translateY", -20.266 )
-        set_attribute( "j_shoulder_ri", "translateZ", -10.853 )
-
-        set_attribute( "tag_weapon_left", "translateX", 35.329 )
-        set_attribute( "tag_weapon_left", "translateY", 45.914 )
-        set_attribute( "tag_weapon_left", "translateZ", -44.023 )
-        set_attribute( "tag_weapon_left", "jointOrientX", 41.248 )
-        set_attribute( "tag_weapon_left", "jointOrientY", 23.941 )
-        set_attribute( "tag_weapon_left", "jointOrientZ", 20.443 )
-
-        set_attribute( "tag_weapon_right", "translateX", 35.240 )
-        set_attribute( "tag_weapon_right", "translateY", -45.670 )
-        set_attribute( "tag_weapon_right", "translateZ", -44.124 )
-        set_attribute( "tag_weapon_right", "jointOrientX", -41.887 )
-        set_attribute( "tag_weapon_right", "jointOrientY", 24.888 )
-        set_attribute( "tag_weapon_right", "jointOrientZ", -21.812 )
-
-        cmds.parent( "tag_view", "Joints" )
-    elif "Fullbody" in rig_name:
-        cmds.parent( "tag_origin", "Joints" )
-        set_cosmetic_parent( False )
+    for mesh in meshes:
+        if get_skincluster_for_mesh( mesh ):
+            groups.setdefault( get_mesh_materials( mesh ), [] ).append( mesh )
+        else:
+            skipped.append( mesh )
 
-    # Deselect anything that's already selected
-    cmds.select( clear = True )
+    for material in sorted( groups ):
+        group = groups[material]
 
-    # Joints we're going to delete, need to be handled differently because these have weights
-    joints_to_delete = []
+        if len( group ) < 2:
+            continue
 
-    # Add joints that we need to get rid of that are still in a skincluster to array
-    if cmds.objExists( "j_wrist_le" ) and cmds.objExists( "j_wrist_ri" ):
-        for joint in get_joints():
-            if cmds.objExists( joint ):
-                if not is_joint_in_rig( target_rig, joint ):
-                    if joint not in joints_to_delete:
-                        # For viewhands, get rid of everything that isn't a t7 joint
-                        if "Viewhands" in rig_name:
-                            joints_to_delete.append( joint )
-                        # For fullbody get rid of anything under wrist, as some tags are used on the body for accessories and if we transfer those weights it might offset them
-                        elif "Fullbody" in rig_name:
-                            if joint in cmds.listRelatives( "j_wrist_le", allDescendents = True ) or joint in cmds.listRelatives( "j_wrist_ri", allDescendents = True ):
-                                joints_to_delete.append( joint )
-
-    # Delete them
-    if len( joints_to_delete ) > 0:
-        # Keep doing this until none of them are influences
-        while is_in_a_skincluster( joints_to_delete ):
-            for joint_to_delete in joints_to_delete:
-                if cmds.objExists( joint_to_delete ):
-                    if cmds.listRelatives( joint_to_delete, allDescendents = True ) == None:
-                        parent = cmds.listRelatives( joint_to_delete, parent = True )[0]
-
-                        if "j_wrist_" in parent:
-                            # Lock all weights
-                            lock_all_weights( True )
-
-                            set_attribute( joint_to_delete, "lockInfluenceWeights", 0 )
-                            set_attribute( parent, "lockInfluenceWeights", 0 )
-
-                        cmds.select( joint_to_delete )
-                        mel.eval( "Delete" )
-                        cmds.select( clear = True )
+        skins = []
 
-                        if "j_wrist_" in parent:
-                            # Unlock all weights
-                            lock_all_weights( False )
+        for mesh in group:
+            influences, weights = get_skincluster_weights( get_skincluster_for_mesh( mesh ) )
+            skins.append( ( [ get_short_name( influence ) for influence in influences ], weights ) )
 
-    # Deselect anything that's already selected
-    cmds.select( clear = True )
+        influences, weights = stack_skin_weights( skins )
+        parent = cmds.listRelatives( group[0], parent = True, fullPath = True )
 
-    # Delete leftovers
-    for joint_to_delete in joints_to_delete:
-        if cmds.objExists( joint_to_delete ):
-            cmds.delete( joint_to_delete )
+        combined = cmds.polyUnite( group, constructionHistory = False, mergeUVSets = 1 )[0]
 
-    # Done
-    print( "Converted." )
-    confirm_dialog( "Converted." )
+        # Checked before the originals go, the operation is undone so earlier groups are put back too
+        if cmds.polyEvaluate( combined, vertex = True ) != weights.shape[0]:
+            raise OperationError( "Combining " + ", ".join( group ) + " changed the vertex count, the weights can't be carried over." )
 
-def add_wristtwist_influences():
-    # Make sure the scene isn't empty
-    if len( get_joints() + get_meshes() ) < 1:
-        error( "No SEModels could be found!" )
-        return
-    
-    # Make sure no animation is in the scene
-    if len( cmds.ls( "*SENotes*" ) ) > 0:
-        error( "You have an animation in the scene,\n\nReset scene first." )
-        return
+        cmds.delete( [ mesh for mesh in group if cmds.objExists( mesh ) ] )
+        combined = cmds.rename( combined, group[0] )
 
-    suffixes = ["le", "ri"]
+        if parent != None:
+            combined = cmds.parent( combined, parent[0] )[0]
 
-    # Make sure wristtwists exist
-    for suffix in suffixes:
-        for index in range( 1, 7 ):
-            if not cmds.objExists( "j_wristtwist" + str( index ) + "_" + suffix ):
-                error( "Can't find wristtwists\n\nDid you forget to convert first?\n\nOperation cancelled..." )
-                return
+        bind_mesh( combined, influences, weights )
 
-            # Make sure they're not already attached
-            if is_in_a_skincluster( "j_wristtwist" + str( index ) + "_" + suffix ):
-                error( "The wristtwists are already attached to a skincluster!\n\nOperation cancelled..." )
-                return
+    after = get_mesh_counts( cmds.ls( get_meshes(), type = "transform" ) )
+    message = "Meshes: %d -> %d\nVertices: %d -> %d\nFaces: %d -> %d" % ( len( meshes ), len( cmds.ls( get_meshes(), type = "transform" ) ), before[0], after[0], before[1], after[1] )
 
-    # Set skincluster attributes
-    set_skincluster_attributes()
+    if len( skipped ) > 0:
+        message += "\n\nNot skinned, left alone: " + ", ".join( skipped )
 
-    # Lock weights for joints that we don't want to be affected by these new influences
-    for joint in get_joints():
-        if "shoulder" not in joint:
-            if "elbow" not in joint:
-                if "wristtwist" not in joint:
-                    if "wrist" not in joint:
-                        set_attribute( joint, "lockInfluenceWeights", 1 )
+    print( message )
 
-    # Add influences for the wristtwists
-    for suffix in suffixes:
-        for mesh in get_meshes():
-            for index in range( 1, 7 ):
-                # Make sure skincluster is suitable for this operation
-                influences = cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True )
+    if show_message:
+        confirm_dialog( message )
 
-                if ( "j_wristtwist_" + suffix ) in influences:
-                    # Don't add the influence if there's fingers in this skincluster
-                    if ( "j_thumb_" + suffix + "_1" ) in influences or ( "j_index_" + suffix + "_1" ) in influences or ( "j_mid_" + suffix + "_1" ) in influences or ( "j_ring_" + suffix + "_1" ) in influences or ( "j_pinky_" + suffix + "_1" ) in influences:
-                        continue
+def partition_faces( counts, vertices, weights, budget ):
+    # counts and vertices are the faces like MFnMesh.getVertices returns them, weights is ( vertices, influences )
+    # Returns a list of ( faces, influences ) index arrays, none of them using more than budget influences, or None if a single face does
+    import numpy
 
-                    cmds.skinCluster( get_skincluster_for_mesh( mesh ), edit = True, addInfluence = "j_wristtwist" + str( index ) + "_" + suffix, weightDistribution = 1, smoothWeights = 0.5, smoothWeightsMaxIterations = 2 )
+    face_ids = numpy.repeat( numpy.arange( len( counts ) ), counts )
+    influence_count = weights.shape[1]
 
-    # Unlock all weights
-    for joint in get_joints():
-        set_attribute( joint, "lockInfluenceWeights", 0 )
+    # Every face vertex's weighted influences, nonzero gives them sorted by vertex
+    weighted_vertices, weighted_influences = numpy.nonzero( weights > 0 )
+    per_vertex = numpy.bincount( weighted_vertices, minlength = weights.shape[0] )
+    offsets = numpy.cumsum( per_vertex ) - per_vertex
+    repeats = per_vertex[vertices]
+    within = numpy.arange( repeats.sum() ) - numpy.repeat( numpy.cumsum( repeats ) - repeats, repeats )
+    pairs = numpy.sort( numpy.repeat( face_ids, repeats ) * influence_count + weighted_influences[numpy.repeat( offsets[vertices], repeats ) + within] )
 
-    # Done
-    confirm_dialog( "Added influences" )
+    # Vertices of the same face share most of their influences, only keep each one once
+    pairs = pairs[numpy.concatenate( [ [ True ], pairs[1:] != pairs[:-1] ] )]
+    pair_faces = pairs // influence_count
+    pair_influences = pairs % influence_count
 
-    cmds.select( clear = True )
+    # Faces with the same influences go together, each face's sorted influences padded with -1 to a row are compared exactly
+    per_face = numpy.bincount( pair_faces, minlength = len( counts ) )
+    starts = numpy.cumsum( per_face ) - per_face
+    rows = numpy.full( ( len( counts ), max( int( per_face.max() ) if len( per_face ) > 0 else 0, 1 ) ), -1, dtype = numpy.int32 )
+    rows[pair_faces, numpy.arange( len( pairs ) ) - starts[pair_faces]] = pair_influences
 
-def edit_wristtwist_influences():
-    # Make sure the scene isn't empty
-    if len( get_joints() + get_meshes() ) < 1:
-        error( "No SEModels could be found!" )
-        return
-    
-    # Make sure no animation is in the scene
-    if len( cmds.ls( "*SENotes*" ) ) > 0:
-        error( "You have an animation in the scene,\n\nReset scene first." )
+    # Sorting the rows puts the same ones next to each other, a lot quicker than numpy.unique with an axis
+    order = numpy.lexsort( rows.T[::-1] )
+    sorted_rows = rows[order]
+    new = numpy.concatenate( [ [ True ], numpy.any( sorted_rows[1:] != sorted_rows[:-1], axis = 1 ) ] )
+    groups = numpy.empty( len( counts ), dtype = numpy.int64 )
+    groups[order] = numpy.cumsum( new ) - 1
+
+    sets = [ frozenset( row ).difference( ( -1, ) ) for row in sorted_rows[new].tolist() ]
+
+    if max( [ len( influences ) for influences in sets ] ) > budget:
+        return None
+
+    # Greedy, each group goes in the piece it adds the fewest influences to
+    # Going through them in influence order keeps neighbouring bones, and so neighbouring faces, in the same piece
+    pieces = []
+    piece_of_group = numpy.zeros( len( sets ), dtype = numpy.int64 )
+
+    for group in sorted( range( len( sets ) ), key = lambda group: ( min( sets[group] ) if len( sets[group] ) > 0 else -1, -len( sets[group] ) ) ):
+        best = None
+
+        for index in range( len( pieces ) ):
+            added = len( sets[group] - pieces[index] )
+
+            if len( pieces[index] ) + added <= budget and ( best == None or added < best[1] ):
+                best = ( index, added )
+
+        if best == None:
+            pieces.append( set() )
+            best = ( len( pieces ) - 1, 0 )
+
+        pieces[best[0]] |= sets[group]
+        piece_of_group[group] = best[0]
+
+    piece_of_face = piece_of_group[groups]
+
+    return [ ( numpy.nonzero( piece_of_face == index )[0], numpy.array( sorted( pieces[index] ), dtype = numpy.int64 ) ) for index in range( len( pieces ) ) ]
+
+@operation( "Split surfaces" )
+def split_surfaces( budget = None, show_message = True ):
+    # Splits every mesh that uses more bones than one surface can have into pieces that don't, each piece only bound to the bones it uses
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    if budget == None:
+        budget = surface_bone_budget
+
+    if len( get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
+        return
+
+    # The pieces are duplicated as they're deformed, so they need to be in the bind pose
+    if len( cmds.ls( "*SENotes*" ) ) > 0:
+        error( "You have an animation in the scene,\n\nReset scene first." )
+        return
+
+    lines = []
+
+    for mesh in cmds.ls( get_meshes(), type = "transform" ):
+        skinCluster = get_skincluster_for_mesh( mesh )
+
+        if not skinCluster:
+            continue
+
+        influences, weights = get_skincluster_weights( skinCluster )
+        used = numpy.count_nonzero( numpy.any( weights > 0, axis = 0 ) )
+
+        if used <= budget:
+            continue
+
+        function, shape = get_skincluster_function( skinCluster )
+        counts, vertices = OpenMaya.MFnMesh( shape ).getVertices()
+        counts = numpy.array( counts, dtype = numpy.int64 )
+        vertices = numpy.array( vertices, dtype = numpy.int64 )
+
+        pieces = partition_faces( counts, vertices, weights, budget )
+
+        # Meshes before this one may already be split, raising undoes the whole operation
+        if pieces == None:
+            raise OperationError( mesh + " has a face using more than " + str( budget ) + " bones, it can't be split under that." )
+
+        names = [ get_short_name( influence ) for influence in influences ]
+        face_ids = numpy.repeat( numpy.arange( len( counts ) ), counts )
+        sizes = []
+
+        for index, ( faces, columns ) in enumerate( pieces ):
+            piece = cmds.duplicate( mesh, name = get_short_name( mesh ) + "_" + str( index + 1 ) )[0]
+            cmds.delete( piece, constructionHistory = True )
+
+            for leftover in cmds.listRelatives( piece, shapes = True, fullPath = True ) or []:
+                if cmds.getAttr( leftover + ".intermediateObject" ):
+                    cmds.delete( leftover )
+
+            keep = numpy.zeros( len( counts ), dtype = bool )
+            keep[faces] = True
+
+            if not numpy.all( keep ):
+                cmds.delete( get_component_ranges( piece, numpy.nonzero( ~keep )[0], "f" ) )
+
+            # Deleting faces drops the vertices nothing uses anymore and keeps the rest in order
+            piece_vertices = numpy.unique( vertices[keep[face_ids]] )
+
+            if cmds.polyEvaluate( piece, vertex = True ) != len( piece_vertices ):
+                raise OperationError( "Splitting " + mesh + " changed its vertices, the weights can't be carried over." )
+
+            bind_mesh( piece, [ names[column] for column in columns ], weights[numpy.ix_( piece_vertices, columns )] )
+            sizes.append( "%d bones, %d faces" % ( len( columns ), len( faces ) ) )
+
+        cmds.delete( mesh )
+        lines.append( "%s: %d bones -> %d surfaces (%s)" % ( get_short_name( mesh ), used, len( pieces ), "; ".join( sizes ) ) )
+
+    if len( lines ) < 1:
+        message = "Every mesh uses " + str( budget ) + " bones or fewer."
+    else:
+        message = "\n".join( lines )
+
+    print( message )
+
+    if show_message:
+        confirm_dialog( message )
+
+def get_part_tables():
+    # A joint table for every "Joints" group, so every part before they're combined, with the part's root joints
+    import CoDCharacterToolsDiff
+
+    parts = []
+
+    for group in get_groups():
+        if "Joints" in group and cmds.objExists( group ):
+            joints = cmds.listRelatives( group, allDescendents = True, type = "joint", fullPath = True ) or []
+
+            if len( joints ) < 1:
+                continue
+
+            parents = [ get_short_name( joint.rsplit( "|", 1 )[0] ) for joint in joints ]
+            matrices = [ cmds.xform( joint, query = True, worldSpace = True, matrix = True ) for joint in joints ]
+            table = CoDCharacterToolsDiff.create_table( [ get_short_name( joint ) for joint in joints ], parents, matrices )
+
+            parts.append( ( group, cmds.listRelatives( group, children = True, type = "joint", fullPath = True ) or [], table ) )
+
+    return parts
+
+def get_part_alignments( target_rig ):
+    # How every part lines up with the target rig, see CoDCharacterToolsDiff.get_similarity_transforms
+    import CoDCharacterToolsDiff
+
+    parts = get_part_tables()
+    alignments = CoDCharacterToolsDiff.get_similarity_transforms( [ part[2] for part in parts ], CoDCharacterToolsDiff.table_from_joints( target_rig ) )
+
+    return parts, alignments
+
+def get_alignment_warnings( target_rig ):
+    import CoDCharacterToolsDiff
+
+    warnings = []
+    parts, alignments = get_part_alignments( target_rig )
+
+    for part, alignment in zip( parts, alignments ):
+        if alignment != None:
+            for problem in CoDCharacterToolsDiff.get_alignment_problems( alignment ):
+                warnings.append( part[0] + ": " + problem )
+
+    return warnings
+
+@operation( "Align parts" )
+def align_parts( file_name, show_message = True ):
+    # Turns, scales and moves every part that was ripped with a different up axis or scale so its joints line up with the target rig
+    # Parts that are already close are left alone, the fit is reported either way
+    import numpy
+    import CoDCharacterToolsDiff
+
+    if len( get_joints() ) < 1:
+        error( "No SEModels could be found!" )
+        return
+
+    target_rig = get_target_rig( file_name )
+
+    if target_rig == None:
+        return
+
+    parts, alignments = get_part_alignments( target_rig )
+    aligned = []
+    matrices = []
+
+    for ( group, roots, table ), alignment in zip( parts, alignments ):
+        if alignment == None:
+            continue
+
+        if alignment["angle"] <= CoDCharacterToolsDiff.alignment_angle_tolerance and abs( alignment["scale"] - 1 ) <= CoDCharacterToolsDiff.alignment_scale_tolerance:
+            continue
+
+        # Row vector like Maya, the roots' world matrices followed by the fit
+        change = numpy.identity( 4 )
+        change[:3, :3] = alignment["scale"] * alignment["rotation"]
+        change[3, :3] = alignment["translation"]
+
+        for root in roots:
+            matrices.append( ( root, numpy.array( cmds.xform( root, query = True, worldSpace = True, matrix = True ) ).reshape( 4, 4 ).dot( change ) ) )
+
+        aligned.append( group )
+
+    # Worked out first and set together, so moving one root can't change what the next one gets
+    for root, matrix in matrices:
+        cmds.xform( root, worldSpace = True, matrix = matrix.ravel().tolist() )
+
+    message = CoDCharacterToolsDiff.format_alignment_report( [ part[0] for part in parts ], alignments )
+
+    if len( aligned ) > 0:
+        message += "\n\nAligned " + ", ".join( aligned ) + "."
+    else:
+        message += "\n\nNothing needed aligning."
+
+    print( message )
+
+    if show_message:
+        confirm_dialog( message )
+
+    return alignments
+
+def get_profile( file_name ):
+    # Conversion rules for a target rig, see CoDCharacterToolsProfile
+    import CoDCharacterToolsProfile
+
+    try:
+        return CoDCharacterToolsProfile.load_profile( get_targets_dir() + file_name )
+    except CoDCharacterToolsProfile.ProfileError as exception:
+        error( str( exception ) )
+        return None
+
+def isolate_joints( keep, folds ):
+    # Only the joints under keep are left, in a new "Joints" group
+    cmds.select( clear = True )
+
+    # Take them out of groups
+    for joint in keep:
+        cmds.parent( joint, world = True )
+        cmds.select( clear = True )
+
+    # Deleting like this using mel will transfer the weights, because sometimes we have weights on clavicle joints
+    for joint in sorted( folds ):
+        cmds.select( joint )
+        mel.eval( "Delete" )
+        cmds.select( clear = True )
+
+    # Get rid of everything else
+    for group in get_groups():
+        if "Joints" in group:
+            cmds.delete( group )
+
+    # Create this again now and group because it's expected to be there
+    cmds.select( keep )
+    cmds.group( name = "Joints" )
+    cmds.select( clear = True )
+
+def remove_weighted_joints( joints ):
+    # Joints that still have weights, removed deepest first
+    # Deleting them one leaf at a time moved the weights up a parent at a time, so they go straight to the closest parent that's kept
+    joints = sorted( [ joint for joint in joints if cmds.objExists( joint ) ], key = get_depth, reverse = True )
+    removed = set( [ get_short_name( joint ) for joint in joints ] )
+    steps = []
+
+    for joint in joints:
+        path = cmds.ls( joint, long = True )[0].split( "|" )
+        ancestors = cmds.ls( [ "|".join( path[:index] ) for index in range( 2, len( path ) ) ], type = "joint", long = True )
+        parents = [ get_short_name( parent ) for parent in sorted( ancestors, key = lambda parent: parent.count( "|" ) ) ]
+
+        while len( parents ) > 0 and parents[-1] in removed:
+            parents.pop()
+
+        # Only a root has nowhere to go, then it's spread over what's left like Maya's Delete does
+        steps.append( ( get_short_name( joint ), [ parents[-1] ] if len( parents ) > 0 else None ) )
+
+    remove_influences( steps )
+
+    # Delete them, deepest first so nothing has already gone with its parent
+    for joint in joints:
+        if cmds.objExists( joint ):
+            cmds.delete( joint )
+
+def run_conversion_plan( plan ):
+    # Does the steps CoDCharacterToolsProfile.compile_plan worked out
+    for step in plan:
+        cmds.select( clear = True )
+
+        if step[0] == "rename":
+            cmds.rename( step[1], step[2] )
+        elif step[0] == "isolate":
+            isolate_joints( step[1], step[2] )
+        elif step[0] == "move_joints":
+            enable_move_joints( step[1] )
+        elif step[0] == "unparent":
+            cmds.parent( step[1], world = True )
+        elif step[0] == "create":
+            for joint in step[1]:
+                cmds.joint( name = joint )
+                cmds.select( clear = True )
+        elif step[0] == "parent":
+            cmds.parent( step[1], step[2] )
+        elif step[0] in ( "set", "pose" ):
+            cmds.setAttr( step[1] + "." + step[2], *step[3] )
+        elif step[0] == "move":
+            # Out of the hierarchy to move it, so nothing under it moves too
+            parent = cmds.listRelatives( step[1], parent = True )[0]
+
+            cmds.parent( step[1], world = True )
+            cmds.move( step[2][0], step[2][1], step[2][2], step[1] )
+            cmds.parent( step[1], parent )
+        elif step[0] == "delete":
+            cmds.delete( step[1] )
+        elif step[0] == "cosmetic_parent":
+            set_cosmetic_parent( False, step[1] )
+        elif step[0] == "remove_weighted":
+            remove_weighted_joints( step[1] )
+
+    cmds.select( clear = True )
+
+@operation( "Rig converter" )
+def rig_converter( file_name, show_message = True, dry_run = False ):
+    # Converts to the target rig following its profile, with dry_run the steps are only shown
+    import CoDCharacterToolsProfile
+
+    # Deselect anything that's already selected
+    cmds.select( clear = True )
+
+    # Make sure the scene isn't empty
+    if len( get_joints() + get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
+        return
+
+    target_rig = get_target_rig( file_name )
+    profile = get_profile( file_name )
+
+    if target_rig == None or profile == None:
+        return
+
+    if dry_run:
+        # Combining renames, merges and reparents joints, a plan made from the separate parts wouldn't match what runs
+        if len( cmds.ls( "Joints*" ) ) > 1:
+            error( "The parts haven't been combined yet, run \"Rig combiner\" before a dry run." )
+            return
+    else:
+        # Set skincluster attributes
+        set_skincluster_attributes()
+
+        # Combine if the model is in parts and hasn't been combined
+        if len( cmds.ls( "Joints*" ) ) > 1:
+            rig_combiner( False )
+
+    # The joints are looked at once, the plan only holds what needs changing
+    influences = set()
+
+    for skinCluster in get_skinclusters():
+        influences.update( [ get_short_name( influence ) for influence in cmds.skinCluster( skinCluster, query = True, influence = True ) ] )
+
+    plan = CoDCharacterToolsProfile.compile_plan( profile, get_joints_with_attributes(), target_rig, influences )
+
+    # Parts ripped with a different up axis or scale would convert wrong, this only warns, "Align parts to" fixes them
+    warnings = get_alignment_warnings( target_rig )
+    warning = ""
+
+    if len( warnings ) > 0:
+        warning = "\n\nThese parts don't line up with the target rig, try \"Align parts to\" first:\n" + "\n".join( warnings )
+        print( warning.strip() )
+
+    if dry_run:
+        counts = CoDCharacterToolsProfile.get_plan_summary( plan )
+        message = "Converting to " + get_rig_name( file_name ) + " would:\n\n" + "\n".join( [ "%s: %d" % ( step, counts[step] ) for step in sorted( counts ) ] )
+
+        message += warning
+
+        print( CoDCharacterToolsProfile.format_plan( plan ) )
+
+        if show_message:
+            confirm_dialog( message + "\n\nEvery step is listed in the script editor." )
+
+        return plan
+
+    run_conversion_plan( plan )
+
+    # Done
+    if show_message:
+        print( "Converted." )
+        confirm_dialog( "Converted." + warning )
+
+@operation( "Add wristtwists influences" )
+def add_wristtwist_influences( show_message = True ):
+    # Make sure the scene isn't empty
+    if len( get_joints() + get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
+        return
+    
+    # Make sure no animation is in the scene
+    if len( cmds.ls( "*SENotes*" ) ) > 0:
+        error( "You have an animation in the scene,\n\nReset scene first." )
+        return
+
+    suffixes = ["le", "ri"]
+
+    # Make sure wristtwists exist
+    for suffix in suffixes:
+        for index in range( 1, 7 ):
+            if not cmds.objExists( "j_wristtwist" + str( index ) + "_" + suffix ):
+                error( "Can't find wristtwists\n\nDid you forget to convert first?\n\nOperation cancelled..." )
+                return
+
+            # Make sure they're not already attached
+            if is_in_a_skincluster( "j_wristtwist" + str( index ) + "_" + suffix ):
+                error( "The wristtwists are already attached to a skincluster!\n\nOperation cancelled..." )
+                return
+
+    # Set skincluster attributes
+    set_skincluster_attributes()
+
+    # Which skinclusters have weight on the fingers, read before any influences are added
+    fingers = get_weighted_influences( [ "j_" + finger + "_" + suffix + "_1" for suffix in suffixes for finger in ( "thumb", "index", "mid", "ring", "pinky" ) ] )
+
+    # Add influences for the wristtwists
+    for suffix in suffixes:
+        for mesh in get_meshes():
+            # Make sure skincluster is suitable for this operation
+            skinCluster = get_skincluster_for_mesh( mesh )
+            influences = cmds.skinCluster( skinCluster, query = True, influence = True )
+
+            if not ( "j_wristtwist_" + suffix ) in influences:
+                continue
+
+            # Don't add the influences if there's weight on the fingers in this skincluster
+            if any( [ finger.endswith( "_" + suffix + "_1" ) for finger in fingers.get( skinCluster, [] ) ] ):
+                continue
+
+            before = get_skincluster_weights( skinCluster )
+
+            for index in range( 1, 7 ):
+                cmds.skinCluster( skinCluster, edit = True, addInfluence = "j_wristtwist" + str( index ) + "_" + suffix, weightDistribution = 1, smoothWeights = 0.5, smoothWeightsMaxIterations = 2 )
+
+            # Only the arm joints may give weight to the wristtwists
+            restore_locked_weights( skinCluster, before, lambda name: "shoulder" in name or "elbow" in name or "wrist" in name )
+
+    # Done
+    if show_message:
+        confirm_dialog( "Added influences" )
+
+    cmds.select( clear = True )
+
+@operation( "Edit all wristtwists weights" )
+def edit_wristtwist_influences():
+    # Make sure the scene isn't empty
+    if len( get_joints() + get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
+        return
+    
+    # Make sure no animation is in the scene
+    if len( cmds.ls( "*SENotes*" ) ) > 0:
+        error( "You have an animation in the scene,\n\nReset scene first." )
+        return
+
+    # Get user input
+    operation = cmds.promptDialog( title = "Select operation", message = "Do you want to scale or smooth the weights?\n\nEnter the paint value (Default is 1.0)\n\nMake sure you test with animations to see if it looks good", button = ["Scale", "Smooth", "Cancel"], cancelButton = "Cancel" )
+    value = cmds.promptDialog( query = True, text = True )
+
+    # Cancel
+    if operation == "Cancel":
+        return
+
+    # Make sure it's a number
+    if not value.isnumeric():
+        error( "Invalid input!\n\nPlease enter a number\n\nOperation cancelled..." )
+        return
+
+    # Make sure wristtwists exist
+    for index in range( 1, 7 ):
+        if not cmds.objExists( "j_wristtwist" + str( index ) + "_le" ) or not cmds.objExists( "j_wristtwist" + str( index ) + "_ri" ):
+            error( "Can't find wristtwists\n\nDid you forget to convert first?\n\nOperation cancelled..." )
+            return
+
+        # Make sure they're attached
+        if not is_in_a_skincluster( "j_wristtwist" + str( index ) + "_le" ) or not is_in_a_skincluster( "j_wristtwist" + str( index ) + "_ri" ):
+            error( "The wristtwists are not attached to a skincluster...\n\nYou need to add them as influences first!\n\nOperation cancelled..." )
+            return
+
+    # Set skincluster attributes
+    set_skincluster_attributes()
+
+    # Check we're in painting mode, if not switch to it.
+    if cmds.currentCtx() != "artAttrSkinContext":
+        mel.eval( "ArtPaintSkinWeightsTool" )
+
+    # Gets current weight painting settings
+    current_operation = cmds.artAttrSkinPaintCtx( cmds.currentCtx(), query = 1, selectedattroper = True )
+    current_value = cmds.artAttrSkinPaintCtx( cmds.currentCtx(), query = 1, value = True )
+
+    # Edit weights
+    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, selectedattroper = operation.lower(), value = float( value ), maxvalue = float( value ) )
+
+    # The hands are left alone
+    fingers = get_weighted_influences( [ "j_index_le_1", "j_index_ri_1" ] )
+
+    # Perform operation
+    for mesh in get_meshes():
+        skinCluster = get_skincluster_for_mesh( mesh )
+        influences = cmds.skinCluster( skinCluster, query = True, influence = True )
+
+        if skinCluster in fingers:
+            continue
+
+        for joint in influences:
+            if "j_wristtwist" in joint:
+                mel.eval( "changeSelectMode -object; select " + mesh )
+                mel.eval( "artSkinSelectInfluence artAttrSkinPaintCtx " + joint )
+                cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, clear = 1 )
+
+        for joint in influences:
+            if "j_shoulder" in joint:
+                mel.eval( "changeSelectMode -object; select " + mesh )
+                mel.eval( "artSkinSelectInfluence artAttrSkinPaintCtx " + joint )
+                cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, clear = 1 )
+
+    # Sets weight painting settings back to what they were
+    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), e = 1, selectedattroper = current_operation )
+    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), e = 1, value = current_value )
+
+    # Set tool back to select
+    cmds.setToolTo( "selectSuperContext" )
+    enable_x_ray( False )
+    cmds.select( clear = True )
+
+    # Cleanup
+    if operation == "Smooth":
+        for mesh in get_meshes():
+            # Smoothing can tear the mesh, so let's merge the vertices
+            merge_verts( mesh )
+
+    confirm_dialog( "Operation completed" )
+
+def get_accessory_joints( target_rig ):
+    # Leaf joints that aren't in the target rig and aren't cosmetics yet
+    target_names = set( [ joint["name"] for joint in target_rig ] )
+    joints = []
+
+    for joint in scene_ls( type = "joint", long = True ):
+        if not get_short_name( joint ) in target_names and not "cosmetic_bone:" in joint:
+            if cmds.listRelatives( joint, allDescendents = True ) == None:
+                joints.append( joint )
+
+    return joints
+
+def rename_cosmetics( joints, cosmetic = True ):
+    # Moves the joints into the cosmetic_bone namespace, or back out of it, all at once
+    if not cmds.namespace( exists = "cosmetic_bone" ):
+        cmds.namespace( add = "cosmetic_bone" )
+
+    # Deepest first, so the long names of the rest stay valid
+    for joint in sorted( joints, key = lambda joint: -joint.count( "|" ) ):
+        cmds.rename( joint, ( "cosmetic_bone:" if cosmetic else ":" ) + get_short_name( joint ) )
+
+def fold_weights( folds ):
+    # Adds the weights of every joint in folds ( { joint: joint to fold into } ) to the joint it folds into, one read and write per skincluster
+    for skinCluster in get_skinclusters():
+        influences = cmds.skinCluster( skinCluster, query = True, influence = True ) or []
+        sources = [ joint for joint in influences if get_short_name( joint ) in folds ]
+
+        if len( sources ) < 1:
+            continue
+
+        for target in set( [ folds[get_short_name( joint )] for joint in sources ] ):
+            if not target in [ get_short_name( joint ) for joint in influences ]:
+                cmds.skinCluster( skinCluster, edit = True, addInfluence = target, weight = 0 )
+
+        influences, weights = get_skincluster_weights( skinCluster )
+        columns = dict( ( get_short_name( influences[index] ), index ) for index in range( len( influences ) ) )
+
+        for source in folds:
+            if source in columns:
+                weights[:, columns[folds[source]]] += weights[:, columns[source]]
+                weights[:, columns[source]] = 0
+
+        set_skincluster_weights( skinCluster, weights )
+
+@operation( "Resolve cosmetics" )
+def resolve_cosmetics( file_name = "fb_t8_male_and_female.mb", show_message = True ):
+    # Accessory joints sitting on a target joint only add to the cosmetic count, so their weights are folded into it
+    # The rest become cosmetics, the renames and folds are all done at the end
+    import numpy
+    import CoDCharacterToolsDiff
+
+    target_rig = get_target_rig( file_name )
+
+    if target_rig == None:
+        return
+
+    accessories = get_accessory_joints( target_rig )
+
+    if len( accessories ) < 1:
+        error( "There are no accessory joints to resolve." )
+        return
+
+    target_names = set( [ joint["name"] for joint in target_rig ] )
+    targets = [ joint for joint in scene_ls( type = "joint", long = True ) if get_short_name( joint ) in target_names ]
+    table = CoDCharacterToolsDiff.create_table( [ get_short_name( joint ) for joint in targets ], [ None ] * len( targets ), [ cmds.xform( joint, query = True, worldSpace = True, matrix = True ) for joint in targets ] )
+    positions = numpy.array( [ cmds.xform( joint, query = True, worldSpace = True, translation = True ) for joint in accessories ] )
+
+    entries = CoDCharacterToolsDiff.resolve_cosmetics( [ get_short_name( joint ) for joint in accessories ], positions, table )
+    long_names = dict( ( get_short_name( joint ), joint ) for joint in accessories )
+    folds = dict( ( entry["joint"], entry["nearest"] ) for entry in entries if entry["fold"] )
+
+    if len( folds ) > 0:
+        fold_weights( folds )
+        cmds.delete( [ long_names[joint] for joint in folds ] )
+
+    rename_cosmetics( [ long_names[entry["joint"]] for entry in entries if not entry["fold"] ] )
+
+    report = CoDCharacterToolsDiff.format_cosmetics_report( entries )
+    print( report )
+
+    if show_message:
+        confirm_dialog( report.split( "\n" )[0] + ".\n\nThe full list is in the script editor." )
+
+    return entries
+
+@operation( "Set cosmetics" )
+def set_cosmetics():
+    # Marks any joints that aren't in the target rig as cosmetics
+    target_rig = get_target_rig( "fb_t8_male_and_female.mb" )
+
+    rename_cosmetics( get_accessory_joints( target_rig ) )
+
+def remove_cosmetics_for_mesh( mesh ):
+    if not cmds.objExists( mesh ):
+        print( mesh + " doesn't exist" )
+        return
+
+    # One query for the cosmetics instead of checking every influence's name
+    cosmetics = set( cmds.ls( "cosmetic_bone:*", type = "joint", long = True ) )
+    influences = cmds.ls( cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True ), long = True )
+
+    rename_cosmetics( [ joint for joint in influences if joint in cosmetics ], False )
+
+def create_checkpoint( name, spill = None ):
+    # Stores every joint's transform, name and parent and every skincluster's weights so they can be put back quickly
+    # Joints are kept by UUID, so ones that get renamed or reparented are still found
+    # Big checkpoints are written to disk and memory mapped back in when they're restored
+    import numpy
+    import tempfile
+
+    joints = get_joints()
+    transforms = numpy.zeros( ( len( joints ), 9 ) )
+    uuids = []
+    names = []
+    parents = []
+
+    for index in range( len( joints ) ):
+        transforms[index, 0:3] = cmds.getAttr( joints[index] + ".translate" )[0]
+        transforms[index, 3:6] = cmds.getAttr( joints[index] + ".rotate" )[0]
+        transforms[index, 6:9] = cmds.getAttr( joints[index] + ".jointOrient" )[0]
+        uuids.append( cmds.ls( joints[index], uuid = True )[0] )
+        names.append( get_short_name( joints[index] ) )
+
+        # ( UUID, name ) of the parent, the name is used if it's been deleted
+        parent = cmds.listRelatives( joints[index], parent = True, fullPath = True )
+        parents.append( ( cmds.ls( parent[0], uuid = True )[0], get_short_name( parent[0] ) ) if parent else None )
+
+    skinClusters = {}
+
+    # Kept as they are, so restoring gives back exactly the same weights
+    for skinCluster in get_skinclusters():
+        influences, weights = get_skincluster_weights( skinCluster )
+        skinClusters[skinCluster] = { "influences": influences, "weights": weights }
+
+    if spill == None:
+        spill = sum( [ data["weights"].nbytes for data in skinClusters.values() ] ) > checkpoint_spill_size
+
+    if spill:
+        directory = tempfile.mkdtemp( prefix = "CoDCharacterTools_" )
+
+        for index, skinCluster in enumerate( sorted( skinClusters ) ):
+            path = os.path.join( directory, str( index ) + ".npy" )
+            numpy.save( path, skinClusters[skinCluster]["weights"] )
+            skinClusters[skinCluster]["weights"] = path
+
+    # The one it replaces may have been written to disk too
+    if name in checkpoints:
+        free_checkpoint( checkpoints[name] )
+
+    checkpoints[name] = { "uuids": uuids, "names": names, "parents": parents, "transforms": transforms, "skinClusters": skinClusters }
+
+def restore_checkpoint_joints( checkpoint ):
+    # Puts the skeleton back how it was, renamed joints get their names back, deleted ones are made again and new ones are deleted
+    # Returns the joints that had to be made again
+    wanted = set( checkpoint["uuids"] )
+    joints = get_joints()
+    current = dict( ( cmds.ls( joint, uuid = True )[0], joint ) for joint in ( cmds.ls( joints, long = True ) if len( joints ) > 0 else [] ) )
+    extra = [ current[uuid] for uuid in current if uuid not in wanted ]
+
+    # Joints that are kept come out from under the ones that go first
+    for uuid in current:
+        if uuid in wanted and any( [ current[uuid].startswith( joint + "|" ) for joint in extra ] ):
+            cmds.parent( current[uuid], world = True )
+
+    if len( extra ) > 0:
+        for skinCluster in get_skinclusters():
+            influences = cmds.skinCluster( skinCluster, query = True, influence = True ) or []
+            influences = set( cmds.ls( influences, long = True ) if len( influences ) > 0 else [] )
+            removed = [ joint for joint in extra if joint in influences ]
+
+            if len( removed ) > 0:
+                cmds.skinCluster( skinCluster, edit = True, removeInfluence = removed )
+
+        # Only the top ones, the rest go with them
+        cmds.delete( [ joint for joint in extra if not any( [ joint.startswith( other + "|" ) for other in extra ] ) ] )
+
+    # Names and nodes, made again for the ones that have been deleted
+    nodes = {}
+    created = []
+
+    for index, uuid in enumerate( checkpoint["uuids"] ):
+        name = checkpoint["names"][index]
+        found = cmds.ls( uuid )
+
+        if len( found ) > 0:
+            node = found[0] if get_short_name( found[0] ) == name else cmds.rename( found[0], name )
+        else:
+            node = cmds.createNode( "joint", name = name )
+            created.append( name )
+
+        if get_short_name( node ) != name:
+            raise OperationError( "\"" + name + "\" can't be given its name back, something else is called that now." )
+
+        nodes[uuid] = cmds.ls( node, uuid = True )[0]
+
+    # Parents, anything under the wrong one goes to the world first so nothing ends up under its own child
+    targets = []
+
+    for index, uuid in enumerate( checkpoint["uuids"] ):
+        parent = checkpoint["parents"][index]
+
+        if parent == None:
+            target = None
+        elif parent[0] in nodes:
+            target = nodes[parent[0]]
+        elif len( cmds.ls( parent[0] ) ) > 0:
+            target = parent[0]
+        elif cmds.objExists( parent[1] ):
+            target = cmds.ls( parent[1], uuid = True )[0]
+        else:
+            # A group the conversion deleted
+            target = cmds.ls( cmds.group( empty = True, name = parent[1] ), uuid = True )[0]
+
+        node_parent = cmds.listRelatives( cmds.ls( nodes[uuid] )[0], parent = True, fullPath = True )
+        current_parent = cmds.ls( node_parent[0], uuid = True )[0] if node_parent else None
+
+        if current_parent != target:
+            if current_parent != None:
+                cmds.parent( cmds.ls( nodes[uuid] )[0], world = True )
+
+            targets.append( ( nodes[uuid], target ) )
+
+    for uuid, target in targets:
+        if target != None:
+            cmds.parent( cmds.ls( uuid )[0], cmds.ls( target )[0] )
+
+    for index, uuid in enumerate( checkpoint["uuids"] ):
+        node = cmds.ls( nodes[uuid] )[0]
+        transform = checkpoint["transforms"][index]
+        cmds.setAttr( node + ".translate", *transform[0:3] )
+        cmds.setAttr( node + ".rotate", *transform[3:6] )
+        cmds.setAttr( node + ".jointOrient", *transform[6:9] )
+
+    return created
+
+@operation( "Restore checkpoint" )
+def restore_checkpoint( name ):
+    # Anything that can't be put back raises, so the operation is undone instead of leaving half a checkpoint
+    import numpy
+
+    if name not in checkpoints:
+        error( "Checkpoint \"" + name + "\" doesn't exist." )
+        return
+
+    checkpoint = checkpoints[name]
+    created = restore_checkpoint_joints( checkpoint )
+
+    # Weights, one write per skincluster
+    for skinCluster, data in checkpoint["skinClusters"].items():
+        if not cmds.objExists( skinCluster ):
+            raise OperationError( skinCluster + " has been deleted since the checkpoint, its weights can't be put back." )
+
+        weights = data["weights"]
+
+        if not isinstance( weights, numpy.ndarray ):
+            weights = numpy.load( weights, mmap_mode = "r" )
+
+        # Influences that have been removed since go back in, matched by their short names as the joints have them back
+        current = set( [ get_short_name( influence ) for influence in cmds.skinCluster( skinCluster, query = True, influence = True ) or [] ] )
+        kept = set( [ get_short_name( influence ) for influence in data["influences"] ] )
+
+        for influence in data["influences"]:
+            if get_short_name( influence ) not in current:
+                if not cmds.objExists( influence ):
+                    raise OperationError( "The influence " + influence + " of " + skinCluster + " can't be found, its weights can't be put back." )
+
+                cmds.skinCluster( skinCluster, edit = True, addInfluence = influence, weight = 0 )
+
+        influences, current_weights = get_skincluster_weights( skinCluster )
+
+        if len( current_weights ) != len( weights ):
+            raise OperationError( skinCluster + " has a different vertex count now, its weights can't be put back." )
+
+        # Influences the checkpoint doesn't have get nothing
+        columns = dict( ( get_short_name( influences[index] ), index ) for index in range( len( influences ) ) )
+        restored = numpy.zeros( current_weights.shape )
+
+        for index in range( len( data["influences"] ) ):
+            restored[:, columns[get_short_name( data["influences"][index] )]] = weights[:, index]
+
+        set_skincluster_weights( skinCluster, restored )
+
+        # And influences that have been added since are taken back out
+        extra = [ influence for influence in influences if get_short_name( influence ) not in kept ]
+
+        if len( extra ) > 0:
+            cmds.skinCluster( skinCluster, edit = True, removeInfluence = extra )
+
+    if len( created ) > 0:
+        print( "Made these joints again for checkpoint \"" + name + "\": " + ", ".join( created ) )
+
+def free_checkpoint( checkpoint ):
+    import shutil
+
+    for data in checkpoint["skinClusters"].values():
+        if not hasattr( data["weights"], "shape" ):
+            shutil.rmtree( os.path.dirname( data["weights"] ), ignore_errors = True )
+
+def delete_checkpoints():
+    for checkpoint in checkpoints.values():
+        free_checkpoint( checkpoint )
+
+    checkpoints.clear()
+
+def get_short_name( node ):
+    return node.split( "|" )[-1].split( ":" )[-1]
+
+def write_weights_file( path, skins ):
+    # skins is a list of ( mesh, influences, vertex count, vertices, columns, weights ), the last three only hold the non zero weights
+    #
+    # Layout, little endian:
+    #   magic, version (H), mesh count (I)
+    #   per mesh: name, vertex count (I), influence count (I), weight count (I), influence names,
+    #   padding to 4 bytes, vertices (I), weights (f), influence columns (H), padding to 4 bytes
+    #
+    # Strings are a length (H) followed by utf-8
+    import struct
+    import numpy
+
+    def write_string( file, string ):
+        encoded = string.encode( "utf-8" )
+        file.write( struct.pack( "<H", len( encoded ) ) + encoded )
+
+    with open( path, "wb" ) as file:
+        file.write( weights_file_magic + struct.pack( "<HI", weights_file_version, len( skins ) ) )
+
+        for mesh, influences, vertex_count, vertices, columns, weights in skins:
+            write_string( file, mesh )
+            file.write( struct.pack( "<3I", vertex_count, len( influences ), len( weights ) ) )
+
+            for influence in influences:
+                write_string( file, influence )
+
+            # Padded so the arrays can be used straight from the memory mapped file
+            file.write( b"\0" * ( -file.tell() % 4 ) )
+            numpy.asarray( vertices, dtype = "<u4" ).tofile( file )
+            numpy.asarray( weights, dtype = "<f4" ).tofile( file )
+            numpy.asarray( columns, dtype = "<u2" ).tofile( file )
+            file.write( b"\0" * ( -file.tell() % 4 ) )
+
+def read_weights_file( path ):
+    # Returns a list of dicts, the arrays are memory mapped so nothing is read until it's used
+    import struct
+    import numpy
+
+    data = numpy.memmap( path, dtype = numpy.uint8, mode = "r" )
+
+    if data[:len( weights_file_magic )].tobytes() != weights_file_magic:
+        error( os.path.basename( path ) + " isn't a weights file." )
+        return None
+
+    offset = len( weights_file_magic )
+    version, mesh_count = struct.unpack_from( "<HI", data, offset )
+    offset += 6
+
+    if version > weights_file_version:
+        error( os.path.basename( path ) + " was saved by a newer version of CoDCharacterTools." )
+        return None
+
+    def read_string( offset ):
+        length = struct.unpack_from( "<H", data, offset )[0]
+        return data[offset + 2:offset + 2 + length].tobytes().decode( "utf-8" ), offset + 2 + length
+
+    def read_array( offset, dtype, count ):
+        size = numpy.dtype( dtype ).itemsize * count
+        return data[offset:offset + size].view( dtype ), offset + size
+
+    skins = []
+
+    for index in range( mesh_count ):
+        mesh, offset = read_string( offset )
+        vertex_count, influence_count, weight_count = struct.unpack_from( "<3I", data, offset )
+        offset += 12
+
+        influences = []
+
+        for influence_index in range( influence_count ):
+            influence, offset = read_string( offset )
+            influences.append( influence )
+
+        offset += -offset % 4
+        vertices, offset = read_array( offset, "<u4", weight_count )
+        weights, offset = read_array( offset, "<f4", weight_count )
+        columns, offset = read_array( offset, "<u2", weight_count )
+        offset += -offset % 4
+
+        skins.append( { "mesh": mesh, "influences": influences, "vertex_count": vertex_count, "vertices": vertices, "weights": weights, "columns": columns } )
+
+    return skins
+
+def save_weights( path ):
+    # Writes every skinned mesh's weights, only the non zero ones are kept
+    import numpy
+
+    skins = []
+
+    for skinCluster in get_skinclusters():
+        function, shape = get_skincluster_function( skinCluster )
+        mesh = cmds.listRelatives( shape.fullPathName(), parent = True )[0]
+        influences, weights = get_skincluster_weights( skinCluster )
+        vertices, columns = numpy.nonzero( weights )
+
+        skins.append( ( get_short_name( mesh ), [ get_short_name( influence ) for influence in influences ], len( weights ), vertices, columns, weights[vertices, columns] ) )
+
+    write_weights_file( path, skins )
+
+    return len( skins )
+
+@operation( "Load weights" )
+def load_weights( path, show_message = True ):
+    # Meshes and joints are matched by name, namespaces are ignored, so this works on a re-exported version of the same character
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    skins = read_weights_file( path )
+
+    if skins == None:
+        return
+
+    meshes = {}
+
+    for skinCluster in get_skinclusters():
+        function, shape = get_skincluster_function( skinCluster )
+        meshes[get_short_name( cmds.listRelatives( shape.fullPathName(), parent = True )[0] )] = skinCluster
+
+    joints = dict( ( get_short_name( joint ), joint ) for joint in get_joints() )
+    loaded = []
+    skipped = []
+    missing = set()
+
+    for skin in skins:
+        skinCluster = meshes.get( skin["mesh"] )
+
+        if skinCluster == None:
+            skipped.append( skin["mesh"] + " (not in the scene)" )
+            continue
+
+        function, shape = get_skincluster_function( skinCluster )
+
+        if OpenMaya.MFnMesh( shape ).numVertices != skin["vertex_count"]:
+            skipped.append( skin["mesh"] + " (different vertex count)" )
+            continue
+
+        # Joints the file uses that aren't influences yet are added
+        current = [ get_short_name( influence.partialPathName() ) for influence in function.influenceObjects() ]
+
+        for column in numpy.unique( skin["columns"] ):
+            name = skin["influences"][column]
+
+            if name not in current and name in joints:
+                cmds.skinCluster( skinCluster, edit = True, addInfluence = joints[name], weight = 0 )
+
+        influences = [ get_short_name( influence.partialPathName() ) for influence in function.influenceObjects() ]
+
+        # The file's influence columns mapped onto this skincluster's, -1 when the joint doesn't exist
+        columns = dict( ( influences[index], index ) for index in range( len( influences ) ) )
+        remap = numpy.array( [ columns.get( name, -1 ) for name in skin["influences"] ], dtype = numpy.int64 )
+        targets = remap[skin["columns"]]
+        keep = targets >= 0
+
+        # Scatter the sparse weights into a full ( vertices, influences ) array
+        flat = skin["vertices"][keep].astype( numpy.int64 ) * len( influences ) + targets[keep]
+        weights = numpy.bincount( flat, weights = skin["weights"][keep], minlength = skin["vertex_count"] * len( influences ) ).reshape( skin["vertex_count"], len( influences ) )
+
+        # Weights that belonged to missing joints are spread over the rest
+        if not keep.all():
+            missing.update( [ skin["influences"][column] for column in numpy.unique( skin["columns"][~keep] ) ] )
+
+            totals = weights.sum( axis = 1 )
+            weights[totals > 0] /= totals[totals > 0, None]
+
+        set_skincluster_weights( skinCluster, weights )
+        loaded.append( skin["mesh"] )
+
+    message = "Loaded weights for " + str( len( loaded ) ) + " of " + str( len( skins ) ) + " meshes."
+
+    if len( skipped ) > 0:
+        message += "\n\nSkipped:\n" + "\n".join( skipped )
+
+    if len( missing ) > 0:
+        message += "\n\nThese joints don't exist, their weights were spread over the rest:\n" + "\n".join( sorted( missing ) )
+
+    print( message )
+
+    if show_message:
+        confirm_dialog( message )
+
+def run_in_background( function, args = (), callback = None ):
+    # Runs function on one of the background threads, for reading and parsing files, it mustn't touch Maya
+    # callback is called on the main thread with the result and the exception if it raised one, or wait_for gets the result
+    global background_pool
+
+    if background_pool == None:
+        from multiprocessing.pool import ThreadPool
+        background_pool = ThreadPool( background_threads )
+
+    def task():
+        try:
+            return function( *args ), None
+        except Exception as exception:
+            return None, exception
+
+    if callback == None:
+        return background_pool.apply_async( task )
+
+    import maya.utils
+
+    return background_pool.apply_async( task, callback = lambda result: maya.utils.executeDeferred( callback, *result ) )
+
+def wait_for( result ):
+    value, exception = result.get()
+
+    if exception != None:
+        raise exception
+
+    return value
+
+def queue_job( name, steps ):
+    # Adds a job to the queue and starts it if nothing's running
+    # steps are ( description, function ), or a function returning them when the job starts, for jobs that depend on what the ones before them did
+    # A step fails if it raises, returns False or shows an error, then every job after it is cancelled
+    # A step runs each time Maya is idle, so the UI keeps up and the job can be cancelled between steps, but a step itself (a whole conversion) still holds Maya up
+    global job_state
+
+    jobs.append( { "name": name, "steps": steps, "character": character_namespace } )
+
+    if job_state == None:
+        job_state = { "name": None, "steps": [], "index": 0, "done": 0, "time": 0.0, "cancelled": False }
+        cmds.evalDeferred( run_next_job_step, lowestPriority = True )
+
+    update_job_window()
+
+def cancel_jobs():
+    # The step that's running finishes, nothing after it runs
+    if job_state != None:
+        job_state["cancelled"] = True
+
+def finish_jobs( message ):
+    global job_state
+
+    del jobs[:]
+    job_state = None
+
+    if cmds.window( "CoDCharacterToolsJobs", exists = True ):
+        cmds.deleteUI( "CoDCharacterToolsJobs" )
+
+    print( message )
+    confirm_dialog( message )
+
+def run_next_job_step():
+    if job_state == None:
+        return
+
+    if job_state["cancelled"]:
+        finish_jobs( "Jobs cancelled." )
+        return
+
+    if job_state["index"] >= len( job_state["steps"] ):
+        if len( jobs ) < 1:
+            finish_jobs( "Jobs done in %.1f seconds." % job_state["time"] )
+            return
+
+        job = jobs.pop( 0 )
+
+        # Each job runs on the character it was queued for
+        if job["character"] != character_namespace:
+            set_character( job["character"] )
+
+        job_state.update( { "name": job["name"], "steps": job["steps"]() if callable( job["steps"] ) else job["steps"], "index": 0 } )
+    else:
+        description, function = job_state["steps"][job_state["index"]]
+        start = timeit.default_timer()
+        errors = error_count
+
+        # Operations explain themselves when they fail, with error() and a return or by raising, the jobs after this one would only fail too
+        try:
+            failed = function() == False or error_count != errors
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            failed = True
+
+        if failed:
+            finish_jobs( job_state["name"] + " failed at \"" + description + "\", the jobs after it were cancelled." )
+            return
+
+        job_state["time"] += timeit.default_timer() - start
+        job_state["index"] += 1
+        job_state["done"] += 1
+
+    update_job_window()
+    cmds.evalDeferred( run_next_job_step, lowestPriority = True )
+
+def update_job_window():
+    if job_state == None or cmds.about( batch = True ):
+        return
+
+    if not cmds.window( "CoDCharacterToolsJobs", exists = True ):
+        cmds.window( "CoDCharacterToolsJobs", title = "CoDCharacterTools jobs", widthHeight = ( 360, 120 ) )
+        cmds.columnLayout( adjustableColumn = True, rowSpacing = 6 )
+        cmds.text( "CoDCharacterToolsJobsStep", label = "", align = "left" )
+        cmds.progressBar( "CoDCharacterToolsJobsProgress", maxValue = 1 )
+        cmds.text( "CoDCharacterToolsJobsEta", label = "", align = "left" )
+        cmds.button( label = "Cancel", command = lambda x: cancel_jobs() )
+        cmds.showWindow( "CoDCharacterToolsJobs" )
+
+    # Jobs that haven't started yet count as one step, until they do
+    left = len( job_state["steps"] ) - job_state["index"] + sum( [ 1 if callable( job["steps"] ) else len( job["steps"] ) for job in jobs ] )
+    total = job_state["done"] + left
+
+    if job_state["index"] < len( job_state["steps"] ):
+        step = ( character_namespace + " " if character_namespace != None else "" ) + job_state["name"] + ": " + job_state["steps"][job_state["index"]][0]
+    else:
+        step = "Starting the next job"
+
+    if job_state["done"] > 0:
+        eta = "About %d seconds left, %d jobs queued" % ( job_state["time"] / job_state["done"] * left, len( jobs ) )
+    else:
+        eta = "%d jobs queued" % len( jobs )
+
+    cmds.text( "CoDCharacterToolsJobsStep", edit = True, label = step )
+    cmds.progressBar( "CoDCharacterToolsJobsProgress", edit = True, maxValue = max( total, 1 ), progress = job_state["done"] )
+    cmds.text( "CoDCharacterToolsJobsEta", edit = True, label = eta )
+
+def queue_conversion( file_name ):
+    # Combine, convert, add the wristtwists and merge the vertices, each mesh is merged in its own step
+    prefetch_target_rig( file_name )
+
+    def steps():
+        steps = []
+
+        if len( cmds.ls( "Joints*" ) ) > 1:
+            steps.append( ( "Combining", lambda: rig_combiner( False ) ) )
+
+        return steps + [
+            ( "Converting", lambda: rig_converter( file_name, show_message = False ) ),
+            ( "Adding wristtwists", lambda: add_wristtwist_influences( show_message = False ) )
+        ]
+
+    queue_job( "Convert to " + get_rig_name( file_name ), steps )
+    queue_merge_vertices()
+
+def queue_merge_vertices():
+    # The meshes are only known once the jobs before this one are done
+    queue_job( "Merge vertices", lambda: [ ( "Merging " + mesh, lambda mesh = mesh: merge_verts( mesh ) ) for mesh in cmds.ls( get_meshes(), type = "transform" ) ] )
+
+def menu_queue_targets( menu ):
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    for target_rig in get_target_rig_files():
+        cmds.menuItem( label = get_rig_name( target_rig ), command = lambda x, target_rig = target_rig: queue_conversion( target_rig ) )
+
+def menu_characters( menu ):
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    cmds.radioMenuItemCollection()
+    cmds.menuItem( label = "Whole scene", radioButton = character_namespace == None, command = lambda x: set_character( None ) )
+
+    for character in get_characters():
+        cmds.menuItem( label = character, radioButton = character == character_namespace, command = lambda x, character = character: set_character( character ) )
+
+    cmds.menuItem( divider = True )
+    cmds.menuItem( label = "New character...", command = lambda x: menu_new_character() )
+
+def menu_new_character():
+    name = prompt_dialog( "New character", "Name of the character's namespace, SEModels imported after this go in it" )
+
+    if name == None or len( name.strip() ) < 1:
         return
 
-    # Get user input
-    operation = cmds.promptDialog( title = "Select operation", message = "Do you want to scale or smooth the weights?\n\nEnter the paint value (Default is 1.0)\n\nMake sure you test with animations to see if it looks good", button = ["Scale", "Smooth", "Cancel"], cancelButton = "Cancel" )
-    value = cmds.promptDialog( query = True, text = True )
+    if not cmds.namespace( validateName = name.strip() ) == name.strip():
+        error( "\"" + name + "\" can't be used as a namespace." )
+        return
 
-    # Cancel
-    if operation == "Cancel":
+    set_character( name.strip() )
+
+def menu_remove_namespaces():
+    renames = remove_namespaces()
+    clashes = [ node for node in renames if get_short_name( node ) != get_short_name( renames[node] ) ]
+    message = "Moved " + str( len( renames ) ) + " nodes out of their namespaces."
+
+    if len( clashes ) > 0:
+        message += "\n\nThese clashed with nodes that were already there and were renamed:\n" + "\n".join( [ node + " -> " + get_short_name( renames[node] ) for node in clashes ] )
+
+    print( message )
+    confirm_dialog( message )
+
+def menu_create_checkpoint():
+    if len( get_joints() + get_meshes() ) < 1:
+        error( "No SEModels could be found!" )
         return
 
-    # Make sure it's a number
-    if not value.isnumeric():
-        error( "Invalid input!\n\nPlease enter a number\n\nOperation cancelled..." )
+    name = prompt_dialog( "Create checkpoint", "Name this checkpoint" )
+
+    if name == None:
         return
 
-    # Make sure wristtwists exist
-    for index in range( 1, 7 ):
-        if not cmds.objExists( "j_wristtwist" + str( index ) + "_le" ) or not cmds.objExists( "j_wristtwist" + str( index ) + "_ri" ):
-            error( "Can't find wristtwists\n\nDid you forget to convert first?\n\nOperation cancelled..." )
-            return
+    if len( name.strip() ) < 1:
+        name = "Checkpoint " + str( len( checkpoints ) + 1 )
 
-        # Make sure they're attached
-        if not is_in_a_skincluster( "j_wristtwist" + str( index ) + "_le" ) or not is_in_a_skincluster( "j_wristtwist" + str( index ) + "_ri" ):
-            error( "The wristtwists are not attached to a skincluster...\n\nYou need to add them as influences first!\n\nOperation cancelled..." )
-            return
+    create_checkpoint( name.strip() )
+    print( "Created checkpoint \"" + name.strip() + "\"." )
 
-    # Set skincluster attributes
-    set_skincluster_attributes()
+def menu_restore_checkpoints( menu ):
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
 
-    # Check we're in painting mode, if not switch to it.
-    if cmds.currentCtx() != "artAttrSkinContext":
-        mel.eval( "ArtPaintSkinWeightsTool" )
+    if len( checkpoints ) < 1:
+        cmds.menuItem( label = "No checkpoints", enable = False )
 
-    # Gets current weight painting settings
-    current_operation = cmds.artAttrSkinPaintCtx( cmds.currentCtx(), query = 1, selectedattroper = True )
-    current_value = cmds.artAttrSkinPaintCtx( cmds.currentCtx(), query = 1, value = True )
+    for name in sorted( checkpoints ):
+        cmds.menuItem( label = name, command = lambda x, name = name: restore_checkpoint( name ) )
 
-    # Edit weights
-    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, selectedattroper = operation.lower(), value = float( value ), maxvalue = float( value ) )
+def menu_save_weights():
+    if len( get_skinclusters() ) < 1:
+        error( "No skinned SEModels could be found!" )
+        return
 
-    # Perform operation
-    for mesh in get_meshes():
-        influences = cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True )
+    path = cmds.fileDialog2( caption = "Save weights", fileFilter = "Weights (*.weights)", fileMode = 0 )
 
-        if "j_index_le_1" in influences or "j_index_ri_1" in influences:
-            continue
+    if not path:
+        return
 
-        for joint in influences:
-            if "j_wristtwist" in joint:
-                mel.eval( "changeSelectMode -object; select " + mesh )
-                mel.eval( "artSkinSelectInfluence artAttrSkinPaintCtx " + joint )
-                cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, clear = 1 )
+    confirm_dialog( "Saved weights for " + str( save_weights( path[0] ) ) + " meshes." )
 
-        for joint in influences:
-            if "j_shoulder" in joint:
-                mel.eval( "changeSelectMode -object; select " + mesh )
-                mel.eval( "artSkinSelectInfluence artAttrSkinPaintCtx " + joint )
-                cmds.artAttrSkinPaintCtx( cmds.currentCtx(), edit = 1, clear = 1 )
+def menu_load_weights():
+    if len( get_skinclusters() ) < 1:
+        error( "No skinned SEModels could be found!" )
+        return
 
-    # Sets weight painting settings back to what they were
-    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), e = 1, selectedattroper = current_operation )
-    cmds.artAttrSkinPaintCtx( cmds.currentCtx(), e = 1, value = current_value )
+    path = cmds.fileDialog2( caption = "Load weights", fileFilter = "Weights (*.weights)", fileMode = 1 )
 
-    # Set tool back to select
-    cmds.setToolTo( "selectSuperContext" )
-    enable_x_ray( False )
-    cmds.select( clear = True )
+    if not path:
+        return
 
-    # Cleanup
-    if operation == "Smooth":
-        for mesh in get_meshes():
-            # Smoothing can tear the mesh, so let's merge the vertices
-            merge_verts( mesh )
+    load_weights( path[0] )
 
-    confirm_dialog( "Operation completed" )
+def get_scene_joint_table():
+    # One xform per joint, so this is quick enough to run on every save
+    import CoDCharacterToolsDiff
 
-def set_cosmetics():
-    # Marks any joints that aren't in the target rig as cosmetics
-    target_rig = import_target_rig( "fb_t8_male_and_female.mb" )
+    joints = scene_ls( type = "joint", long = True )
+    parents = [ get_short_name( joint.rsplit( "|", 1 )[0] ) for joint in joints ]
+    matrices = [ cmds.xform( joint, query = True, worldSpace = True, matrix = True ) for joint in joints ]
 
-    cmds.namespace( add = "cosmetic_bone" )
+    return CoDCharacterToolsDiff.create_table( [ get_short_name( joint ) for joint in joints ], parents, matrices )
 
-    for joint in get_joints():
-        if not is_joint_in_rig( target_rig, joint ):
-            if cmds.listRelatives( joint, allDescendents = True ) == None:
-                cmds.rename( joint, "cosmetic_bone:" + joint )
+def compare_skeleton( target_table, target_name, show_message = True, rename_joints = None ):
+    # Compares the joints in the scene against a target skeleton, the whole report goes to the script editor
+    import CoDCharacterToolsDiff
 
-def remove_cosmetics_for_mesh( mesh ):
-    if not cmds.objExists( mesh ):
-        print( mesh + " doesn't exist" )
+    if rename_joints == None:
+        rename_joints = {}
+
+    entries = CoDCharacterToolsDiff.diff_tables( get_scene_joint_table(), target_table, rename_joints )
+    message = CoDCharacterToolsDiff.format_diff_report( entries, "Scene", target_name )
+
+    print( message )
+
+    if show_message:
+        lines = message.split( "\n" )
+
+        if len( lines ) > 30:
+            lines = lines[:30] + [ "...", "", "The full report is in the script editor." ]
+
+        confirm_dialog( "\n".join( lines ) )
+
+    return entries
+
+def compare_skeleton_to_target_rig( file_name, show_message = True ):
+    global compare_target
+    import CoDCharacterToolsDiff
+
+    joints_with_attributes = get_target_rig( file_name )
+    profile = get_profile( file_name )
+
+    if joints_with_attributes == None or profile == None:
         return
-    
-    for joint in cmds.skinCluster( get_skincluster_for_mesh( mesh ), query = True, influence = True ):
-        if "cosmetic_bone" in joint:
-            cmds.rename( joint, joint.split( ":" )[-1] )
+
+    compare_target = file_name
+
+    return compare_skeleton( CoDCharacterToolsDiff.table_from_joints( joints_with_attributes ), get_rig_name( file_name ), show_message, profile["rename_joints"] )
+
+def compare_skeleton_on_save( *args ):
+    if compare_target != None:
+        compare_skeleton_to_target_rig( compare_target, False )
+
+def menu_compare_targets( menu ):
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    for target_rig in get_target_rig_files():
+        cmds.menuItem( label = get_rig_name( target_rig ), command = lambda x, target_rig = target_rig: compare_skeleton_to_target_rig( target_rig ) )
+
+    cmds.menuItem( divider = True )
+    cmds.menuItem( label = "SEModel...", command = lambda x: menu_compare_semodels() )
+
+def menu_align_targets( menu ):
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    for target_rig in get_target_rig_files():
+        cmds.menuItem( label = get_rig_name( target_rig ), command = lambda x, target_rig = target_rig: align_parts( target_rig ) )
+
+def menu_compare_semodels():
+    import CoDCharacterToolsDiff
+
+    paths = cmds.fileDialog2( caption = "Select the parts of one model", fileFilter = "SEModel (*.semodel)", fileMode = 4 )
+
+    if not paths:
+        return
+
+    compare_skeleton( CoDCharacterToolsDiff.table_from_semodels( paths ), ", ".join( [ os.path.basename( path ) for path in paths ] ) )
+
+def menu_compare_on_save( enable ):
+    global compare_job
+
+    if compare_job != None and cmds.scriptJob( exists = compare_job ):
+        cmds.scriptJob( kill = compare_job, force = True )
+
+    compare_job = None
+
+    if enable:
+        if compare_target == None:
+            error( "Compare the skeleton to a target rig first!" )
+            cmds.menuItem( "CoDCharacterToolsCompareOnSave", edit = True, checkBox = False )
+            return
+
+        compare_job = cmds.scriptJob( event = [ "SceneSaved", compare_skeleton_on_save ] )
 
 def menu_mirror_rotations():
     joint_to_mirror = prompt_dialog( "Mirror rotations", "Which joint do you want to mirror rotations from?\n\nThis is useful when making a conversion rig as you will only need to rotate one side\n\nAfter that, you can mirror those rotations to the opposite side\n\nThe rotations for every joint under it will also be mirrored" )
@@ -1126,11 +2845,465 @@ def menu_mirror_rotations():
 
         mirror_joint( joint_to_mirror )
 
+def menu_target_rigs( menu ):
+    # (Re)builds the target rig menu from what's in the targets directory
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    for target_rig in get_target_rig_files( ( ".ma", ".mb", ".semodel" ) ):
+        menu_new_target_rig( target_rig )
+
 def menu_new_target_rig( name ):
-    cmds.menuItem( label = get_rig_name( name ), command = lambda x: rig_converter( import_target_rig( name ), get_rig_name( name ) ) )
+    cmds.menuItem( label = get_rig_name( name ), command = lambda x: rig_converter( name ) )
+    cmds.menuItem( optionBox = True, command = lambda x: rig_converter( name, dry_run = True ) )
+
+def menu_new_test_animation( name, entry ):
+    label = os.path.splitext( name )[0]
+
+    if "error" not in entry:
+        label += " (" + str( entry["frames"] ) + " frames, " + ( "%g" % entry["framerate"] ) + " fps)"
+
+    cmds.menuItem( label = label, command = lambda x: load_test_animation( name ) )
+
+def load_test_animation( name ):
+    import SEToolsPlugin
+    SEToolsPlugin.__load_seanim__( get_animations_dir() + name )
+
+def reset_scene():
+    import SEToolsPlugin
+    SEToolsPlugin.__scene_resetanim__()
+
+def get_animation_index():
+    # Kept up to date by the watcher, read here if it hasn't got to it yet or isn't running (batch mode)
+    # Only new or changed animations have their headers read
+    if animation_index != None:
+        return animation_index
+
+    if not os.path.isdir( get_animations_dir() ):
+        return {}
+
+    return CoDCharacterToolsSE.update_seanim_index( get_animations_dir(), get_animations_dir() + "seanim_index.json" )
+
+def watch_directories():
+    # Picks up target rigs and animations being added, changed or removed while Maya is open, see CoDCharacterToolsWatcher
+    import CoDCharacterToolsWatcher
+
+    CoDCharacterToolsWatcher.watch( get_targets_dir(), ( ".ma", ".mb", ".semodel" ), on_targets_changed )
+    CoDCharacterToolsWatcher.watch( get_animations_dir(), ( ".seanim", ), on_animations_changed )
+
+def on_targets_changed( directory, snapshot, added, changed, removed ):
+    # On the watcher thread, nothing here is read so it's all done on the main thread
+    import maya.utils
+    maya.utils.executeDeferred( update_target_rigs, sorted( snapshot ), added, changed, removed )
+
+def update_target_rigs( files, added, changed, removed ):
+    global target_rig_files
+
+    # Nothing to report the first time
+    if target_rig_files != None:
+        report_directory_changes( "target rig", added, changed, removed )
+
+    target_rig_files = files
 
-def menu_new_test_animation( name ):
-    cmds.menuItem( label = name, command = lambda x: SEToolsPlugin.__load_seanim__( get_animations_dir() + name ) )
+    # Their joints are read again (or the rig imported again) when they're next used
+    for file_name in changed + removed:
+        target_rigs.pop( file_name, None )
+        target_rig_prefetches.pop( file_name, None )
+
+def on_animations_changed( directory, snapshot, added, changed, removed ):
+    # On the watcher thread, only the headers of the animations that changed are read
+    # The index file is only written on the main thread, get_animation_index can write it there too
+    import maya.utils
+    global animation_index
+
+    index_path = directory + "seanim_index.json"
+    previous = animation_index
+
+    if previous == None:
+        index = CoDCharacterToolsSE.load_seanim_index( index_path )
+    else:
+        index = previous
+
+    entries = CoDCharacterToolsSE.update_seanim_entries( directory, index, snapshot )
+
+    # A new dict every time, so the menu is never built from one that's half updated, and the save never sees it change
+    if entries != index:
+        maya.utils.executeDeferred( CoDCharacterToolsSE.save_seanim_index, index_path, entries )
+
+    animation_index = entries
+
+    if previous != None:
+        maya.utils.executeDeferred( report_directory_changes, "animation", added, changed, removed )
+
+def report_directory_changes( kind, added, changed, removed ):
+    changes = []
+
+    for names, action in ( ( added, "added" ), ( changed, "changed" ), ( removed, "removed" ) ):
+        if len( names ) > 0:
+            changes.append( str( len( names ) ) + " " + kind + ( "s " if len( names ) > 1 else " " ) + action + " (" + ", ".join( names ) + ")" )
+
+    print( "CoDCharacterTools: " + "; ".join( changes ) )
+
+def get_mesh_topology( shape ):
+    # Returns the unique edges and the triangles of a mesh as ( edges, 2 ) and ( triangles, 3 ) arrays of vertex indices
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    function = OpenMaya.MFnMesh( shape )
+    counts, vertices = function.getVertices()
+    counts = numpy.array( counts, dtype = numpy.int64 )
+    vertices = numpy.array( vertices, dtype = numpy.int64 )
+
+    # Every face vertex paired with the next one around its face
+    ends = numpy.cumsum( counts )
+    following = numpy.arange( 1, len( vertices ) + 1 )
+    following[ends - 1] = ends - counts
+    edges = numpy.sort( numpy.stack( [ vertices, vertices[following] ], axis = 1 ), axis = 1 )
+
+    # Shared edges show up once per face
+    keys = numpy.unique( edges[:, 0] * function.numVertices + edges[:, 1] )
+    edges = numpy.stack( [ keys // function.numVertices, keys % function.numVertices ], axis = 1 )
+
+    triangles = numpy.array( function.getTriangles()[1], dtype = numpy.int64 ).reshape( -1, 3 )
+
+    return edges, triangles
+
+def get_world_points( shape ):
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    points = OpenMaya.MFnMesh( shape ).getPoints( OpenMaya.MSpace.kWorld )
+
+    return numpy.array( [ ( point.x, point.y, point.z ) for point in points ] )
+
+def get_influence_positions( influences ):
+    import numpy
+    import maya.api.OpenMaya as OpenMaya
+
+    positions = [ OpenMaya.MTransformationMatrix( influence.inclusiveMatrix() ).translation( OpenMaya.MSpace.kWorld ) for influence in influences ]
+
+    return numpy.array( [ ( position.x, position.y, position.z ) for position in positions ] )
+
+def get_triangle_volumes( points, triangles, apexes ):
+    # Volume of the tetrahedron between every triangle and the joint it belongs to
+    import numpy
+
+    a = points[triangles[:, 0]] - apexes
+    b = points[triangles[:, 1]] - apexes
+    c = points[triangles[:, 2]] - apexes
+
+    return numpy.einsum( "ij,ij->i", a, numpy.cross( b, c ) ) / 6.0
+
+def create_qa_mesh( skinCluster ):
+    # Everything about the bind pose the metrics are measured against
+    import numpy
+
+    function, shape = get_skincluster_function( skinCluster )
+    influences, weights = get_skincluster_weights( skinCluster )
+    edges, triangles = get_mesh_topology( shape )
+    points = get_world_points( shape )
+
+    # Each vertex and triangle belongs to the joint with the most weight, the triangle goes by its first corner
+    dominant = numpy.argmax( weights, axis = 1 )
+    triangle_dominant = dominant[triangles[:, 0]]
+
+    # Edges sorted by the vertices at either end, so each vertex's worst edge can be found with one reduceat
+    endpoints = numpy.concatenate( [ edges[:, 0], edges[:, 1] ] )
+    order = numpy.argsort( endpoints, kind = "mergesort" )
+    edge_vertices, edge_starts = numpy.unique( endpoints[order], return_index = True )
+
+    paths = function.influenceObjects()
+    volumes = get_triangle_volumes( points, triangles, get_influence_positions( paths )[triangle_dominant] )
+
+    return {
+        "mesh": get_short_name( cmds.listRelatives( shape.fullPathName(), parent = True )[0] ),
+        "shape": shape,
+        "influences": [ get_short_name( influence ) for influence in influences ],
+        "paths": paths,
+        "edges": edges,
+        "triangles": triangles,
+        "dominant": dominant,
+        "triangle_dominant": triangle_dominant,
+        "order": order,
+        "edge_vertices": edge_vertices,
+        "edge_starts": edge_starts,
+        "lengths": numpy.linalg.norm( points[edges[:, 0]] - points[edges[:, 1]], axis = 1 ),
+        "vertex_volumes": numpy.bincount( triangles.ravel(), weights = numpy.repeat( volumes, 3 ), minlength = len( points ) ),
+        "influence_volumes": numpy.bincount( triangle_dominant, weights = volumes, minlength = len( influences ) ),
+        # Worst values so far, these are all that's kept between frames
+        "stretch": numpy.ones( len( points ) ),
+        "volume": numpy.ones( len( points ) ),
+        "influence_stretch": numpy.ones( len( influences ) ),
+        "influence_volume": numpy.ones( len( influences ) ),
+        "influence_worst": [ None ] * len( influences )
+    }
+
+def get_ratios( current, bind ):
+    import numpy
+
+    ratios = numpy.ones( len( bind ) )
+    valid = numpy.abs( bind ) > 1e-9
+    ratios[valid] = current[valid] / bind[valid]
+
+    return ratios
+
+def update_qa_mesh( qa_mesh, animation, frame ):
+    # Measures the current frame against the bind pose and keeps the worst of it
+    import numpy
+
+    points = get_world_points( qa_mesh["shape"] )
+    lengths = numpy.linalg.norm( points[qa_mesh["edges"][:, 0]] - points[qa_mesh["edges"][:, 1]], axis = 1 )
+
+    # Stretch, 1.5 is half as long again or two thirds as long, whichever way it went
+    edge_stretch = numpy.exp( numpy.abs( numpy.log( numpy.maximum( get_ratios( lengths, qa_mesh["lengths"] ), 1e-6 ) ) ) )
+    stretch = numpy.ones( len( points ) )
+    stretch[qa_mesh["edge_vertices"]] = numpy.maximum.reduceat( numpy.tile( edge_stretch, 2 )[qa_mesh["order"]], qa_mesh["edge_starts"] )
+
+    # Volume, as a fraction of the bind pose
+    volumes = get_triangle_volumes( points, qa_mesh["triangles"], get_influence_positions( qa_mesh["paths"] )[qa_mesh["triangle_dominant"]] )
+    volume = get_ratios( numpy.bincount( qa_mesh["triangles"].ravel(), weights = numpy.repeat( volumes, 3 ), minlength = len( points ) ), qa_mesh["vertex_volumes"] )
+    influence_volume = get_ratios( numpy.bincount( qa_mesh["triangle_dominant"], weights = volumes, minlength = len( qa_mesh["influences"] ) ), qa_mesh["influence_volumes"] )
+
+    influence_stretch = numpy.ones( len( qa_mesh["influences"] ) )
+    numpy.maximum.at( influence_stretch, qa_mesh["dominant"], stretch )
+
+    numpy.maximum( qa_mesh["stretch"], stretch, out = qa_mesh["stretch"] )
+    numpy.minimum( qa_mesh["volume"], volume, out = qa_mesh["volume"] )
+
+    # Remember where each joint was at its worst
+    worse = ( influence_stretch > qa_mesh["influence_stretch"] ) | ( influence_volume < qa_mesh["influence_volume"] )
+
+    for index in numpy.nonzero( worse )[0]:
+        qa_mesh["influence_worst"][index] = ( animation, frame )
+
+    numpy.maximum( qa_mesh["influence_stretch"], influence_stretch, out = qa_mesh["influence_stretch"] )
+    numpy.minimum( qa_mesh["influence_volume"], influence_volume, out = qa_mesh["influence_volume"] )
+
+def get_component_ranges( mesh, indices, component = "vtx" ):
+    # mesh.vtx[a:b] (or faces, edges...) components for a sorted array of indices
+    import numpy
+
+    if len( indices ) < 1:
+        return []
+
+    breaks = numpy.nonzero( numpy.diff( indices ) != 1 )[0]
+    starts = numpy.concatenate( [ indices[:1], indices[breaks + 1] ] )
+    ends = numpy.concatenate( [ indices[breaks], indices[-1:] ] )
+
+    return [ mesh + "." + component + "[" + str( start ) + ":" + str( end ) + "]" for start, end in zip( starts, ends ) ]
+
+def run_deformation_qa( names = None, stride = 2 ):
+    # Plays every test animation, sampling every stride frames, and reports the joints whose skin stretches or loses volume the most
+    # The flagged vertices are put in a "deformation_qa" set so they can be selected
+    import numpy
+
+    index = get_animation_index()
+
+    if names == None:
+        names = sorted( [ name for name in index if "error" not in index[name] and animation_filter.lower() in name.lower() ], key = lambda name: name.lower() )
+
+    # The poses are read back, so there's nothing to gain from undo or redrawing
+    undo_enabled = cmds.undoInfo( query = True, state = True )
+    cmds.undoInfo( stateWithoutFlush = False )
+    cmds.refresh( suspend = True )
+
+    frame_count = 0
+    # Loading an animation moves the time and the playback range, they're put back after
+    current_time = cmds.currentTime( query = True )
+    playback_range = ( cmds.playbackOptions( query = True, minTime = True ), cmds.playbackOptions( query = True, maxTime = True ) )
+
+    try:
+        reset_scene()
+        qa_meshes = [ create_qa_mesh( skinCluster ) for skinCluster in get_skinclusters() ]
+
+        for name in names:
+            load_test_animation( name )
+
+            start = int( cmds.playbackOptions( query = True, minTime = True ) )
+            end = int( cmds.playbackOptions( query = True, maxTime = True ) )
+
+            for frame in range( start, end + 1, max( stride, 1 ) ):
+                cmds.currentTime( frame, update = True )
+                frame_count += 1
+
+                for qa_mesh in qa_meshes:
+                    update_qa_mesh( qa_mesh, name, frame )
+
+            reset_scene()
+    except:
+        # Undo is off, so an animation a failure leaves loaded has to be taken off by hand
+        # The QA meshes only hold arrays, nothing is added to the scene, so they go with the exception
+        reset_scene()
+        raise
+    finally:
+        cmds.playbackOptions( minTime = playback_range[0], maxTime = playback_range[1] )
+        cmds.currentTime( current_time, update = True )
+        cmds.refresh( suspend = False )
+        cmds.undoInfo( stateWithoutFlush = undo_enabled )
+
+    report = { "animations": len( names ), "frames": frame_count, "meshes": {}, "influences": [] }
+    flagged = []
+
+    for qa_mesh in qa_meshes:
+        vertices = numpy.nonzero( ( qa_mesh["stretch"] > qa_stretch_limit ) | ( qa_mesh["volume"] < qa_volume_limit ) )[0]
+        flagged += get_component_ranges( qa_mesh["mesh"], vertices )
+        report["meshes"][qa_mesh["mesh"]] = { "vertices": len( qa_mesh["stretch"] ), "flagged": len( vertices ) }
+
+        for column in range( len( qa_mesh["influences"] ) ):
+            if qa_mesh["influence_worst"][column] != None:
+                report["influences"].append( {
+                    "mesh": qa_mesh["mesh"],
+                    "influence": qa_mesh["influences"][column],
+                    "stretch": float( qa_mesh["influence_stretch"][column] ),
+                    "volume": float( qa_mesh["influence_volume"][column] ),
+                    "animation": qa_mesh["influence_worst"][column][0],
+                    "frame": qa_mesh["influence_worst"][column][1]
+                } )
+
+    # Worst first, however far past its limit it went
+    report["influences"].sort( key = lambda entry: -max( entry["stretch"] / qa_stretch_limit, qa_volume_limit / max( entry["volume"], 1e-6 ) ) )
+
+    if cmds.objExists( "deformation_qa" ):
+        cmds.delete( "deformation_qa" )
+
+    if len( flagged ) > 0:
+        cmds.sets( flagged, name = "deformation_qa" )
+
+    return report
+
+@operation( "Quantize weights" )
+def quantize_weights( apply = True, show_message = True ):
+    # Rounds the weights the way exporting does ( CoDCharacterToolsOffline.quantize_weights ), to see what it does before going in game
+    # Without apply the weights are left alone, the vertices that change the most are put in a "quantized_weights" set
+    import numpy
+    import CoDCharacterToolsOffline
+
+    if len( get_skinclusters() ) < 1:
+        error( "No skinned SEModels could be found!" )
+        return
+
+    steps = float( CoDCharacterToolsOffline.weight_steps )
+    lines = []
+    flagged = []
+
+    for skinCluster in get_skinclusters():
+        influences, weights = get_skincluster_weights( skinCluster )
+        quantized = CoDCharacterToolsOffline.quantize_weights( weights )
+        errors = numpy.abs( quantized / steps - weights ).max( axis = 1 )
+        over = numpy.nonzero( errors > quantize_error_limit )[0]
+        mesh = get_short_name( get_skincluster_function( skinCluster )[1].partialPathName() )
+
+        # What the weights take up as floats and as steps with a 2 byte bone index each
+        lines.append( "%s: %d vertices, %d capped, mean error %.4f, worst %.4f, %d over %.3f (%.1f MB as floats, %.1f MB quantized)" % (
+            mesh,
+            len( weights ),
+            numpy.count_nonzero( numpy.count_nonzero( weights > 0, axis = 1 ) > CoDCharacterToolsOffline.max_influences ),
+            errors.mean() if len( errors ) > 0 else 0,
+            errors.max() if len( errors ) > 0 else 0,
+            len( over ),
+            quantize_error_limit,
+            weights.nbytes / 1048576.0,
+            numpy.count_nonzero( quantized ) * ( quantized.itemsize + 2 ) / 1048576.0
+        ) )
+
+        if apply:
+            set_skincluster_weights( skinCluster, quantized / steps )
+        else:
+            flagged += get_component_ranges( mesh, over )
+
+    if not apply:
+        if cmds.objExists( "quantized_weights" ):
+            cmds.delete( "quantized_weights" )
+
+        if len( flagged ) > 0:
+            cmds.sets( flagged, name = "quantized_weights" )
+
+    message = "\n".join( lines )
+
+    if apply:
+        message += "\n\nThe weights have been quantized."
+    elif len( flagged ) > 0:
+        message += "\n\nThe vertices over the limit are in the \"quantized_weights\" set."
+
+    print( message )
+
+    if show_message:
+        confirm_dialog( message )
+
+def format_deformation_qa_report( report, count = 10 ):
+    lines = [ "Checked " + str( report["animations"] ) + " animations, " + str( report["frames"] ) + " frames." ]
+
+    for mesh in sorted( report["meshes"] ):
+        lines.append( mesh + ": " + str( report["meshes"][mesh]["flagged"] ) + " of " + str( report["meshes"][mesh]["vertices"] ) + " vertices flagged" )
+
+    problems = [ entry for entry in report["influences"] if entry["stretch"] > qa_stretch_limit or entry["volume"] < qa_volume_limit ]
+
+    if len( problems ) > 0:
+        lines.append( "" )
+        lines.append( "Worst joints:" )
+
+        for entry in problems[:count]:
+            lines.append( "%s on %s: %.0f%% stretch, %.0f%% volume (%s, frame %d)" % ( entry["influence"], entry["mesh"], ( entry["stretch"] - 1 ) * 100, entry["volume"] * 100, os.path.splitext( entry["animation"] )[0], entry["frame"] ) )
+
+        lines.append( "" )
+        lines.append( "The flagged vertices are in the \"deformation_qa\" set." )
+    else:
+        lines.append( "Nothing went past the limits." )
+
+    return "\n".join( lines )
+
+def menu_test_animations( menu ):
+    # (Re)builds the test animation menu, grouped by what the animations are for
+    cmds.menu( menu, edit = True, deleteAllItems = True )
+    cmds.setParent( menu, menu = True )
+
+    cmds.menuItem( label = "Filter...", command = lambda x: menu_filter_test_animations( menu ) )
+
+    if len( animation_filter ) > 0:
+        cmds.menuItem( label = "Clear filter \"" + animation_filter + "\"", command = lambda x: menu_filter_test_animations( menu, "" ) )
+
+    cmds.menuItem( divider = True )
+
+    index = get_animation_index()
+    groups = {}
+
+    for name in sorted( index, key = lambda name: name.lower() ):
+        if animation_filter.lower() in name.lower():
+            groups.setdefault( index[name]["type"], [] ).append( name )
+
+    for group in ( "Fullbody", "Viewmodel", "Other" ):
+        if group in groups:
+            cmds.menuItem( label = group + " (" + str( len( groups[group] ) ) + ")", subMenu = True, tearOff = True )
+
+            for name in groups[group]:
+                menu_new_test_animation( name, index[name] )
+
+            cmds.setParent( "..", menu = True )
+
+def menu_filter_test_animations( menu, text = None ):
+    global animation_filter
+
+    if text == None:
+        text = prompt_dialog( "Filter animations", "Only show animations with this in their name" )
+
+        if text == None:
+            return
+
+    animation_filter = text.strip()
+    menu_test_animations( menu )
+
+def menu_deformation_qa():
+    if len( get_skinclusters() ) < 1:
+        error( "No skinned SEModels could be found!" )
+        return
+
+    if len( get_animation_index() ) < 1:
+        error( "No test animations could be found!" )
+        return
+
+    message = format_deformation_qa_report( run_deformation_qa() )
+    print( message )
+    confirm_dialog( message )
 
 def menu_transfer_weight():    
     weights = prompt_dialog( "Transfer weight", "Input your source joint, followed by your target joint\n\nSeparated by a hyphen (-)\n\nExample below:\n\nj_midbase_le-j_wrist_le" )
@@ -1145,6 +3318,26 @@ def menu_transfer_weight():
             error( "Invalid input!" )
             return
 
+def menu_select_influenced_vertices():
+    # The selected joints, or the ones asked for if none are selected
+    # Absolute names, so they're still found once the operation looks names up in the character's namespace
+    joints = cmds.ls( selection = True, type = "joint", absoluteName = True )
+
+    if len( joints ) < 1:
+        names = prompt_dialog( "Select influenced vertices", "Which joints do you want the vertices of?\n\nSeparated by a comma (,)\n\nExample below:\n\nj_wristtwist1_le,j_wristtwist2_le" )
+
+        if names == None:
+            return
+
+        joints = [ name.strip() for name in names.split( "," ) if len( name.strip() ) > 0 ]
+
+    if len( joints ) < 1:
+        error( "Invalid input!" )
+        return
+
+    select_influenced_vertices( joints )
+
+@operation( "Merge vertices" )
 def menu_merge_verts():
     if len( get_meshes() ) < 1:
         error( "No SEModels could be found!" )
@@ -1155,6 +3348,30 @@ def menu_merge_verts():
 
     confirm_dialog( "Operation completed" )
 
+def menu_preflight_semodels():
+    paths = cmds.fileDialog2( caption = "Select the parts of one model", fileFilter = "SEModel (*.semodel)", fileMode = 4 )
+
+    if not paths:
+        return
+
+    # Nothing gets imported, this only reads the files, in the background so Maya can carry on
+    run_in_background( CoDCharacterToolsSE.preflight, ( paths, ), show_preflight_report )
+
+def show_preflight_report( report, exception ):
+    if exception != None:
+        error( "Preflight failed: " + str( exception ) )
+        return
+
+    message = CoDCharacterToolsSE.format_preflight_report( report )
+
+    print( message )
+
+    if len( report["problems"] ) > 0:
+        error( message )
+    else:
+        confirm_dialog( message )
+
+@operation( "Zero rotations" )
 def menu_zero_rotations():
     result = cmds.confirmDialog( title = "Zero rotations", message = "Do you want to zero the rotations of all nodes or only the selected nodes?", button = ["All", "Selected", "Cancel"], defaultButton = "All", cancelButton = "Cancel" )
 
@@ -1173,56 +3390,92 @@ def menu_items():
     # Create the menu
     main_menu = cmds.menu( "CoDCharacterTools", label = "CoDCharacterTools", tearOff = True )
 
+    # Characters
+    cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Characters" )
+    characters_menu = cmds.menuItem( parent = main_menu, label = "Character:", subMenu = True )
+    cmds.menuItem( characters_menu, edit = True, postMenuCommand = lambda *args: menu_characters( characters_menu ) )
+
     # Misc
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Miscellaneous" )
     cmds.menuItem( parent = main_menu, label = "Reload plugin", command = "reload(CoDCharacterTools)" )
-    cmds.menuItem( parent = main_menu, label = "Remove all namespaces", command = lambda x: remove_namespaces() )
+    cmds.menuItem( parent = main_menu, label = "Remove all namespaces", command = lambda x: menu_remove_namespaces() )
 
     # Utilities
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Utilities" )
     cmds.menuItem( parent = main_menu, label = "Transfer weight", command = lambda x: menu_transfer_weight() )
+    cmds.menuItem( parent = main_menu, label = "Select influenced vertices", command = lambda x: menu_select_influenced_vertices() )
     cmds.menuItem( parent = main_menu, label = "Merge vertices", command = lambda x: menu_merge_verts() )
+    cmds.menuItem( parent = main_menu, label = "Quantize weights", command = lambda x: quantize_weights() )
+    cmds.menuItem( parent = main_menu, optionBox = True, command = lambda x: quantize_weights( apply = False ) )
     cmds.menuItem( parent = main_menu, label = "Add wristtwists influences", command = lambda x: add_wristtwist_influences() )
     cmds.menuItem( parent = main_menu, label = "Edit all wristtwists weights", command = lambda x: edit_wristtwist_influences() )
     cmds.menuItem( parent = main_menu, label = "Mirror rotations", command = lambda x: menu_mirror_rotations() )
     cmds.menuItem( parent = main_menu, label = "Zero rotations", command = lambda x: menu_zero_rotations() )
 
+    # Checkpoints
+    cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Checkpoints" )
+    cmds.menuItem( parent = main_menu, label = "Create checkpoint", command = lambda x: menu_create_checkpoint() )
+    checkpoints_menu = cmds.menuItem( parent = main_menu, label = "Restore checkpoint:", subMenu = True )
+    cmds.menuItem( checkpoints_menu, edit = True, postMenuCommand = lambda *args: menu_restore_checkpoints( checkpoints_menu ) )
+    cmds.menuItem( parent = main_menu, label = "Delete checkpoints", command = lambda x: delete_checkpoints() )
+    cmds.menuItem( parent = main_menu, label = "Save weights...", command = lambda x: menu_save_weights() )
+    cmds.menuItem( parent = main_menu, label = "Load weights...", command = lambda x: menu_load_weights() )
+
     # CoDMayaTools
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "CoDMayaTools" )
     cmds.menuItem( parent = main_menu, label = "Set \"head\" as the cosmetic parent", command = lambda x: set_cosmetic_parent() )
+    cmds.menuItem( parent = main_menu, label = "Resolve cosmetics", command = lambda x: resolve_cosmetics() )
 
     # SEToolsPlugin
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "SEToolsPlugin" )
-    cmds.menuItem( parent = main_menu, label = "Reset scene", command = lambda x: SEToolsPlugin.__scene_resetanim__() )
+    cmds.menuItem( parent = main_menu, label = "Reset scene", command = lambda x: reset_scene() )
+    cmds.menuItem( parent = main_menu, label = "Preflight SEModels", command = lambda x: menu_preflight_semodels() )
 
     # Rig combiner
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Rig combiner" )
     cmds.menuItem( parent = main_menu, label = "Rig combiner", command = lambda x: rig_combiner() )
+    cmds.menuItem( parent = main_menu, label = "Consolidate meshes by material", command = lambda x: consolidate_meshes() )
 
     # Rig converter
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Rig converter" )
-    cmds.menuItem( parent = main_menu, label = "Convert from:", subMenu = True )
+    targets_menu = cmds.menuItem( parent = main_menu, label = "Convert from:", subMenu = True )
+
+    # Filled in when it's opened
+    cmds.menuItem( targets_menu, edit = True, postMenuCommand = lambda *args: menu_target_rigs( targets_menu ) )
 
-    # Create new target rig entry
-    if os.path.isdir( get_targets_dir() ):
-        for target_rig in os.listdir( get_targets_dir() ):
-            if not os.path.isdir( target_rig ):
-                if target_rig.endswith( ( ".ma", ".mb", ".semodel" ) ):
-                    menu_new_target_rig( target_rig )
+    align_menu = cmds.menuItem( parent = main_menu, label = "Align parts to:", subMenu = True )
+    cmds.menuItem( align_menu, edit = True, postMenuCommand = lambda *args: menu_align_targets( align_menu ) )
+
+    compare_menu = cmds.menuItem( parent = main_menu, label = "Compare skeleton to:", subMenu = True )
+    cmds.menuItem( compare_menu, edit = True, postMenuCommand = lambda *args: menu_compare_targets( compare_menu ) )
+    cmds.menuItem( "CoDCharacterToolsCompareOnSave", parent = main_menu, label = "Compare skeleton on save", checkBox = compare_job != None, command = lambda enable: menu_compare_on_save( enable ) )
+    cmds.menuItem( parent = main_menu, label = "Split surfaces over the bone limit", command = lambda x: split_surfaces() )
+
+    # Job queue
+    cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Job queue" )
+    queue_menu = cmds.menuItem( parent = main_menu, label = "Queue conversion to:", subMenu = True )
+    cmds.menuItem( queue_menu, edit = True, postMenuCommand = lambda *args: menu_queue_targets( queue_menu ) )
+    cmds.menuItem( parent = main_menu, label = "Queue merge vertices", command = lambda x: queue_merge_vertices() )
+    cmds.menuItem( parent = main_menu, label = "Cancel jobs", command = lambda x: cancel_jobs() )
 
     # Test animations
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Test animations" )
-    cmds.menuItem( parent = main_menu, label = "Import animation:", subMenu = True )
+    animations_menu = cmds.menuItem( parent = main_menu, label = "Import animation:", subMenu = True )
 
-    # Create test animation entry
-    if os.path.isdir( get_animations_dir() ):
-        for seanim in os.listdir( get_animations_dir() ):
-            if not os.path.isdir( seanim ):
-                if seanim.endswith( ".seanim" ):
-                    menu_new_test_animation( seanim )
+    # Filled in when it's opened
+    cmds.menuItem( animations_menu, edit = True, postMenuCommand = lambda *args: menu_test_animations( animations_menu ) )
+    cmds.menuItem( parent = main_menu, label = "Check deformation", command = lambda x: menu_deformation_qa() )
 
     # Donate
     cmds.menuItem( parent = main_menu, divider = True, dividerLabel = "Say thanks" )
     cmds.menuItem( parent = main_menu, label = "Donate", command = lambda x: webbrowser.open( "https://paypal.me/kingslayerkyle" ) )
 
-menu_items()
+# There's no main window to attach the menu to in batch mode
+if not cmds.about( batch = True ):
+    menu_items()
+
+    # The target rigs and animations are looked at while Maya finishes starting up, and again whenever they change
+    watch_directories()
+
+startup_time = timeit.default_timer() - startup_start
+print( "CoDCharacterTools loaded in %.1f ms" % ( startup_time * 1000 ) )
@@ -0,0 +1,293 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmarks for CoDCharacterTools using synthetic CoD style rigs
+#
+# Inside Maya:
+#   import CoDCharacterToolsBenchmark
+#   CoDCharacterToolsBenchmark.run()
+#
+# From the command line:
+#   mayapy CoDCharacterToolsBenchmark.py --scale large --update-baselines
+#
+# Timings depend on the machine, so no baselines are shipped, every case is "new" until the
+# first run with --update-baselines stores them for this machine.
+
+import json
+import math
+import os
+import random
+import sys
+import timeit
+
+# Synthetic scene sizes, joints and vertices are totals across all parts
+scales = {
+    "small": { "joints": 100, "parts": 2, "vertices": 10000, "influences": 4 },
+    "medium": { "joints": 400, "parts": 4, "vertices": 100000, "influences": 8 },
+    "large": { "joints": 1000, "parts": 8, "vertices": 500000, "influences": 15 }
+}
+
+# Skeleton every part shares, these are the usual CoD names (name, parent, local translation)
+core_joints = [
+    ( "tag_origin", None, ( 0, 0, 0 ) ),
+    ( "j_mainroot", "tag_origin", ( 0, 100, 0 ) ),
+    ( "j_spinelower", "j_mainroot", ( 0, 8, 0 ) ),
+    ( "j_spineupper", "j_spinelower", ( 0, 10, 0 ) ),
+    ( "j_spine4", "j_spineupper", ( 0, 12, 0 ) ),
+    ( "j_neck", "j_spine4", ( 0, 15, 0 ) ),
+    ( "j_head", "j_neck", ( 0, 10, 0 ) )
+]
+
+for side, direction in ( ( "le", 1 ), ( "ri", -1 ) ):
+    core_joints += [
+        ( "j_clavicle_" + side, "j_spine4", ( 8 * direction, 10, 0 ) ),
+        ( "j_shoulder_" + side, "j_clavicle_" + side, ( 12 * direction, 0, 0 ) ),
+        ( "j_elbow_" + side, "j_shoulder_" + side, ( 28 * direction, 0, 0 ) ),
+        ( "j_wristfronttwist1_" + side, "j_elbow_" + side, ( 12 * direction, 0, 0 ) ),
+        ( "j_wrist_" + side, "j_elbow_" + side, ( 25 * direction, 0, 0 ) ),
+        ( "j_hip_" + side, "j_mainroot", ( 10 * direction, -5, 0 ) ),
+        ( "j_knee_" + side, "j_hip_" + side, ( 0, -45, 0 ) ),
+        ( "j_ankle_" + side, "j_knee_" + side, ( 0, -45, 0 ) ),
+        ( "j_ball_" + side, "j_ankle_" + side, ( 0, -5, 12 ) )
+    ]
+
+    for offset, finger in enumerate( [ "thumb", "index", "mid", "ring", "pinky" ] ):
+        parent = "j_wrist_" + side
+
+        for index in range( 1, 4 ):
+            name = "j_" + finger + "_" + side + "_" + str( index )
+            core_joints.append( ( name, parent, ( 3 * direction, 0, 2 - offset ) ) )
+            parent = name
+
+# Files in the targets directory that the convert and prune cases use
+target_rig_file = "fb_t8_male_and_female.mb"
+
+# Stored timings to compare against
+baselines_file = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "CoDCharacterTools", "Benchmarks", "baselines.json" )
+
+def get_synthetic_joints( joint_count, part_count, seed = 0 ):
+    # Returns a list of joints for every part, the core skeleton is shared and the rest are split between the parts
+    generator = random.Random( seed )
+    parts = [ list( core_joints ) for part in range( part_count ) ]
+    parents = [ joint[0] for joint in core_joints ]
+
+    for index in range( max( joint_count - len( core_joints ), 0 ) ):
+        part = parts[index % part_count]
+
+        # Mostly hang them off the core skeleton, sometimes chain them like accessories do
+        if index >= part_count and generator.random() < 0.3:
+            parent = part[-1][0]
+        else:
+            parent = generator.choice( parents )
+
+        translation = ( generator.uniform( -4, 4 ), generator.uniform( -4, 4 ), generator.uniform( -4, 4 ) )
+        part.append( ( "j_synthetic_" + str( index ), parent, translation ) )
+
+    return parts
+
+def create_synthetic_part( cmds, part_index, joints, vertex_count, influences ):
+    # Build the joints with unique temporary names, every part has its own tag_origin etc.
+    prefix = "benchmark_" + str( part_index ) + "_"
+    group = cmds.group( empty = True, world = True, name = "Joints" )
+
+    for name, parent, translation in joints:
+        if parent == None:
+            joint = cmds.createNode( "joint", name = prefix + name, parent = group )
+        else:
+            joint = cmds.createNode( "joint", name = prefix + name, parent = prefix + parent )
+
+        cmds.setAttr( joint + ".translate", translation[0], translation[1], translation[2] )
+
+    # Square plane with roughly the requested amount of vertices, stood up behind the skeleton
+    subdivisions = max( int( math.sqrt( vertex_count ) ) - 1, 1 )
+    mesh = cmds.polyPlane( name = prefix + "SEModelMesh", width = 120, height = 190, subdivisionsX = subdivisions, subdivisionsY = subdivisions, axis = ( 0, 0, 1 ), constructionHistory = False )[0]
+    cmds.move( 0, 95, part_index * 0.1, mesh )
+    cmds.makeIdentity( mesh, apply = True, translate = True )
+
+    cmds.select( clear = True )
+    cmds.skinCluster( [ prefix + joint[0] for joint in joints ], mesh, toSelectedBones = True, maximumInfluences = influences, obeyMaxInfluences = True, dropoffRate = 4.0, normalizeWeights = 1 )
+    cmds.select( clear = True )
+
+    # Same layout SETools gives us, a "Joints" group and a group named after the model holding the meshes
+    cmds.group( mesh, world = True, name = "synthetic_part_" + str( part_index ) )
+
+    # Now give them their real names, they only need to be unique under their parent
+    for name, parent, translation in reversed( joints ):
+        cmds.rename( prefix + name, name )
+
+    cmds.rename( mesh, "SEModelMesh_part_" + str( part_index ) )
+
+def create_synthetic_scene( cmds, scale ):
+    cmds.file( new = True, force = True )
+
+    parts = get_synthetic_joints( scale["joints"], scale["parts"] )
+
+    for index in range( len( parts ) ):
+        create_synthetic_part( cmds, index, parts[index], scale["vertices"] // scale["parts"], scale["influences"] )
+
+    cmds.select( clear = True )
+    cmds.flushUndo()
+
+def get_cases( tools ):
+    # Case name, whether the scene needs combining first, what we're timing
+    def convert():
+        tools.rig_converter( target_rig_file, show_message = False )
+
+    def merge_vertices():
+        for mesh in tools.get_meshes():
+            tools.merge_verts( mesh )
+
+    return [
+        ( "snapshot", False, lambda: tools.get_joints_with_attributes() ),
+        ( "combine", False, lambda: tools.rig_combiner( False ) ),
+        ( "convert", False, convert ),
+        ( "weight_transfer", True, lambda: tools.transfer_weight( "j_synthetic_0", "j_spine4" ) ),
+        ( "prune", True, lambda: tools.delete_non_target_joints() ),
+        ( "merge_vertices", True, merge_vertices ),
+        ( "normalize_meshes", True, lambda: tools.normalize_meshes() )
+    ]
+
+def load_baselines( path = baselines_file ):
+    if not os.path.isfile( path ):
+        return { "threshold": 1.25, "baselines": {} }
+
+    with open( path, "r" ) as file:
+        return json.load( file )
+
+def save_baselines( baselines, path = baselines_file ):
+    if not os.path.isdir( os.path.dirname( path ) ):
+        os.makedirs( os.path.dirname( path ) )
+
+    with open( path, "w" ) as file:
+        json.dump( baselines, file, indent = 4, sort_keys = True )
+
+def compare( results, baselines ):
+    # Returns rows of ( scale, case, seconds, baseline, status )
+    rows = []
+    threshold = baselines.get( "threshold", 1.25 )
+
+    for scale_name in sorted( results ):
+        for case_name in sorted( results[scale_name] ):
+            seconds = results[scale_name][case_name]
+            baseline = baselines["baselines"].get( scale_name, {} ).get( case_name )
+
+            if seconds == None:
+                status = "failed"
+            elif baseline == None:
+                status = "new"
+            elif seconds > baseline * threshold:
+                status = "regression"
+            elif seconds < baseline / threshold:
+                status = "improved"
+            else:
+                status = "ok"
+
+            rows.append( ( scale_name, case_name, seconds, baseline, status ) )
+
+    return rows
+
+def print_report( rows ):
+    print( "%-8s %-16s %10s %10s  %s" % ( "scale", "case", "seconds", "baseline", "status" ) )
+
+    for scale_name, case_name, seconds, baseline, status in rows:
+        seconds = "-" if seconds == None else "%.3f" % seconds
+        baseline = "-" if baseline == None else "%.3f" % baseline
+
+        print( "%-8s %-16s %10s %10s  %s" % ( scale_name, case_name, seconds, baseline, status ) )
+
+def run( scale_names = None, case_names = None, repeat = 1, update_baselines = False ):
+    import maya.cmds as cmds
+    import CoDCharacterTools
+
+    results = {}
+
+    for scale_name in scale_names or sorted( scales, key = lambda name: scales[name]["vertices"] ):
+        results[scale_name] = {}
+
+        for case_name, combine, function in get_cases( CoDCharacterTools ):
+            if case_names and case_name not in case_names:
+                continue
+
+            timings = []
+
+            for index in range( repeat ):
+                create_synthetic_scene( cmds, scales[scale_name] )
+
+                # Operations report most failures with an error and return, so a case that showed one failed too
+                error_count = CoDCharacterTools.error_count
+
+                if combine:
+                    CoDCharacterTools.rig_combiner( False )
+                    cmds.flushUndo()
+
+                # Keep going if one case falls over, it'll show up as failed in the report
+                try:
+                    start = timeit.default_timer()
+                    function()
+                    timings.append( timeit.default_timer() - start )
+                except Exception as exception:
+                    print( "%s %s failed: %s" % ( scale_name, case_name, exception ) )
+                    break
+
+                if CoDCharacterTools.error_count != error_count:
+                    print( "%s %s failed, it showed an error" % ( scale_name, case_name ) )
+                    del timings[:]
+                    break
+
+            # Best of the repeats, the rest is mostly noise from the OS
+            results[scale_name][case_name] = min( timings ) if len( timings ) == repeat else None
+            print( "%s %s: %s" % ( scale_name, case_name, results[scale_name][case_name] ) )
+
+    cmds.file( new = True, force = True )
+
+    baselines = load_baselines()
+    rows = compare( results, baselines )
+    print_report( rows )
+
+    if update_baselines:
+        for scale_name in results:
+            for case_name in results[scale_name]:
+                if results[scale_name][case_name] != None:
+                    baselines["baselines"].setdefault( scale_name, {} )[case_name] = results[scale_name][case_name]
+
+        save_baselines( baselines )
+        print( "Saved baselines to " + baselines_file )
+
+    return rows
+
+def main( arguments ):
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Benchmark CoDCharacterTools with synthetic rigs." )
+    parser.add_argument( "--scale", action = "append", choices = sorted( scales ), help = "Scale to run, can be given more than once (default: all)" )
+    parser.add_argument( "--case", action = "append", help = "Case to run, can be given more than once (default: all)" )
+    parser.add_argument( "--repeat", type = int, default = 1, help = "Runs per case, the best one is kept" )
+    parser.add_argument( "--update-baselines", action = "store_true", help = "Store these timings as the new baselines" )
+    options = parser.parse_args( arguments )
+
+    import maya.standalone
+    maya.standalone.initialize()
+
+    rows = run( options.scale, options.case, options.repeat, options.update_baselines )
+
+    # Non-zero exit so this can gate a release
+    for row in rows:
+        if row[4] in ( "regression", "failed" ):
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit( main( sys.argv[1:] ) )
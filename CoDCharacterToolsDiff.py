@@ -0,0 +1,358 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compares two skeletons, for working out what a new target rig needs
+#
+# Either side can be the joints in the Maya scene, a cached target rig (.rig.json)
+# or the parts of an SEModel.
+#
+# From the command line:
+#   python CoDCharacterToolsDiff.py fb_t9_male.rig.json body.semodel head.semodel
+#   python CoDCharacterToolsDiff.py fb_t9_male.rig.json fb_t8_male_and_female.rig.json
+
+import sys
+
+import numpy as np
+
+import CoDCharacterToolsOffline
+import CoDCharacterToolsProfile
+
+# Joints further apart than this (in units) or rotated more than this (in degrees) are reported
+position_tolerance = 0.01
+rotation_tolerance = 0.5
+
+# Unmatched joints this close to each other are suggested as renames
+rename_distance = 0.5
+
+# Parts that need more turning or scaling than this to fit the target, or still miss it by more than this fraction of its size, were probably ripped wrong
+alignment_angle_tolerance = 10.0
+alignment_scale_tolerance = 0.1
+alignment_residual_tolerance = 0.05
+
+# Accessory joints closer than this to a target joint have their weights folded into it instead of being kept as cosmetics
+cosmetic_fold_distance = 1.0
+
+# Report order, most important first
+severities = [ "missing", "parent", "rename", "position", "rotation", "extra" ]
+
+def create_table( names, parents, matrices ):
+    # names, parent names ( None for roots ) and ( n, 4, 4 ) row vector world matrices
+    matrices = np.asarray( matrices, dtype = np.float64 ).reshape( -1, 4, 4 )
+    names = list( names )
+
+    return {
+        "names": names,
+        "parents": [ parent if parent in names else None for parent in parents ],
+        "positions": matrices[:, 3, :3],
+        "rotations": matrices[:, :3, :3]
+    }
+
+def table_from_joints( joints_with_attributes ):
+    # The joint dicts get_joints_with_attributes and the target rig cache use
+    matrices = []
+
+    for joint in joints_with_attributes:
+        rotation = CoDCharacterToolsOffline.euler_to_matrix( ( joint["rotateXWorld"], joint["rotateYWorld"], joint["rotateZWorld"] ) )
+        matrices.append( CoDCharacterToolsOffline.compose( [ rotation ], [ ( joint["translateXWorld"], joint["translateYWorld"], joint["translateZWorld"] ) ] )[0] )
+
+    return create_table( [ joint["name"] for joint in joints_with_attributes ], [ joint["parent"].split( "|" )[-1].split( ":" )[-1] for joint in joints_with_attributes ], matrices )
+
+def table_from_target_rig( path ):
+    return table_from_joints( CoDCharacterToolsOffline.load_target_rig( path )[1] )
+
+def table_from_semodels( paths ):
+    # The parts are merged the same way the rig combiner does it
+    model = CoDCharacterToolsOffline.merge_parts( [ CoDCharacterToolsOffline.load_semodel( path ) for path in paths ] )
+    parents = [ model["bones"][parent] if parent >= 0 else None for parent in model["parents"] ]
+
+    return create_table( model["bones"], parents, model["matrices"] )
+
+def load_table( paths ):
+    if len( paths ) == 1 and paths[0].lower().endswith( ".json" ):
+        return table_from_target_rig( paths[0] )
+
+    return table_from_semodels( paths )
+
+def get_rename_suggestions( source, target, source_unmatched, target_unmatched, rename_joints ):
+    # Returns { source index: ( target index, reason ) }, the profile's renames first, then the closest joint
+    suggestions = {}
+    target_indices = dict( ( target["names"][index], index ) for index in target_unmatched )
+
+    renames = dict( rename_joints )
+    renames.update( dict( ( new, old ) for old, new in rename_joints.items() ) )
+
+    for index in source_unmatched:
+        name = source["names"][index]
+
+        if renames.get( name ) in target_indices:
+            suggestions[index] = ( target_indices.pop( renames[name] ), "renamed by the profile" )
+
+    # Every leftover source joint against every leftover target joint at once
+    source_left = np.array( [ index for index in source_unmatched if index not in suggestions ], dtype = np.int64 )
+    target_left = np.array( sorted( target_indices.values() ), dtype = np.int64 )
+
+    if len( source_left ) > 0 and len( target_left ) > 0:
+        distances = np.linalg.norm( source["positions"][source_left][:, None, :] - target["positions"][target_left][None, :, :], axis = 2 )
+        closest = np.argmin( distances, axis = 1 )
+        taken = set()
+
+        # Closest pairs first, so two source joints don't get the same target
+        for row in np.argsort( distances[np.arange( len( source_left ) ), closest] ):
+            column = closest[row]
+
+            if distances[row, column] <= rename_distance and column not in taken:
+                taken.add( column )
+                suggestions[source_left[row]] = ( target_left[column], "%.3f units away" % distances[row, column] )
+
+    return suggestions
+
+def diff_tables( source, target, rename_joints = None ):
+    # Returns a list of problems sorted by severity, each one is a dict with kind, joint, target, value and detail
+    # rename_joints are the target's profile renames
+    if rename_joints == None:
+        rename_joints = {}
+
+    source_indices = dict( ( source["names"][index], index ) for index in range( len( source["names"] ) ) )
+    target_indices = dict( ( target["names"][index], index ) for index in range( len( target["names"] ) ) )
+
+    matched = [ ( source_indices[name], target_indices[name] ) for name in target["names"] if name in source_indices ]
+    source_unmatched = [ index for index in range( len( source["names"] ) ) if source["names"][index] not in target_indices ]
+    target_unmatched = [ index for index in range( len( target["names"] ) ) if target["names"][index] not in source_indices ]
+
+    suggestions = get_rename_suggestions( source, target, source_unmatched, target_unmatched, rename_joints )
+    entries = []
+
+    for source_index, ( target_index, reason ) in sorted( suggestions.items() ):
+        entries.append( { "kind": "rename", "joint": source["names"][source_index], "target": target["names"][target_index], "value": 0.0, "detail": reason } )
+
+    renamed = set( [ target_index for target_index, reason in suggestions.values() ] )
+
+    for index in target_unmatched:
+        if index not in renamed:
+            entries.append( { "kind": "missing", "joint": target["names"][index], "target": target["names"][index], "value": 0.0, "detail": "not in the source" } )
+
+    for index in source_unmatched:
+        if index not in suggestions:
+            entries.append( { "kind": "extra", "joint": source["names"][index], "target": None, "value": 0.0, "detail": "not in the target" } )
+
+    # Renamed joints are compared like matched ones
+    pairs = matched + [ ( source_index, target_index ) for source_index, ( target_index, reason ) in suggestions.items() ]
+
+    if len( pairs ) > 0:
+        pairs = np.array( pairs, dtype = np.int64 )
+        source_pairs, target_pairs = pairs[:, 0], pairs[:, 1]
+
+        # Parents, with the source side renamed to match the target
+        names = dict( ( source["names"][source_index], target["names"][target_index] ) for source_index, target_index in pairs )
+
+        for source_index, target_index in pairs:
+            parent = names.get( source["parents"][source_index], source["parents"][source_index] )
+
+            if parent != target["parents"][target_index]:
+                entries.append( { "kind": "parent", "joint": source["names"][source_index], "target": target["names"][target_index], "value": 0.0, "detail": "parent is %s, should be %s" % ( parent, target["parents"][target_index] ) } )
+
+        # World space position and rotation differences in one go
+        distances = np.linalg.norm( source["positions"][source_pairs] - target["positions"][target_pairs], axis = 1 )
+        traces = np.einsum( "nij,nij->n", source["rotations"][source_pairs], target["rotations"][target_pairs] )
+        angles = np.degrees( np.arccos( np.clip( ( traces - 1 ) / 2, -1, 1 ) ) )
+
+        for row in np.nonzero( distances > position_tolerance )[0]:
+            entries.append( { "kind": "position", "joint": source["names"][source_pairs[row]], "target": target["names"][target_pairs[row]], "value": float( distances[row] ), "detail": "%.3f units off" % distances[row] } )
+
+        for row in np.nonzero( angles > rotation_tolerance )[0]:
+            entries.append( { "kind": "rotation", "joint": source["names"][source_pairs[row]], "target": target["names"][target_pairs[row]], "value": float( angles[row] ), "detail": "%.1f degrees off" % angles[row] } )
+
+    entries.sort( key = lambda entry: ( severities.index( entry["kind"] ), -entry["value"], entry["joint"] ) )
+
+    return entries
+
+def get_similarity_transforms( sources, target ):
+    # Best uniform scale, rotation and translation taking each source table onto the target, from the joints they share by name
+    # This is Umeyama's method, the SVDs for every part are done in one call. Matrices are row vector like Maya's, so a
+    # point p ends up at scale * p.dot( rotation ) + translation
+    # Parts sharing fewer than 3 joints with the target get None
+    target_indices = dict( ( target["names"][index], index ) for index in range( len( target["names"] ) ) )
+    pairs = []
+
+    for source in sources:
+        shared = [ ( index, target_indices[source["names"][index]] ) for index in range( len( source["names"] ) ) if source["names"][index] in target_indices ]
+        pairs.append( np.array( shared, dtype = np.int64 ).reshape( -1, 2 ) )
+
+    solvable = [ index for index in range( len( sources ) ) if len( pairs[index] ) >= 3 ]
+    results = [ None ] * len( sources )
+
+    if len( solvable ) < 1:
+        return results
+
+    means = []
+    covariances = []
+    variances = []
+
+    for index in solvable:
+        source_points = sources[index]["positions"][pairs[index][:, 0]]
+        target_points = target["positions"][pairs[index][:, 1]]
+        source_mean = source_points.mean( axis = 0 )
+        target_mean = target_points.mean( axis = 0 )
+
+        means.append( ( source_mean, target_mean ) )
+        covariances.append( ( target_points - target_mean ).T.dot( source_points - source_mean ) / len( source_points ) )
+        variances.append( np.mean( np.sum( ( source_points - source_mean ) ** 2, axis = 1 ) ) )
+
+    u, d, vt = np.linalg.svd( np.array( covariances ) )
+
+    # Reflections aren't allowed, flip the smallest axis if that's what fits best
+    signs = np.ones( ( len( solvable ), 3 ) )
+    signs[:, 2] = np.sign( np.linalg.det( u ) * np.linalg.det( vt ) )
+    signs[signs == 0] = 1
+
+    rotations = np.einsum( "nij,nj,njk->nik", u, signs, vt )
+
+    for row in range( len( solvable ) ):
+        index = solvable[row]
+        source_mean, target_mean = means[row]
+
+        scale = np.sum( d[row] * signs[row] ) / variances[row] if variances[row] > 1e-12 else 1.0
+        rotation = rotations[row].T
+        translation = target_mean - scale * source_mean.dot( rotation )
+
+        # How far each shared joint still is from its target after the fit
+        source_points = sources[index]["positions"][pairs[index][:, 0]]
+        target_points = target["positions"][pairs[index][:, 1]]
+        residuals = np.linalg.norm( scale * source_points.dot( rotation ) + translation - target_points, axis = 1 )
+        size = np.linalg.norm( target_points.max( axis = 0 ) - target_points.min( axis = 0 ) )
+
+        results[index] = {
+            "count": len( source_points ),
+            "scale": float( scale ),
+            "rotation": rotation,
+            "translation": translation,
+            "angle": float( np.degrees( np.arccos( np.clip( ( np.trace( rotation ) - 1 ) / 2, -1, 1 ) ) ) ),
+            "rms": float( np.sqrt( np.mean( residuals ** 2 ) ) ),
+            "worst": float( residuals.max() ),
+            "worst_joint": sources[index]["names"][pairs[index][np.argmax( residuals ), 0]],
+            "size": float( size )
+        }
+
+    return results
+
+def get_alignment_problems( alignment ):
+    # What's wrong with a fit from get_similarity_transforms, if anything
+    problems = []
+
+    if alignment["angle"] > alignment_angle_tolerance:
+        problems.append( "turned %.1f degrees from the target" % alignment["angle"] )
+
+    if abs( alignment["scale"] - 1 ) > alignment_scale_tolerance:
+        problems.append( "scaled %.3fx from the target" % alignment["scale"] )
+
+    if alignment["size"] > 0 and alignment["rms"] > alignment_residual_tolerance * alignment["size"]:
+        problems.append( "joints are %.2f units off on average after aligning, %s is %.2f units off" % ( alignment["rms"], alignment["worst_joint"], alignment["worst"] ) )
+
+    return problems
+
+def format_alignment_report( names, alignments ):
+    lines = []
+
+    for name, alignment in zip( names, alignments ):
+        if alignment == None:
+            lines.append( "%s: shares fewer than 3 joints with the target, can't align it" % name )
+            continue
+
+        lines.append( "%s: %d shared joints, %.1f degrees, scale %.3f, %.2f units off on average (worst %s, %.2f)" % ( name, alignment["count"], alignment["angle"], alignment["scale"], alignment["rms"], alignment["worst_joint"], alignment["worst"] ) )
+
+        for problem in get_alignment_problems( alignment ):
+            lines.append( "    " + problem )
+
+    return "\n".join( lines )
+
+def get_nearest_joints( points, table ):
+    # Returns the index of the closest joint in table and how far away it is, for every point
+    # Characters only have a few hundred joints, so every pair at once is quicker than building a tree
+    points = np.asarray( points, dtype = np.float64 ).reshape( -1, 3 )
+
+    if len( points ) < 1 or len( table["names"] ) < 1:
+        return np.zeros( len( points ), dtype = np.int64 ), np.full( len( points ), np.inf )
+
+    distances = np.linalg.norm( points[:, None, :] - table["positions"][None, :, :], axis = 2 )
+    nearest = np.argmin( distances, axis = 1 )
+
+    return nearest, distances[np.arange( len( points ) ), nearest]
+
+def resolve_cosmetics( names, positions, table, fold_distance = None ):
+    # Decides for every accessory joint whether it's kept as a cosmetic or folded into the closest joint in table
+    # Returns a list of dicts with joint, nearest, distance and fold, closest first
+    if fold_distance == None:
+        fold_distance = cosmetic_fold_distance
+
+    nearest, distances = get_nearest_joints( positions, table )
+    entries = []
+
+    for index in np.argsort( distances, kind = "stable" ):
+        entries.append( {
+            "joint": names[index],
+            "nearest": table["names"][nearest[index]] if len( table["names"] ) > 0 else None,
+            "distance": float( distances[index] ),
+            "fold": bool( distances[index] <= fold_distance )
+        } )
+
+    return entries
+
+def format_cosmetics_report( entries ):
+    folded = [ entry for entry in entries if entry["fold"] ]
+    lines = [ "%d accessory joints, %d folded, %d kept as cosmetics" % ( len( entries ), len( folded ), len( entries ) - len( folded ) ) ]
+
+    for entry in entries:
+        if entry["nearest"] == None:
+            lines.append( "keep  %s: no target joints in the scene" % entry["joint"] )
+        else:
+            lines.append( "%s  %s -> %s (%.3f units away)" % ( "fold" if entry["fold"] else "keep", entry["joint"], entry["nearest"], entry["distance"] ) )
+
+    return "\n".join( lines )
+
+def format_diff_report( entries, source_name = "source", target_name = "target" ):
+    counts = dict( ( kind, len( [ entry for entry in entries if entry["kind"] == kind ] ) ) for kind in severities )
+    lines = [ source_name + " against " + target_name + ": " + ", ".join( [ str( counts[kind] ) + " " + kind for kind in severities if counts[kind] > 0 ] ) ]
+
+    if len( entries ) < 1:
+        lines = [ source_name + " matches " + target_name + "." ]
+
+    for entry in entries:
+        if entry["kind"] == "rename":
+            lines.append( "rename    %s -> %s (%s)" % ( entry["joint"], entry["target"], entry["detail"] ) )
+        else:
+            lines.append( "%-9s %s: %s" % ( entry["kind"], entry["joint"], entry["detail"] ) )
+
+    return "\n".join( lines )
+
+def main( arguments ):
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Compare a skeleton against a target rig." )
+    parser.add_argument( "target", help = "Target rig joint table (.rig.json) or SEModel" )
+    parser.add_argument( "source", nargs = "+", help = "Target rig joint table (.rig.json), or the SEModel parts of one character" )
+    options = parser.parse_args( arguments )
+
+    rename_joints = {}
+
+    if options.target.lower().endswith( ".json" ):
+        rename_joints = CoDCharacterToolsProfile.load_profile( options.target )["rename_joints"]
+
+    entries = diff_tables( load_table( options.source ), load_table( [ options.target ] ), rename_joints )
+    print( format_diff_report( entries, ", ".join( options.source ), options.target ) )
+
+    return 1 if len( [ entry for entry in entries if entry["kind"] in ( "missing", "parent" ) ] ) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit( main( sys.argv[1:] ) )
@@ -0,0 +1,768 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Converts SEModels to a target rig without Maya, the output SEModel only needs
+# importing, checking and exporting with CoDMayaTools afterwards.
+#
+# Target rigs are the .rig.json files CoDCharacterTools writes next to the .mb files
+# in the targets directory the first time they're used, the conversion profile next
+# to them is followed the same way rig_converter does.
+#
+# From the command line:
+#   python CoDCharacterToolsOffline.py fb_t9_male.rig.json body.semodel head.semodel --output converted.semodel
+#   python CoDCharacterToolsOffline.py --batch fb_t9_male.rig.json exports/ --output converted/ --processes 8
+
+import json
+import multiprocessing
+import os
+import struct
+import sys
+
+import numpy as np
+
+import CoDCharacterToolsProfile
+import CoDCharacterToolsSE
+
+# Limit set_skincluster_attributes uses in CoDCharacterTools
+max_influences = 15
+
+# Exported weights are stored as whole fractions of this many steps, see quantize_weights
+weight_steps = 255
+
+def euler_to_matrix( rotation ):
+    # XYZ rotation order in degrees, matrices are row vector like Maya's
+    x, y, z = np.radians( rotation )
+
+    rotate_x = np.array( [ [ 1, 0, 0 ], [ 0, np.cos( x ), np.sin( x ) ], [ 0, -np.sin( x ), np.cos( x ) ] ] )
+    rotate_y = np.array( [ [ np.cos( y ), 0, -np.sin( y ) ], [ 0, 1, 0 ], [ np.sin( y ), 0, np.cos( y ) ] ] )
+    rotate_z = np.array( [ [ np.cos( z ), np.sin( z ), 0 ], [ -np.sin( z ), np.cos( z ), 0 ], [ 0, 0, 1 ] ] )
+
+    return rotate_x.dot( rotate_y ).dot( rotate_z )
+
+def quaternions_to_matrices( quaternions ):
+    # ( n, 4 ) xyzw quaternions to ( n, 3, 3 ) row vector matrices
+    x, y, z, w = np.asarray( quaternions, dtype = np.float64 ).T
+    matrices = np.empty( ( len( x ), 3, 3 ) )
+
+    matrices[:, 0, 0] = 1 - 2 * ( y * y + z * z )
+    matrices[:, 0, 1] = 2 * ( x * y + z * w )
+    matrices[:, 0, 2] = 2 * ( x * z - y * w )
+    matrices[:, 1, 0] = 2 * ( x * y - z * w )
+    matrices[:, 1, 1] = 1 - 2 * ( x * x + z * z )
+    matrices[:, 1, 2] = 2 * ( y * z + x * w )
+    matrices[:, 2, 0] = 2 * ( x * z + y * w )
+    matrices[:, 2, 1] = 2 * ( y * z - x * w )
+    matrices[:, 2, 2] = 1 - 2 * ( x * x + y * y )
+
+    return matrices
+
+def matrices_to_quaternions( matrices ):
+    # ( n, 3, 3 ) row vector matrices to ( n, 4 ) xyzw quaternions
+    # Shepperd's method, each row is worked out from the biggest of w, x, y and z so nothing is divided by ~0 (like at 180 degrees)
+    matrices = np.asarray( matrices, dtype = np.float64 ).reshape( -1, 3, 3 )
+    m = matrices.reshape( -1, 9 ).T
+    m00, m01, m02, m10, m11, m12, m20, m21, m22 = m
+
+    # 4 times the square of w, x, y and z
+    squares = np.stack( [ 1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22 ], axis = 1 )
+    largest = np.argmax( squares, axis = 1 )
+    s = 2 * np.sqrt( np.maximum( squares[np.arange( len( largest ) ), largest], 1e-12 ) )
+
+    # ( 4w, 4x, 4y, 4z ) times each of them, the row for the biggest one is used
+    w_row = np.stack( [ s * s / 4, m12 - m21, m20 - m02, m01 - m10 ], axis = 1 )
+    x_row = np.stack( [ m12 - m21, s * s / 4, m01 + m10, m02 + m20 ], axis = 1 )
+    y_row = np.stack( [ m20 - m02, m01 + m10, s * s / 4, m12 + m21 ], axis = 1 )
+    z_row = np.stack( [ m01 - m10, m02 + m20, m12 + m21, s * s / 4 ], axis = 1 )
+
+    wxyz = np.choose( largest[:, None], [ w_row, x_row, y_row, z_row ] ) / s[:, None]
+    quaternions = wxyz[:, [ 1, 2, 3, 0 ]]
+    quaternions /= np.linalg.norm( quaternions, axis = 1 )[:, None]
+
+    # Anything that doesn't come back the same isn't a rotation, it would be written wrong without a word
+    if len( quaternions ) > 0:
+        difference = np.abs( quaternions_to_matrices( quaternions ) - matrices ).max()
+
+        if difference > 1e-3:
+            raise ValueError( "Bone rotations don't survive conversion to quaternions (off by %g), are they scaled?" % difference )
+
+    return quaternions
+
+def compose( rotations, translations ):
+    matrices = np.tile( np.identity( 4 ), ( len( rotations ), 1, 1 ) )
+    matrices[:, :3, :3] = rotations
+    matrices[:, 3, :3] = translations
+
+    return matrices
+
+def read_array( data, dtype, count, offset ):
+    # Copy out of the memory map, views would stop it from being closed
+    return np.frombuffer( data, dtype = dtype, count = count, offset = offset ).copy()
+
+def read_string( data, offset ):
+    end = data.find( b"\0", offset )
+
+    return data[offset:end].decode( "utf-8", "replace" ), end + 1
+
+def load_semodel( path ):
+    # Reads a whole SEModel into arrays
+    with CoDCharacterToolsSE.SEModelReader( path ) as reader:
+        bones = reader.get_bones()
+        data = reader.data
+
+        bone_fields = [ ( "flags", "u1" ), ( "parent", "<i4" ) ]
+
+        if reader.bone_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_GLOBAL_MATRIX:
+            bone_fields += [ ( "global_position", "<f4", ( 3, ) ), ( "global_rotation", "<f4", ( 4, ) ) ]
+
+        if reader.bone_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_LOCAL_MATRIX:
+            bone_fields += [ ( "local_position", "<f4", ( 3, ) ), ( "local_rotation", "<f4", ( 4, ) ) ]
+
+        if reader.bone_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_SCALES:
+            bone_fields += [ ( "scale", "<f4", ( 3, ) ) ]
+
+        bone_data = read_array( data, np.dtype( bone_fields ), len( bones ), reader.bone_data_offset )
+        parents = bone_data["parent"].astype( np.int64 )
+
+        if "global_position" in bone_data.dtype.names:
+            matrices = compose( quaternions_to_matrices( bone_data["global_rotation"] ), bone_data["global_position"] )
+        else:
+            # Only local transforms, build the world ones
+            local = compose( quaternions_to_matrices( bone_data["local_rotation"] ), bone_data["local_position"] )
+            matrices = np.array( local )
+
+            for index in get_hierarchy_order( parents ):
+                if parents[index] >= 0:
+                    matrices[index] = local[index].dot( matrices[parents[index]] )
+
+        meshes = []
+
+        for mesh in reader.get_meshes():
+            vertex_count = mesh.vertex_count
+            arrays = {
+                "positions": read_array( data, "<f4", vertex_count * 3, mesh.positions_offset ).reshape( -1, 3 ),
+                "uvs": None,
+                "normals": None,
+                "colors": None,
+                "bones": np.zeros( ( vertex_count, 0 ), dtype = np.int64 ),
+                "weights": np.zeros( ( vertex_count, 0 ), dtype = np.float32 ),
+                "faces": read_array( data, "<" + mesh.face_index_format, mesh.face_count * 3, mesh.faces_offset ).reshape( -1, 3 ).astype( np.uint32 ),
+                "materials": read_array( data, "<i4", mesh.layer_count, mesh.materials_offset )
+            }
+
+            if mesh.flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_UVSET:
+                arrays["uvs"] = read_array( data, "<f4", vertex_count * mesh.layer_count * 2, mesh.uvs_offset ).reshape( vertex_count, mesh.layer_count, 2 )
+
+            if mesh.flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_NORMALS:
+                arrays["normals"] = read_array( data, "<f4", vertex_count * 3, mesh.normals_offset ).reshape( -1, 3 )
+
+            if mesh.flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_COLOR:
+                arrays["colors"] = read_array( data, "u1", vertex_count * 4, mesh.colors_offset ).reshape( -1, 4 )
+
+            if mesh.has_weights():
+                pairs = read_array( data, np.dtype( [ ( "bone", "<" + mesh.bone_index_format ), ( "weight", "<f4" ) ] ), vertex_count * mesh.max_influences, mesh.weights_offset ).reshape( vertex_count, mesh.max_influences )
+                arrays["bones"] = pairs["bone"].astype( np.int64 )
+                arrays["weights"] = pairs["weight"].copy()
+
+            meshes.append( arrays )
+
+        materials = []
+        offset = reader.materials_offset
+
+        if reader.data_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_MATERIALS:
+            for index in range( reader.material_count ):
+                material = { "name": None, "simple": False, "diffuse": "", "normal": "", "specular": "" }
+                material["name"], offset = read_string( data, offset )
+                material["simple"] = data[offset:offset + 1] != b"\0"
+                offset += 1
+
+                if material["simple"]:
+                    material["diffuse"], offset = read_string( data, offset )
+                    material["normal"], offset = read_string( data, offset )
+                    material["specular"], offset = read_string( data, offset )
+
+                materials.append( material )
+
+        return {
+            "bones": [ bone[0] for bone in bones ],
+            "parents": parents,
+            "matrices": matrices,
+            "meshes": meshes,
+            "materials": materials
+        }
+
+def write_semodel( path, model ):
+    bones = model["bones"]
+    parents = model["parents"]
+    matrices = model["matrices"]
+    meshes = model["meshes"]
+    materials = model["materials"]
+
+    mesh_flags = 0
+
+    if len( meshes ) > 0:
+        if all( [ mesh["uvs"] is not None for mesh in meshes ] ):
+            mesh_flags |= CoDCharacterToolsSE.SEMODEL_PRESENCE_UVSET
+
+        if all( [ mesh["normals"] is not None for mesh in meshes ] ):
+            mesh_flags |= CoDCharacterToolsSE.SEMODEL_PRESENCE_NORMALS
+
+        if all( [ mesh["colors"] is not None for mesh in meshes ] ):
+            mesh_flags |= CoDCharacterToolsSE.SEMODEL_PRESENCE_COLOR
+
+        mesh_flags |= CoDCharacterToolsSE.SEMODEL_PRESENCE_WEIGHTS
+
+    data_flags = CoDCharacterToolsSE.SEMODEL_PRESENCE_BONE | CoDCharacterToolsSE.SEMODEL_PRESENCE_MESH | CoDCharacterToolsSE.SEMODEL_PRESENCE_MATERIALS
+    bone_flags = CoDCharacterToolsSE.SEMODEL_PRESENCE_GLOBAL_MATRIX | CoDCharacterToolsSE.SEMODEL_PRESENCE_LOCAL_MATRIX | CoDCharacterToolsSE.SEMODEL_PRESENCE_SCALES
+
+    with open( path, "wb" ) as file:
+        file.write( b"SEModel" + struct.pack( "<2H", 1, 20 ) )
+        file.write( struct.pack( "<3B3I3x", data_flags, bone_flags, mesh_flags, len( bones ), len( meshes ), len( materials ) ) )
+
+        for name in bones:
+            file.write( name.encode( "utf-8" ) + b"\0" )
+
+        # Local matrices are relative to the parent's world matrix
+        local = np.array( matrices )
+
+        for index in range( len( bones ) ):
+            if parents[index] >= 0:
+                local[index] = matrices[index].dot( np.linalg.inv( matrices[parents[index]] ) )
+
+        bone_data = np.zeros( len( bones ), dtype = np.dtype( [ ( "flags", "u1" ), ( "parent", "<i4" ), ( "global_position", "<f4", ( 3, ) ), ( "global_rotation", "<f4", ( 4, ) ), ( "local_position", "<f4", ( 3, ) ), ( "local_rotation", "<f4", ( 4, ) ), ( "scale", "<f4", ( 3, ) ) ] ) )
+        bone_data["parent"] = parents
+
+        if len( bones ) > 0:
+            bone_data["global_position"] = matrices[:, 3, :3]
+            bone_data["global_rotation"] = matrices_to_quaternions( matrices[:, :3, :3] )
+            bone_data["local_position"] = local[:, 3, :3]
+            bone_data["local_rotation"] = matrices_to_quaternions( local[:, :3, :3] )
+            bone_data["scale"] = 1
+
+        file.write( bone_data.tobytes() )
+
+        bone_index_format = CoDCharacterToolsSE.get_index_format( len( bones ) )
+
+        for mesh in meshes:
+            vertex_count = len( mesh["positions"] )
+            influences = mesh["weights"].shape[1]
+            layers = len( mesh["materials"] )
+
+            file.write( struct.pack( "<3B2I", 0, layers, influences, vertex_count, len( mesh["faces"] ) ) )
+            file.write( np.asarray( mesh["positions"], dtype = "<f4" ).tobytes() )
+
+            if mesh_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_UVSET:
+                file.write( np.asarray( mesh["uvs"], dtype = "<f4" ).tobytes() )
+
+            if mesh_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_NORMALS:
+                file.write( np.asarray( mesh["normals"], dtype = "<f4" ).tobytes() )
+
+            if mesh_flags & CoDCharacterToolsSE.SEMODEL_PRESENCE_COLOR:
+                file.write( np.asarray( mesh["colors"], dtype = "u1" ).tobytes() )
+
+            pairs = np.zeros( ( vertex_count, influences ), dtype = np.dtype( [ ( "bone", "<" + bone_index_format ), ( "weight", "<f4" ) ] ) )
+            pairs["bone"] = mesh["bones"]
+            pairs["weight"] = mesh["weights"]
+            file.write( pairs.tobytes() )
+
+            file.write( np.asarray( mesh["faces"], dtype = "<" + CoDCharacterToolsSE.get_index_format( vertex_count ) ).tobytes() )
+            file.write( np.asarray( mesh["materials"], dtype = "<i4" ).tobytes() )
+
+        for material in materials:
+            file.write( material["name"].encode( "utf-8" ) + b"\0" )
+            file.write( struct.pack( "<B", 1 if material["simple"] else 0 ) )
+
+            if material["simple"]:
+                for key in ( "diffuse", "normal", "specular" ):
+                    file.write( material[key].encode( "utf-8" ) + b"\0" )
+
+def get_hierarchy_order( parents ):
+    # Bone indices ordered so parents always come before their children
+    children = {}
+    roots = []
+
+    for index in range( len( parents ) ):
+        if parents[index] < 0 or parents[index] >= len( parents ):
+            roots.append( index )
+        else:
+            children.setdefault( parents[index], [] ).append( index )
+
+    order = []
+    stack = list( reversed( roots ) )
+
+    while stack:
+        index = stack.pop()
+        order.append( index )
+        stack += reversed( children.get( index, [] ) )
+
+    return order
+
+def quantize_weights( weights, steps = None, limit = max_influences ):
+    # Does to a ( vertices, influences ) weight matrix what exporting does, only the heaviest limit influences are kept,
+    # renormalized and rounded to whole steps. What rounding loses goes to the weights that lost the most, so every vertex still adds up to steps
+    # Returns the integer steps in the same shape
+    if steps == None:
+        steps = weight_steps
+
+    weights = np.array( weights, dtype = np.float64 )
+
+    # Only the few vertices over the limit need sorting
+    over = np.nonzero( np.count_nonzero( weights > 0, axis = 1 ) > limit )[0]
+
+    if len( over ) > 0:
+        capped = weights[over]
+        capped[np.arange( len( over ) )[:, None], np.argsort( -capped, axis = 1 )[:, limit:]] = 0
+        weights[over] = capped
+
+    totals = weights.sum( axis = 1 )
+    weighted = totals > 0
+    scaled = weights * ( steps / np.where( weighted, totals, 1 ) )[:, None]
+    rounded = np.floor( scaled )
+
+    remainders = scaled - rounded
+    remainders[weights <= 0] = -1
+    residuals = np.where( weighted, steps - rounded.sum( axis = 1 ), 0 )
+
+    # Largest remainders first, one step each, a vertex can't be short by more steps than it has weights
+    for step in range( int( residuals.max() ) if len( residuals ) > 0 else 0 ):
+        rows = np.nonzero( residuals > step )[0]
+        largest = np.argmax( remainders[rows], axis = 1 )
+        rounded[rows, largest] += 1
+        remainders[rows, largest] = -1
+
+    return rounded.astype( np.uint16 if steps > 255 else np.uint8 )
+
+def collapse_weights( bones, weights, remap, limit = max_influences ):
+    # Moves every influence through remap (old bone -> new bone, -1 drops it), sums the ones
+    # that end up on the same bone and repacks them heaviest first, renormalized
+    vertex_count = len( bones )
+
+    if vertex_count == 0 or bones.shape[1] == 0:
+        return np.zeros( ( vertex_count, 0 ), dtype = np.int64 ), np.zeros( ( vertex_count, 0 ), dtype = np.float32 )
+
+    vertices = np.repeat( np.arange( vertex_count ), bones.shape[1] )
+    targets = remap[bones.ravel()]
+    values = weights.ravel().astype( np.float64 )
+
+    keep = ( targets >= 0 ) & ( values > 0 )
+    vertices, targets, values = vertices[keep], targets[keep], values[keep]
+
+    # Sum duplicates
+    keys = vertices * ( len( remap ) + 1 ) + targets
+    keys, inverse = np.unique( keys, return_inverse = True )
+    values = np.bincount( inverse, weights = values )
+    vertices = keys // ( len( remap ) + 1 )
+    targets = keys % ( len( remap ) + 1 )
+
+    # Heaviest first per vertex, then drop anything past the limit
+    order = np.lexsort( ( -values, vertices ) )
+    vertices, targets, values = vertices[order], targets[order], values[order]
+
+    starts = np.searchsorted( vertices, np.arange( vertex_count ) )
+    slots = np.arange( len( vertices ) ) - starts[vertices]
+    keep = slots < limit
+    vertices, targets, values, slots = vertices[keep], targets[keep], values[keep], slots[keep]
+
+    totals = np.bincount( vertices, weights = values, minlength = vertex_count )
+    width = int( slots.max() ) + 1 if len( slots ) > 0 else 0
+
+    new_bones = np.zeros( ( vertex_count, width ), dtype = np.int64 )
+    new_weights = np.zeros( ( vertex_count, width ), dtype = np.float32 )
+    new_bones[vertices, slots] = targets
+    new_weights[vertices, slots] = values / totals[vertices]
+
+    return new_bones, new_weights
+
+def merge_parts( models ):
+    # Same idea as rig_combiner, one skeleton with every unique bone name and all the meshes bound to it
+    names = []
+    parent_names = []
+    matrices = []
+    indices = {}
+
+    # Bones parented to tag_origin first, those have the correct rotations
+    for first_pass in ( True, False ):
+        for model in models:
+            for index in range( len( model["bones"] ) ):
+                name = model["bones"][index]
+                parent = model["parents"][index]
+                parent_name = model["bones"][parent] if parent >= 0 else None
+
+                if name in indices:
+                    continue
+
+                if first_pass and parent_name != "tag_origin":
+                    continue
+
+                indices[name] = len( names )
+                names.append( name )
+                parent_names.append( parent_name )
+                matrices.append( model["matrices"][index] )
+
+    materials = []
+    material_indices = {}
+    meshes = []
+
+    for model in models:
+        remap = np.array( [ indices[name] for name in model["bones"] ] + [ -1 ], dtype = np.int64 )
+        material_remap = []
+        part_meshes = [ dict( mesh ) for mesh in model["meshes"] ]
+
+        # A part whose shared bones are somewhere else in the merged skeleton is moved onto it, like rotate_models does in Maya
+        merged = np.array( [ matrices[indices[name]] for name in model["bones"] ] ).reshape( -1, 4, 4 )
+
+        if not np.allclose( merged, model["matrices"], atol = 1e-4 ):
+            skin_meshes( { "bones": model["bones"], "matrices": merged, "meshes": part_meshes }, model["matrices"] )
+
+        for material in model["materials"]:
+            if material["name"] not in material_indices:
+                material_indices[material["name"]] = len( materials )
+                materials.append( material )
+
+            material_remap.append( material_indices[material["name"]] )
+
+        for mesh in part_meshes:
+            mesh["bones"] = remap[mesh["bones"]] if mesh["bones"].size > 0 else mesh["bones"]
+            mesh["materials"] = np.array( [ material_remap[index] if 0 <= index < len( material_remap ) else index for index in mesh["materials"] ], dtype = np.int32 )
+            meshes.append( mesh )
+
+    return {
+        "bones": names,
+        "parents": np.array( [ indices.get( name, -1 ) if name != None else -1 for name in parent_names ], dtype = np.int64 ),
+        "matrices": np.array( matrices ).reshape( -1, 4, 4 ),
+        "meshes": meshes,
+        "materials": materials
+    }
+
+def load_target_rig( path ):
+    # Joint tables written by CoDCharacterTools.get_target_rig
+    with open( path, "r" ) as file:
+        target_rig = json.load( file )
+
+    return target_rig["source"], target_rig["joints"]
+
+def get_target_matrices( target_rig ):
+    # World matrices for the target joints with their rotations zeroed, so only translate and jointOrient count
+    joints = dict( ( joint["name"], joint ) for joint in target_rig )
+    matrices = {}
+
+    def get_matrix( name ):
+        if name not in matrices:
+            joint = joints[name]
+            local = compose( [ euler_to_matrix( ( joint["jointOrientX"], joint["jointOrientY"], joint["jointOrientZ"] ) ) ], [ ( joint["translateX"], joint["translateY"], joint["translateZ"] ) ] )[0]
+
+            if joint["parent"] in joints:
+                matrices[name] = local.dot( get_matrix( joint["parent"] ) )
+            else:
+                matrices[name] = local
+
+        return matrices[name]
+
+    for name in joints:
+        get_matrix( name )
+
+    return matrices
+
+def get_descendants( parents, index ):
+    descendants = []
+    stack = [ index ]
+
+    while stack:
+        current = stack.pop()
+
+        for child in np.nonzero( parents == current )[0]:
+            descendants.append( child )
+            stack.append( child )
+
+    return descendants
+
+def skin_meshes( model, old_matrices ):
+    # Makes the meshes follow the bones from old_matrices to the current ones
+    deltas = np.array( [ np.linalg.inv( old_matrices[index] ).dot( model["matrices"][index] ) for index in range( len( model["bones"] ) ) ] ).reshape( -1, 4, 4 )
+
+    for mesh in model["meshes"]:
+        if mesh["weights"].shape[1] == 0:
+            continue
+
+        # Blend the deltas per vertex, ( v, 4, 4 )
+        blended = np.einsum( "vk,vkij->vij", mesh["weights"], deltas[mesh["bones"]] )
+        positions = np.concatenate( [ mesh["positions"], np.ones( ( len( mesh["positions"] ), 1 ) ) ], axis = 1 )
+        mesh["positions"] = np.einsum( "vi,vij->vj", positions, blended )[:, :3].astype( np.float32 )
+
+        if mesh["normals"] is not None:
+            normals = np.einsum( "vi,vij->vj", mesh["normals"], blended[:, :3, :3] )
+            lengths = np.linalg.norm( normals, axis = 1 )[:, None]
+            mesh["normals"] = ( normals / np.where( lengths > 0, lengths, 1 ) ).astype( np.float32 )
+
+def remove_bones( model, remove, folds ):
+    # Removes bones, their weights go to folds[bone] if given, otherwise they're dropped and the rest renormalized
+    keep = [ index for index in range( len( model["bones"] ) ) if index not in remove ]
+    new_indices = np.full( len( model["bones"] ), -1, dtype = np.int64 )
+    new_indices[keep] = np.arange( len( keep ) )
+
+    remap = np.array( new_indices )
+
+    for index in remove:
+        target = folds.get( index, -1 )
+
+        # The fold target might be going too, keep walking up
+        while target >= 0 and target in remove:
+            target = folds.get( target, -1 )
+
+        remap[index] = new_indices[target] if target >= 0 else -1
+
+    for mesh in model["meshes"]:
+        mesh["bones"], mesh["weights"] = collapse_weights( mesh["bones"], mesh["weights"], remap )
+
+    parents = model["parents"]
+    new_parents = []
+
+    for index in keep:
+        # Find the closest ancestor that's staying
+        parent = parents[index]
+
+        while parent >= 0 and parent in remove:
+            parent = parents[parent]
+
+        new_parents.append( new_indices[parent] if parent >= 0 else -1 )
+
+    model["bones"] = [ model["bones"][index] for index in keep ]
+    model["parents"] = np.array( new_parents, dtype = np.int64 )
+    model["matrices"] = model["matrices"][keep]
+
+def get_weighted_bones( model ):
+    weighted = set()
+
+    for mesh in model["meshes"]:
+        weighted.update( np.unique( mesh["bones"][mesh["weights"] > 0] ).tolist() )
+
+    return weighted
+
+def convert( model, target_rig, profile ):
+    # Mirrors rig_converter on a merged model, following the target rig's conversion profile
+    target = dict( ( joint["name"], joint ) for joint in target_rig )
+    target_matrices = get_target_matrices( target_rig )
+
+    # Rename joints
+    model["bones"] = [ profile["rename_joints"].get( name, name ) for name in model["bones"] ]
+
+    indices = dict( ( model["bones"][index], index ) for index in range( len( model["bones"] ) ) )
+
+    # Only keep part of the skeleton, viewhands only keep the arms and the clavicle weights go to the shoulders
+    keep_roots = profile["keep_only_under"]
+    fold_joints = profile["fold_joints"]
+
+    if len( keep_roots ) > 0 and all( [ name in indices for name in list( keep_roots ) + list( fold_joints ) + list( fold_joints.values() ) ] ):
+        keep = set()
+
+        for root in keep_roots:
+            keep.add( indices[root] )
+            keep.update( get_descendants( model["parents"], indices[root] ) )
+            model["parents"][indices[root]] = -1
+
+        folds = dict( ( indices[name], indices[fold_joints[name]] ) for name in fold_joints )
+        remove_bones( model, set( range( len( model["bones"] ) ) ) - keep, folds )
+        indices = dict( ( model["bones"][index], index ) for index in range( len( model["bones"] ) ) )
+
+    # Create the target joints we don't have, we don't need all of the T7 face joints
+    created = [ joint["name"] for joint in target_rig if joint["name"] not in indices and joint["parent"] not in profile["skip_children_of"] ]
+
+    names = model["bones"] + created
+    indices = dict( ( names[index], index ) for index in range( len( names ) ) )
+    source_parents = [ model["bones"][parent] if parent >= 0 else None for parent in model["parents"] ]
+
+    # Target joints take the target positions, the mesh stays where it is like moveJointsMode
+    matrices = np.concatenate( [ model["matrices"], np.tile( np.identity( 4 ), ( len( created ), 1, 1 ) ) ] )
+
+    for name in names:
+        if name in target_matrices:
+            matrix = np.array( target_matrices[name] )
+
+            # Eyes stay where the source had them
+            if any( [ pattern in name for pattern in profile["keep_source_position"] ] ) and name in model["bones"]:
+                matrix[3, :3] = matrices[indices[name]][3, :3]
+
+            matrices[indices[name]] = matrix
+
+    parents = []
+
+    for index in range( len( names ) ):
+        name = names[index]
+
+        if name in target:
+            parent = target[name]["parent"]
+        else:
+            parent = source_parents[index]
+
+            # For fullbody, the head joints need to be under "head" instead of "j_head"
+            parent = profile["reparent_source"].get( parent, parent )
+
+        parents.append( indices.get( parent, -1 ) )
+
+    model["bones"] = names
+    model["parents"] = np.array( parents, dtype = np.int64 )
+    model["matrices"] = matrices
+
+    # Get rid of useless non-t7 leaf joints with no weights
+    weighted = get_weighted_bones( model )
+    useless = set( [ index for index in range( len( names ) ) if names[index] not in target and index not in weighted and not np.any( model["parents"] == index ) ] )
+    remove_bones( model, useless, {} )
+
+    # Profile attributes like the viewhands offsets, these move the mesh with them
+    if len( profile["attributes"] ) > 0:
+        old_matrices = np.array( model["matrices"] )
+        indices = dict( ( model["bones"][index], index ) for index in range( len( model["bones"] ) ) )
+
+        for name in sorted( profile["attributes"] ):
+            if name not in indices:
+                continue
+
+            # Rotations are zeroed, so only translate and jointOrient mean anything here
+            attributes = profile["attributes"][name]
+            index = indices[name]
+            parent = model["parents"][index]
+            parent_matrix = model["matrices"][parent] if parent >= 0 else np.identity( 4 )
+            local = model["matrices"][index].dot( np.linalg.inv( parent_matrix ) )
+
+            if "translate" in attributes:
+                local[3, :3] = attributes["translate"]
+
+            if "jointOrient" in attributes:
+                local[:3, :3] = euler_to_matrix( attributes["jointOrient"] )
+
+            # Move it and everything under it
+            new_matrix = local.dot( parent_matrix )
+            change = np.linalg.inv( model["matrices"][index] ).dot( new_matrix )
+
+            for descendant in [ index ] + get_descendants( model["parents"], index ):
+                model["matrices"][descendant] = model["matrices"][descendant].dot( change ) if descendant != index else new_matrix
+
+        skin_meshes( model, old_matrices )
+
+    # Joints that aren't in the target but still have weights, their weights go up to the closest parent
+    indices = dict( ( model["bones"][index], index ) for index in range( len( model["bones"] ) ) )
+
+    under = profile["remove_weighted_under"]
+
+    if len( under ) > 0 and all( [ name in indices for name in under ] ):
+        below = set()
+
+        for name in under:
+            below.update( get_descendants( model["parents"], indices[name] ) )
+
+        remove = set()
+
+        for index in range( len( model["bones"] ) ):
+            if model["bones"][index] not in target:
+                # For viewhands, get rid of everything that isn't a t7 joint, for fullbody only what's under the wrists
+                if profile["remove_all_weighted"] or index in below:
+                    remove.add( index )
+
+        folds = dict( ( index, model["parents"][index] ) for index in remove )
+        remove_bones( model, remove, folds )
+
+    # Parents have to come first in the file
+    order = get_hierarchy_order( model["parents"] )
+    position = np.empty( len( order ), dtype = np.int64 )
+    position[order] = np.arange( len( order ) )
+    remap = np.append( position, -1 )
+
+    model["bones"] = [ model["bones"][index] for index in order ]
+    model["parents"] = remap[model["parents"][order]]
+    model["matrices"] = model["matrices"][order]
+
+    for mesh in model["meshes"]:
+        mesh["bones"] = remap[mesh["bones"]] if mesh["bones"].size > 0 else mesh["bones"]
+
+    return model
+
+def convert_files( target_rig_path, output_path, part_paths ):
+    # One character, every part is merged, converted and written to output_path
+    target_rig = load_target_rig( target_rig_path )[1]
+    profile = CoDCharacterToolsProfile.load_profile( target_rig_path )
+    model = merge_parts( [ load_semodel( path ) for path in part_paths ] )
+    model = convert( model, target_rig, profile )
+
+    if not os.path.isdir( os.path.dirname( os.path.abspath( output_path ) ) ):
+        os.makedirs( os.path.dirname( os.path.abspath( output_path ) ) )
+
+    write_semodel( output_path, model )
+
+    return output_path, len( model["bones"] ), sum( [ len( mesh["positions"] ) for mesh in model["meshes"] ] )
+
+def convert_files_job( arguments ):
+    # Pool workers only get one argument, errors come back as results so one bad model doesn't stop the rest
+    try:
+        return convert_files( *arguments ), None
+    except Exception as exception:
+        return ( arguments[1], 0, 0 ), str( exception )
+
+def convert_folder( target_rig_path, input_directory, output_directory, processes = None ):
+    # Every folder with SEModels in it is one character, they're converted in parallel
+    jobs = []
+
+    for root, directories, files in os.walk( input_directory ):
+        directories.sort()
+        paths = [ os.path.join( root, file ) for file in sorted( files ) if file.lower().endswith( ".semodel" ) ]
+
+        if len( paths ) > 0:
+            name = os.path.relpath( root, input_directory )
+            name = os.path.basename( os.path.abspath( input_directory ) ) if name == "." else name.replace( os.sep, "_" )
+            jobs.append( ( target_rig_path, os.path.join( output_directory, name + ".semodel" ), paths ) )
+
+    pool = multiprocessing.Pool( processes )
+
+    try:
+        return pool.map( convert_files_job, jobs )
+    finally:
+        pool.close()
+        pool.join()
+
+def main( arguments ):
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Convert SEModels to a target rig without Maya." )
+    parser.add_argument( "target_rig", help = "Target rig joint table (.rig.json)" )
+    parser.add_argument( "inputs", nargs = "+", help = "SEModel parts of one character, or a folder of characters with --batch" )
+    parser.add_argument( "--output", "-o", required = True, help = "Output SEModel, or output folder with --batch" )
+    parser.add_argument( "--batch", action = "store_true", help = "Convert every folder of SEModels under the input folder" )
+    parser.add_argument( "--processes", type = int, default = None, help = "Worker processes for --batch (default: one per CPU)" )
+    options = parser.parse_args( arguments )
+
+    # Writing over what's being converted would lose the originals
+    for path in options.inputs:
+        if os.path.abspath( path ) == os.path.abspath( options.output ):
+            parser.error( "the output can't be one of the inputs: " + path )
+
+    if options.batch:
+        results = []
+
+        for directory in options.inputs:
+            results += convert_folder( options.target_rig, directory, options.output, options.processes )
+    else:
+        results = [ convert_files_job( ( options.target_rig, options.output, options.inputs ) ) ]
+
+    failed = 0
+
+    for ( path, bones, vertices ), problem in results:
+        if problem != None:
+            failed += 1
+            print( "%s: failed, %s" % ( path, problem ) )
+        else:
+            print( "%s: %d bones, %d vertices" % ( path, bones, vertices ) )
+
+    return 1 if failed > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit( main( sys.argv[1:] ) )
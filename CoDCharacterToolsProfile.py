@@ -0,0 +1,397 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Conversion profiles, the rules rig_converter follows for a target rig
+#
+# A profile lives next to the target rig, fb_t9_male.mb uses fb_t9_male.profile.json
+# and falls back to fb.profile.json for its type if it doesn't have one. Profiles can
+# extend another one and only change what's different.
+#
+# compile_plan turns a profile, the joints in the scene and the target rig into the
+# list of steps the conversion takes, so it can be looked at before anything changes.
+
+import json
+import os
+
+profile_version = 1
+
+# Everything a profile can set, and what it is when it doesn't
+default_profile = {
+    # Source joint: target joint
+    "rename_joints": {},
+    # Only these joints and what's under them are kept, the fold joints are deleted first so their weights aren't lost
+    # { fold joint: joint its weights go to }, Maya's Delete decides that inside Maya
+    "keep_only_under": [],
+    "fold_joints": {},
+    # Target joints under these aren't created
+    "skip_children_of": [],
+    # Source joints under the first joint go under the second one
+    "reparent_source": {},
+    # Target joints with any of these in their name stay where the source has them
+    "keep_source_position": [],
+    # { joint: { attribute: value } } set after the conversion, these move the mesh with them
+    "attributes": {},
+    # Joint that goes in the "Joints" group
+    "root": None,
+    # Set as the cosmetic parent in CoDMayaTools
+    "cosmetic_parent": None,
+    # Non target joints with weights under these are deleted, their weights go up to the closest parent
+    # With remove_all_weighted they're all deleted, as long as these joints exist
+    "remove_weighted_under": [],
+    "remove_all_weighted": False
+}
+
+class ProfileError( Exception ):
+    pass
+
+def get_profile_path( rig_path ):
+    # fb_t9_male.mb and fb_t9_male.rig.json both use fb_t9_male.profile.json
+    if rig_path.endswith( ".rig.json" ):
+        return rig_path[:-len( ".rig.json" )] + ".profile.json"
+
+    return os.path.splitext( rig_path )[0] + ".profile.json"
+
+def merge_setting( base, value ):
+    # Dicts are merged with what they extend, so a profile can change one rename without repeating the rest, null removes an entry
+    # Anything else (lists included) replaces it
+    if not isinstance( base, dict ) or not isinstance( value, dict ):
+        return value
+
+    merged = dict( base )
+
+    for key in value:
+        if value[key] == None:
+            merged.pop( key, None )
+        else:
+            merged[key] = merge_setting( merged.get( key ), value[key] )
+
+    return merged
+
+def read_profile( path, depth = 0 ):
+    try:
+        with open( path, "r" ) as file:
+            data = json.load( file )
+    except ( IOError, OSError, ValueError ) as exception:
+        raise ProfileError( "Couldn't read " + os.path.basename( path ) + ": " + str( exception ) )
+
+    if data.get( "version", 1 ) > profile_version:
+        raise ProfileError( os.path.basename( path ) + " was made for a newer version of CoDCharacterTools." )
+
+    unknown = [ key for key in data if key not in default_profile and key not in ( "version", "extends" ) ]
+
+    if len( unknown ) > 0:
+        raise ProfileError( os.path.basename( path ) + " has settings that don't exist: " + ", ".join( sorted( unknown ) ) )
+
+    profile = dict( default_profile )
+
+    if "extends" in data:
+        if depth > 8:
+            raise ProfileError( os.path.basename( path ) + " extends too many profiles, do two of them extend each other?" )
+
+        profile.update( read_profile( os.path.join( os.path.dirname( path ), data["extends"] ), depth + 1 ) )
+
+    for key in data:
+        if key in default_profile:
+            profile[key] = merge_setting( profile[key], data[key] )
+
+    return profile
+
+def load_profile( rig_path ):
+    # The rig's own profile, then the one for its type, then one that does nothing but follow the target rig
+    path = get_profile_path( rig_path )
+
+    if not os.path.isfile( path ):
+        path = os.path.join( os.path.dirname( path ), os.path.basename( path ).split( "_" )[0].split( "." )[0] + ".profile.json" )
+
+    if not os.path.isfile( path ):
+        return dict( default_profile )
+
+    return read_profile( path )
+
+def get_parent( joint ):
+    # Joints directly under a "Joints" group are roots
+    if joint["parent"] == None or "Joints" in joint["parent"]:
+        return None
+
+    return joint["parent"].split( "|" )[-1].split( ":" )[-1]
+
+def get_descendants( parents, roots ):
+    children = {}
+
+    for name, parent in parents.items():
+        children.setdefault( parent, [] ).append( name )
+
+    descendants = set()
+    stack = list( roots )
+
+    while len( stack ) > 0:
+        for child in children.get( stack.pop(), [] ):
+            if child not in descendants:
+                descendants.add( child )
+                stack.append( child )
+
+    return descendants
+
+def is_same( current, value ):
+    return current != None and all( [ abs( current[index] - value[index] ) < 1e-6 for index in range( len( value ) ) ] )
+
+def compile_plan( profile, source_rig, target_rig, influences ):
+    # Returns the steps the conversion takes as ( step, arguments... ), only what actually changes something is in it
+    #   source_rig: get_joints_with_attributes() for the scene, before anything is done
+    #   target_rig: the target rig's joints
+    #   influences: names of every joint that's an influence of a skincluster
+    plan = []
+
+    joints = dict( ( joint["name"], joint ) for joint in source_rig )
+    parents = dict( ( joint["name"], get_parent( joint ) ) for joint in source_rig )
+    grouped = set( [ joint["name"] for joint in source_rig if get_parent( joint ) == None and joint["parent"] != None and "Joints" in joint["parent"] ] )
+    order = [ joint["name"] for joint in source_rig ]
+    target = dict( ( joint["name"], joint ) for joint in target_rig )
+
+    def rename( old, new ):
+        joints[new] = dict( joints.pop( old ), name = new )
+        parents[new] = parents.pop( old )
+        order[order.index( old )] = new
+
+        if old in grouped:
+            grouped.discard( old )
+            grouped.add( new )
+
+        for name in parents:
+            if parents[name] == old:
+                parents[name] = new
+
+    # Renames, unless it would clash with a joint that's already there
+    for old, new in sorted( profile["rename_joints"].items() ):
+        if old in parents and new not in parents:
+            plan.append( ( "rename", old, new ) )
+            rename( old, new )
+
+    # Joints whose local transforms we won't know, parenting keeps them where they are in world space
+    unknown = set()
+
+    # Only keep part of the skeleton, viewhands only need the arms
+    keep = profile["keep_only_under"]
+    folds = profile["fold_joints"]
+
+    if len( keep ) > 0 and all( [ name in parents for name in list( keep ) + list( folds ) + list( folds.values() ) ] ):
+        plan.append( ( "isolate", list( keep ), dict( folds ) ) )
+        kept = get_descendants( parents, keep ) | set( keep )
+
+        for name in list( parents ):
+            if name not in kept:
+                joints.pop( name )
+                parents.pop( name )
+                order.remove( name )
+                grouped.discard( name )
+
+        for name in keep:
+            parents[name] = None
+            grouped.add( name )
+            unknown.add( name )
+
+    existing = set( parents )
+
+    # Target joints that don't exist yet, unless they're under a joint we skip or one that won't exist
+    created = []
+    changed = True
+
+    while changed:
+        changed = False
+
+        for joint in target_rig:
+            name = joint["name"]
+            parent = get_parent( joint )
+
+            if name in existing or name in created or parent in profile["skip_children_of"]:
+                continue
+
+            if parent == None or parent in existing or parent in created:
+                created.append( name )
+                changed = True
+
+    final = existing | set( created )
+
+    # Where everything ends up, target joints follow the target rig and the rest keep their source parent
+    desired = {}
+
+    for name in order + created:
+        if name in target:
+            parent = get_parent( target[name] )
+        else:
+            parent = parents[name]
+            parent = profile["reparent_source"].get( parent, parent )
+
+        desired[name] = parent if parent in final else None
+
+    # Leaf joints that aren't in the target and have no weights, these go before anything is moved
+    has_children = set( [ desired[name] for name in desired if desired[name] != None ] )
+    useless = [ name for name in order if name not in target and name not in has_children and name not in influences ]
+
+    if len( useless ) > 0:
+        plan.append( ( "delete", useless ) )
+        final -= set( useless )
+        order = [ name for name in order if name not in useless ]
+
+    # Target joints get new transforms, so anything that isn't a target joint comes off them first to stay where it is
+    moving = final & set( target )
+    plan.append( ( "move_joints", True ) )
+    unparent = []
+
+    for name in order:
+        if name in target:
+            if parents[name] != None and parents[name] != desired[name]:
+                unparent.append( name )
+        elif parents[name] != None and ( parents[name] in moving or parents[name] != desired[name] ):
+            unparent.append( name )
+
+    if len( unparent ) > 0:
+        plan.append( ( "unparent", unparent ) )
+
+    if len( created ) > 0:
+        plan.append( ( "create", created ) )
+
+    # Parents are grouped so each one is a single parent call
+    def add_parents( names ):
+        by_parent = {}
+        parent_order = []
+
+        for name in names:
+            if desired[name] not in by_parent:
+                parent_order.append( desired[name] )
+
+            by_parent.setdefault( desired[name], [] ).append( name )
+
+        for parent in parent_order:
+            plan.append( ( "parent", by_parent[parent], parent ) )
+
+    unparented = set( unparent )
+    reparented = [ joint["name"] for joint in target_rig if joint["name"] in final and desired[joint["name"]] != None and ( joint["name"] in unparented or joint["name"] in created or parents.get( joint["name"] ) != desired[joint["name"]] ) ]
+    add_parents( reparented )
+    unknown |= unparented | set( reparented )
+
+    # Local transforms we know, so setting something that's already right can be skipped
+    values = {}
+
+    for name in order:
+        if name not in unknown:
+            for attribute in ( "translate", "rotate", "jointOrient" ):
+                values[( name, attribute )] = ( joints[name][attribute + "X"], joints[name][attribute + "Y"], joints[name][attribute + "Z"] )
+
+    for name in created:
+        for attribute in ( "translate", "rotate", "jointOrient" ):
+            values[( name, attribute )] = ( 0, 0, 0 )
+
+    # Target transforms
+    for joint in target_rig:
+        name = joint["name"]
+
+        if name not in final:
+            continue
+
+        for attribute in ( "translate", "rotate", "jointOrient" ):
+            value = ( joint[attribute + "X"], joint[attribute + "Y"], joint[attribute + "Z"] )
+
+            if not is_same( values.get( ( name, attribute ) ), value ):
+                plan.append( ( "set", name, attribute, value ) )
+
+            values[( name, attribute )] = value
+
+    add_parents( [ name for name in order if name not in target and name in unparented and desired[name] != None ] )
+
+    # Joints that stay where the source had them
+    for name in order:
+        if any( [ pattern in name for pattern in profile["keep_source_position"] ] ) and desired.get( name ) != None:
+            plan.append( ( "move", name, ( joints[name]["translateXWorld"], joints[name]["translateYWorld"], joints[name]["translateZWorld"] ) ) )
+            values.pop( ( name, "translate" ), None )
+
+    plan.append( ( "move_joints", False ) )
+
+    # From here on the mesh moves with the joints, rotations are zeroed and then the profile's attributes are set
+    poses = []
+    pose_values = {}
+
+    for name in order + created:
+        if name in final:
+            poses.append( ( name, "rotate" ) )
+            pose_values[( name, "rotate" )] = ( 0, 0, 0 )
+
+    for name in sorted( profile["attributes"] ):
+        if name in final:
+            for attribute in sorted( profile["attributes"][name] ):
+                if ( name, attribute ) not in pose_values:
+                    poses.append( ( name, attribute ) )
+
+                pose_values[( name, attribute )] = tuple( profile["attributes"][name][attribute] )
+
+    # Only the last value for an attribute counts, and only if it changes something
+    for name, attribute in poses:
+        if not is_same( values.get( ( name, attribute ) ), pose_values[( name, attribute )] ):
+            plan.append( ( "pose", name, attribute, pose_values[( name, attribute )] ) )
+
+    root = profile["root"]
+
+    if root != None and root in final and not ( root in grouped and root not in unparented ):
+        plan.append( ( "parent", [ root ], "Joints" ) )
+
+    if profile["cosmetic_parent"] != None and profile["cosmetic_parent"] in final:
+        plan.append( ( "cosmetic_parent", profile["cosmetic_parent"] ) )
+
+    # Joints that aren't in the target but still have weights
+    under = profile["remove_weighted_under"]
+
+    if len( under ) > 0 and all( [ name in final for name in under ] ):
+        below = get_descendants( dict( ( name, desired[name] ) for name in final ), under )
+        remove = [ name for name in order if name in final and name not in target and ( profile["remove_all_weighted"] or name in below ) ]
+
+        if len( remove ) > 0:
+            plan.append( ( "remove_weighted", remove ) )
+
+    return plan
+
+def format_plan( plan ):
+    lines = []
+
+    for step in plan:
+        if step[0] == "rename":
+            lines.append( "rename    %s -> %s" % ( step[1], step[2] ) )
+        elif step[0] == "isolate":
+            lines.append( "isolate   keep %s, fold %s" % ( ", ".join( step[1] ), ", ".join( [ name + " into " + step[2][name] for name in sorted( step[2] ) ] ) ) )
+        elif step[0] == "move_joints":
+            lines.append( "%s" % ( "move joints mode on" if step[1] else "move joints mode off" ) )
+        elif step[0] in ( "unparent", "create", "delete", "remove_weighted" ):
+            lines.append( "%-9s %s" % ( step[0].replace( "_weighted", "" ), ", ".join( step[1] ) ) )
+        elif step[0] == "parent":
+            lines.append( "parent    %s under %s" % ( ", ".join( step[1] ), step[2] ) )
+        elif step[0] in ( "set", "pose" ):
+            lines.append( "%-9s %s.%s = %s" % ( step[0], step[1], step[2], ", ".join( [ "%g" % value for value in step[3] ] ) ) )
+        elif step[0] == "move":
+            lines.append( "move      %s to %s" % ( step[1], ", ".join( [ "%g" % value for value in step[2] ] ) ) )
+        elif step[0] == "cosmetic_parent":
+            lines.append( "cosmetic  %s is the cosmetic parent" % step[1] )
+
+    return "\n".join( lines )
+
+def get_plan_summary( plan ):
+    # How many of each step there are, counting joints for the steps that take a list
+    counts = {}
+
+    for step in plan:
+        if step[0] in ( "unparent", "create", "delete", "remove_weighted", "parent" ):
+            counts[step[0]] = counts.get( step[0], 0 ) + len( step[1] )
+        elif step[0] != "move_joints":
+            counts[step[0]] = counts.get( step[0], 0 ) + 1
+
+    return counts
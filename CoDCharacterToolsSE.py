@@ -0,0 +1,551 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Reads SEModel and SEAnim files without Maya, so they can be checked before importing them
+#
+# Only what's asked for gets parsed, the file is memory mapped and mesh data is skipped
+# over by size, so even very big models only cost what the header and bone table cost.
+# SEAnims only ever have their header and bone names read.
+#
+# From the command line:
+#   python CoDCharacterToolsSE.py path/to/exports
+
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+
+# Data presence flags
+SEMODEL_PRESENCE_BONE = 1 << 0
+SEMODEL_PRESENCE_MESH = 1 << 1
+SEMODEL_PRESENCE_MATERIALS = 1 << 2
+
+# Bone data presence flags
+SEMODEL_PRESENCE_GLOBAL_MATRIX = 1 << 0
+SEMODEL_PRESENCE_LOCAL_MATRIX = 1 << 1
+SEMODEL_PRESENCE_SCALES = 1 << 2
+
+# Mesh data presence flags
+SEMODEL_PRESENCE_UVSET = 1 << 0
+SEMODEL_PRESENCE_NORMALS = 1 << 1
+SEMODEL_PRESENCE_COLOR = 1 << 2
+SEMODEL_PRESENCE_WEIGHTS = 1 << 3
+
+# Same limit set_skincluster_attributes uses in CoDCharacterTools
+max_influences = 15
+
+# Vertices per chunk when scanning weights, keeps memory use flat on big models
+weight_chunk_size = 65536
+
+# Bones that tell fullbody and viewmodel animations apart
+fullbody_bones = ( "j_mainroot", "j_hip_le", "j_hip_ri" )
+viewmodel_bones = ( "tag_view", "tag_torso" )
+
+# Bump this when the index entries change, older indexes get rebuilt
+seanim_index_version = 1
+
+class SEModelError( Exception ):
+    pass
+
+class SEAnimError( Exception ):
+    pass
+
+def get_index_format( count ):
+    # Bone and vertex indices are stored as small as their count allows
+    if count <= 0xFF:
+        return "B"
+    elif count <= 0xFFFF:
+        return "H"
+
+    return "I"
+
+class SEModelMesh( object ):
+    # Sizes and offsets of one mesh, nothing is read until it's asked for
+    def __init__( self, reader, offset ):
+        flags, self.layer_count, self.max_influences, self.vertex_count, self.face_count = struct.unpack_from( "<3B2I", reader.data, offset )
+
+        self.reader = reader
+        self.flags = reader.mesh_flags
+        self.bone_index_format = get_index_format( reader.bone_count )
+        self.face_index_format = get_index_format( self.vertex_count )
+
+        offset += 11
+        self.positions_offset = offset
+        offset += self.vertex_count * 12
+
+        if self.flags & SEMODEL_PRESENCE_UVSET:
+            self.uvs_offset = offset
+            offset += self.vertex_count * self.layer_count * 8
+
+        if self.flags & SEMODEL_PRESENCE_NORMALS:
+            self.normals_offset = offset
+            offset += self.vertex_count * 12
+
+        if self.flags & SEMODEL_PRESENCE_COLOR:
+            self.colors_offset = offset
+            offset += self.vertex_count * 4
+
+        self.weights_offset = offset
+
+        if self.flags & SEMODEL_PRESENCE_WEIGHTS:
+            offset += self.vertex_count * self.max_influences * ( struct.calcsize( "<" + self.bone_index_format ) + 4 )
+
+        self.faces_offset = offset
+        offset += self.face_count * 3 * struct.calcsize( "<" + self.face_index_format )
+
+        self.materials_offset = offset
+        offset += self.layer_count * 4
+
+        self.end_offset = offset
+
+        if self.end_offset > len( reader.data ):
+            raise SEModelError( reader.path + " is truncated." )
+
+    def has_weights( self ):
+        return bool( self.flags & SEMODEL_PRESENCE_WEIGHTS ) and self.max_influences > 0
+
+    def iter_weights( self, chunk_size = weight_chunk_size ):
+        # Yields ( first vertex, [ ( ( bone, weight ), ... ) per vertex ] ) a chunk at a time
+        if not self.has_weights():
+            return
+
+        pair_format = self.bone_index_format + "f"
+        pair_size = struct.calcsize( "<" + pair_format )
+        vertex_size = pair_size * self.max_influences
+
+        for first in range( 0, self.vertex_count, chunk_size ):
+            count = min( chunk_size, self.vertex_count - first )
+            values = struct.unpack_from( "<" + pair_format * ( self.max_influences * count ), self.reader.data, self.weights_offset + first * vertex_size )
+            step = self.max_influences * 2
+
+            yield first, [ list( zip( values[index:index + step:2], values[index + 1:index + step:2] ) ) for index in range( 0, len( values ), step ) ]
+
+    def get_influence_stats( self, chunk_size = weight_chunk_size ):
+        # Returns ( most influences on a single vertex, set of bone indices with weight )
+        most = 0
+        bones = set()
+
+        if not self.has_weights():
+            return most, bones
+
+        pair_format = self.bone_index_format + "f"
+        vertex_size = struct.calcsize( "<" + pair_format ) * self.max_influences
+        step = self.max_influences * 2
+
+        for first in range( 0, self.vertex_count, chunk_size ):
+            count = min( chunk_size, self.vertex_count - first )
+            values = struct.unpack_from( "<" + pair_format * ( self.max_influences * count ), self.reader.data, self.weights_offset + first * vertex_size )
+
+            # Work a slot at a time rather than a vertex at a time, the slicing and mapping all happens in C
+            used = []
+
+            for slot in range( self.max_influences ):
+                weighted = list( map( bool, values[slot * 2 + 1::step] ) )
+                bones.update( itertools.compress( values[slot * 2::step], weighted ) )
+                used.append( weighted )
+
+            most = max( most, max( map( sum, zip( *used ) ) ) )
+
+        return most, bones
+
+class SEModelReader( object ):
+    def __init__( self, path ):
+        self.path = path
+        self.file = open( path, "rb" )
+
+        if os.fstat( self.file.fileno() ).st_size < 7:
+            self.file.close()
+            raise SEModelError( path + " is not an SEModel." )
+
+        self.data = mmap.mmap( self.file.fileno(), 0, access = mmap.ACCESS_READ )
+        self.bones = None
+        self.meshes = None
+
+        try:
+            self.read_header()
+        except:
+            self.close()
+            raise
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def close( self ):
+        if self.data != None:
+            self.data.close()
+            self.data = None
+
+        self.file.close()
+
+    def read_header( self ):
+        if self.data[0:7] != b"SEModel":
+            raise SEModelError( self.path + " is not an SEModel." )
+
+        if len( self.data ) < 29:
+            raise SEModelError( self.path + " is truncated." )
+
+        self.version, header_size = struct.unpack_from( "<2H", self.data, 7 )
+        self.data_flags, self.bone_flags, self.mesh_flags, self.bone_count, self.mesh_count, self.material_count = struct.unpack_from( "<3B3I", self.data, 11 )
+
+        # Bone names start straight after the header
+        self.bone_names_offset = 9 + header_size
+
+    def read_string( self, offset ):
+        end = self.data.find( b"\0", offset )
+
+        if end < 0:
+            raise SEModelError( self.path + " is truncated." )
+
+        return self.data[offset:end].decode( "utf-8", "replace" ), end + 1
+
+    def get_bones( self ):
+        # Returns a list of ( name, parent index ), the parent is -1 for root bones
+        if self.bones != None:
+            return self.bones
+
+        names = []
+        offset = self.bone_names_offset
+
+        if self.data_flags & SEMODEL_PRESENCE_BONE:
+            for index in range( self.bone_count ):
+                name, offset = self.read_string( offset )
+                names.append( name )
+
+        # Each bone is a flag byte and a parent index, followed by whichever transforms are present
+        bone_size = 5
+
+        if self.bone_flags & SEMODEL_PRESENCE_GLOBAL_MATRIX:
+            bone_size += 28
+
+        if self.bone_flags & SEMODEL_PRESENCE_LOCAL_MATRIX:
+            bone_size += 28
+
+        if self.bone_flags & SEMODEL_PRESENCE_SCALES:
+            bone_size += 12
+
+        if offset + bone_size * len( names ) > len( self.data ):
+            raise SEModelError( self.path + " is truncated." )
+
+        self.bones = []
+
+        for index in range( len( names ) ):
+            parent = struct.unpack_from( "<i", self.data, offset + index * bone_size + 1 )[0]
+            self.bones.append( ( names[index], parent ) )
+
+        self.bone_data_offset = offset
+        self.bone_size = bone_size
+        self.meshes_offset = offset + bone_size * len( names )
+
+        return self.bones
+
+    def get_meshes( self ):
+        if self.meshes != None:
+            return self.meshes
+
+        self.get_bones()
+        self.meshes = []
+        offset = self.meshes_offset
+
+        if self.data_flags & SEMODEL_PRESENCE_MESH:
+            for index in range( self.mesh_count ):
+                mesh = SEModelMesh( self, offset )
+                self.meshes.append( mesh )
+                offset = mesh.end_offset
+
+        # Materials follow the last mesh
+        self.materials_offset = offset
+
+        return self.meshes
+
+def get_parent_name( bones, index ):
+    parent = bones[index][1]
+
+    if parent < 0 or parent >= len( bones ):
+        return None
+
+    return bones[parent][0]
+
+def inspect_semodel( path, deep = True ):
+    # Summary of a single SEModel, deep also scans the weights for the real influence counts
+    with SEModelReader( path ) as reader:
+        bones = reader.get_bones()
+        meshes = reader.get_meshes()
+
+        info = {
+            "path": path,
+            "bones": [ bone[0] for bone in bones ],
+            "parents": dict( ( bones[index][0], get_parent_name( bones, index ) ) for index in range( len( bones ) ) ),
+            "meshes": len( meshes ),
+            "vertices": sum( [ mesh.vertex_count for mesh in meshes ] ),
+            "faces": sum( [ mesh.face_count for mesh in meshes ] ),
+            "declared_max_influences": max( [ mesh.max_influences for mesh in meshes if mesh.has_weights() ] or [ 0 ] ),
+            "max_influences": None,
+            "weighted_bones": None
+        }
+
+        if deep:
+            most = 0
+            weighted = set()
+
+            for mesh in meshes:
+                mesh_most, mesh_bones = mesh.get_influence_stats()
+                most = max( most, mesh_most )
+                weighted.update( mesh_bones )
+
+            info["max_influences"] = most
+            info["weighted_bones"] = sorted( [ bones[index][0] for index in weighted if index < len( bones ) ] )
+
+    return info
+
+def preflight( paths, deep = True ):
+    # Checks the parts of one model before it's imported, returns a report with any problems found
+    parts = []
+    problems = []
+
+    for path in paths:
+        try:
+            parts.append( inspect_semodel( path, deep ) )
+        except ( SEModelError, IOError, OSError, struct.error ) as exception:
+            problems.append( os.path.basename( path ) + ": " + str( exception ) )
+
+    # Bones that more than one part has, and where those parts disagree about the parent
+    owners = {}
+
+    for part in parts:
+        for bone in part["bones"]:
+            owners.setdefault( bone, [] ).append( part )
+
+    shared_bones = sorted( [ bone for bone in owners if len( owners[bone] ) > 1 ] )
+    parent_mismatches = {}
+
+    for bone in shared_bones:
+        parents = dict( ( os.path.basename( part["path"] ), part["parents"][bone] ) for part in owners[bone] )
+
+        if len( set( parents.values() ) ) > 1:
+            parent_mismatches[bone] = parents
+
+    for part in parts:
+        name = os.path.basename( part["path"] )
+        influences = part["max_influences"] if part["max_influences"] != None else part["declared_max_influences"]
+
+        if len( part["bones"] ) < 1:
+            problems.append( name + ": has no bones." )
+        elif "tag_origin" not in part["bones"]:
+            problems.append( name + ": has no tag_origin, it won't be rotated into place when combining." )
+
+        if len( parts ) > 1 and not any( [ len( owners[bone] ) > 1 for bone in part["bones"] ] ):
+            problems.append( name + ": shares no bones with the other parts." )
+
+        if influences > max_influences:
+            problems.append( name + ": has " + str( influences ) + " influences on a vertex, the limit is " + str( max_influences ) + "." )
+
+    for bone in sorted( parent_mismatches ):
+        problems.append( bone + ": parts disagree on the parent (" + ", ".join( [ part + " -> " + str( parent ) for part, parent in sorted( parent_mismatches[bone].items() ) ] ) + ")." )
+
+    return {
+        "parts": parts,
+        "shared_bones": shared_bones,
+        "parent_mismatches": parent_mismatches,
+        "problems": problems
+    }
+
+def scan_folder( directory, deep = True ):
+    # Every folder with SEModels in it is treated as one model made up of those parts
+    reports = []
+
+    for root, directories, files in os.walk( directory ):
+        directories.sort()
+        paths = [ os.path.join( root, file ) for file in sorted( files ) if file.lower().endswith( ".semodel" ) ]
+
+        if len( paths ) > 0:
+            reports.append( ( root, preflight( paths, deep ) ) )
+
+    return reports
+
+def format_preflight_report( report ):
+    lines = []
+
+    for part in report["parts"]:
+        influences = part["max_influences"] if part["max_influences"] != None else part["declared_max_influences"]
+        lines.append( "%s: %d bones, %d meshes, %d vertices, %d faces, %d max influences" % ( os.path.basename( part["path"] ), len( part["bones"] ), part["meshes"], part["vertices"], part["faces"], influences ) )
+
+    if len( report["parts"] ) > 1:
+        lines.append( "Shared bones: " + str( len( report["shared_bones"] ) ) )
+
+    if len( report["problems"] ) > 0:
+        lines.append( "" )
+        lines.append( "Problems:" )
+        lines += [ "    " + problem for problem in report["problems"] ]
+    else:
+        lines.append( "No problems found." )
+
+    return "\n".join( lines )
+
+def read_seanim_header( path ):
+    # Header and bone names only, the keyframes are never read
+    with open( path, "rb" ) as file:
+        data = file.read( 36 )
+
+        if len( data ) < 8 or data[0:6] != b"SEAnim":
+            raise SEAnimError( path + " is not an SEAnim." )
+
+        header_size = struct.unpack_from( "<H", data, 8 )[0]
+
+        if len( data ) < 8 + header_size:
+            raise SEAnimError( path + " is truncated." )
+
+        values = struct.unpack_from( "<6BfII4BI", data, 10 )
+        header = {
+            "type": values[0],
+            "looped": bool( values[1] & 1 ),
+            "framerate": values[6],
+            "frames": values[7],
+            "bone_count": values[8],
+            "note_count": values[13]
+        }
+
+        # Bone names follow the header, read until we have them all
+        file.seek( 8 + header_size )
+        names = []
+        buffer = b""
+
+        while len( names ) < header["bone_count"]:
+            chunk = file.read( 4096 )
+
+            if not chunk:
+                raise SEAnimError( path + " is truncated." )
+
+            buffer += chunk
+            strings = buffer.split( b"\0" )
+            buffer = strings.pop()
+            names += [ name.decode( "utf-8", "replace" ) for name in strings ]
+
+        header["bones"] = names[:header["bone_count"]]
+
+    return header
+
+def get_seanim_type( bones ):
+    if any( [ bone in bones for bone in viewmodel_bones ] ) and not any( [ bone in bones for bone in fullbody_bones ] ):
+        return "Viewmodel"
+    elif any( [ bone in bones for bone in fullbody_bones ] ):
+        return "Fullbody"
+
+    return "Other"
+
+def read_seanim_entry( path, mtime, size ):
+    # What the index keeps for one SEAnim, a file that can't be read is kept with its error so it isn't read again until it changes
+    entry = { "mtime": mtime, "size": size }
+
+    try:
+        header = read_seanim_header( path )
+        entry.update( { "frames": header["frames"], "framerate": header["framerate"], "bones": header["bone_count"], "type": get_seanim_type( header["bones"] ) } )
+    except ( SEAnimError, IOError, OSError, struct.error ) as exception:
+        entry.update( { "frames": 0, "framerate": 0, "bones": 0, "type": "Other", "error": str( exception ) } )
+
+    return entry
+
+def load_seanim_index( index_path ):
+    try:
+        with open( index_path, "r" ) as file:
+            cache = json.load( file )
+
+        if cache.get( "version" ) == seanim_index_version:
+            return cache["entries"]
+    except ( IOError, OSError, ValueError, KeyError ):
+        pass
+
+    return {}
+
+def save_seanim_index( index_path, entries ):
+    # Not being able to write it just means we read the headers again next time
+    try:
+        with open( index_path, "w" ) as file:
+            json.dump( { "version": seanim_index_version, "entries": entries }, file, indent = 4, sort_keys = True )
+    except ( IOError, OSError ):
+        pass
+
+def update_seanim_entries( directory, index, stats ):
+    # Entries for the files in stats, { file name: ( mtime, size ) }, the ones in index are reused if their file hasn't changed
+    entries = {}
+
+    for name in stats:
+        mtime, size = stats[name]
+        entry = index.get( name )
+
+        if entry == None or entry["mtime"] != mtime or entry["size"] != size:
+            entry = read_seanim_entry( os.path.join( directory, name ), mtime, size )
+
+        entries[name] = entry
+
+    return entries
+
+def update_seanim_index( directory, index_path ):
+    # Returns { file name: entry } for every SEAnim in the directory, only new or changed files are read
+    index = load_seanim_index( index_path )
+    stats = {}
+
+    for name in os.listdir( directory ):
+        path = os.path.join( directory, name )
+
+        if not name.lower().endswith( ".seanim" ) or not os.path.isfile( path ):
+            continue
+
+        stat = os.stat( path )
+        stats[name] = ( stat.st_mtime, stat.st_size )
+
+    entries = update_seanim_entries( directory, index, stats )
+
+    if entries != index:
+        save_seanim_index( index_path, entries )
+
+    return entries
+
+def main( arguments ):
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Check SEModels before importing them." )
+    parser.add_argument( "paths", nargs = "+", help = "SEModel files (parts of one model) or folders to scan" )
+    parser.add_argument( "--quick", action = "store_true", help = "Don't scan the weights, use the declared influence counts" )
+    options = parser.parse_args( arguments )
+
+    reports = []
+    files = [ path for path in options.paths if os.path.isfile( path ) ]
+
+    if len( files ) > 0:
+        reports.append( ( ", ".join( files ), preflight( files, not options.quick ) ) )
+
+    for path in options.paths:
+        if os.path.isdir( path ):
+            reports += scan_folder( path, not options.quick )
+
+    result = 0
+
+    for name, report in reports:
+        print( name )
+        print( format_preflight_report( report ) )
+        print( "" )
+
+        if len( report["problems"] ) > 0:
+            result = 1
+
+    return result
+
+if __name__ == "__main__":
+    sys.exit( main( sys.argv[1:] ) )
@@ -0,0 +1,243 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A log of how long every operation took, one JSON record per line, and the analyzer for it
+#
+# CoDCharacterTools logs a record at the end of every top level operation, the records
+# are written on a background thread so logging never holds Maya up.
+#
+# From the command line:
+#   python CoDCharacterToolsTelemetry.py path/to/Telemetry
+#   python CoDCharacterToolsTelemetry.py path/to/Telemetry --operation "Rig converter"
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Log files are rotated when they get bigger than this (in bytes), the oldest past max_files is deleted
+max_file_size = 4 * 1024 * 1024
+max_files = 5
+
+# Records are written at most this often (in seconds), or sooner if this many are waiting
+flush_interval = 2.0
+flush_count = 64
+
+log_name = "telemetry"
+
+# Records waiting to be written and the thread writing them
+records = queue.Queue()
+writer = None
+writer_lock = threading.Lock()
+
+# Scale buckets the analyzer groups records into, by joint count
+scale_buckets = [ 0, 100, 250, 500, 1000, 2000 ]
+
+def get_log_path( directory, index = 0 ):
+    if index == 0:
+        return os.path.join( directory, log_name + ".jsonl" )
+
+    return os.path.join( directory, log_name + "." + str( index ) + ".jsonl" )
+
+def rotate( directory ):
+    # telemetry.jsonl becomes telemetry.1.jsonl and so on, the oldest one goes
+    oldest = get_log_path( directory, max_files - 1 )
+
+    if os.path.isfile( oldest ):
+        os.remove( oldest )
+
+    for index in reversed( range( max_files - 1 ) ):
+        if os.path.isfile( get_log_path( directory, index ) ):
+            os.rename( get_log_path( directory, index ), get_log_path( directory, index + 1 ) )
+
+def write_records( directory, batch ):
+    if not os.path.isdir( directory ):
+        os.makedirs( directory )
+
+    path = get_log_path( directory )
+
+    if os.path.isfile( path ) and os.path.getsize( path ) > max_file_size:
+        rotate( directory )
+
+    with open( path, "a" ) as file:
+        file.write( "".join( [ json.dumps( record, sort_keys = True ) + "\n" for record in batch ] ) )
+
+def run_writer():
+    # Collects records until there's enough of them or flush_interval has passed, then writes them all at once
+    while True:
+        batch = [ records.get() ]
+        deadline = time.time() + flush_interval
+
+        while len( batch ) < flush_count:
+            try:
+                batch.append( records.get( timeout = max( deadline - time.time(), 0 ) ) )
+            except queue.Empty:
+                break
+
+        batches = {}
+
+        for directory, record in batch:
+            batches.setdefault( directory, [] ).append( record )
+
+        for directory in batches:
+            # Not being able to write the log mustn't break anything else, or stop the thread with records left that flush waits for
+            try:
+                write_records( directory, batches[directory] )
+            except Exception:
+                pass
+
+        for record in batch:
+            records.task_done()
+
+def log( directory, record ):
+    # Queues a record to be written to directory's log in the background
+    global writer
+
+    with writer_lock:
+        if writer == None:
+            writer = threading.Thread( target = run_writer, name = "CoDCharacterToolsTelemetry" )
+            writer.daemon = True
+            writer.start()
+
+    records.put( ( directory, record ) )
+
+def flush( timeout = 10.0 ):
+    # Waits until everything that's been logged is written, or timeout seconds, so a stuck writer can't hold up Maya exiting
+    # Queue.join doesn't take a timeout, so the waiting is done on another thread
+    if writer == None:
+        return
+
+    joiner = threading.Thread( target = records.join, name = "CoDCharacterToolsTelemetryFlush" )
+    joiner.daemon = True
+    joiner.start()
+    joiner.join( timeout )
+
+# Whatever's still waiting is written when Maya (or Python) exits
+atexit.register( flush )
+
+def load_records( directory ):
+    # Every record in the log and its rotated files, oldest first, lines that can't be read are skipped
+    result = []
+
+    for index in reversed( range( max_files ) ):
+        path = get_log_path( directory, index )
+
+        if not os.path.isfile( path ):
+            continue
+
+        with open( path, "r" ) as file:
+            for line in file:
+                try:
+                    result.append( json.loads( line ) )
+                except ValueError:
+                    pass
+
+    return result
+
+def get_scale_bucket( joints ):
+    for index in reversed( range( len( scale_buckets ) ) ):
+        if joints >= scale_buckets[index]:
+            if index == len( scale_buckets ) - 1:
+                return str( scale_buckets[index] ) + "+ joints"
+
+            return str( scale_buckets[index] ) + "-" + str( scale_buckets[index + 1] - 1 ) + " joints"
+
+    return "unknown"
+
+def get_percentile( values, percentile ):
+    # Linear between the closest ranks, values must be sorted
+    if len( values ) == 1:
+        return values[0]
+
+    position = ( len( values ) - 1 ) * percentile / 100.0
+    lower = int( position )
+    upper = min( lower + 1, len( values ) - 1 )
+
+    return values[lower] + ( values[upper] - values[lower] ) * ( position - lower )
+
+def analyze( records, operation = None ):
+    # Returns a list of dicts with operation, bucket, count, failed and the p50, p90, p99 and max durations, sorted by operation then scale
+    groups = {}
+
+    for record in records:
+        if operation != None and record.get( "operation" ) != operation:
+            continue
+
+        if not "duration" in record or not "operation" in record:
+            continue
+
+        bucket = get_scale_bucket( record["joints"] ) if "joints" in record else "unknown"
+        group = groups.setdefault( ( record["operation"], bucket ), { "durations": [], "failed": 0 } )
+        group["durations"].append( record["duration"] )
+        group["failed"] += 1 if record.get( "failed" ) else 0
+
+    rows = []
+
+    for key in groups:
+        durations = sorted( groups[key]["durations"] )
+
+        rows.append( {
+            "operation": key[0],
+            "bucket": key[1],
+            "count": len( durations ),
+            "failed": groups[key]["failed"],
+            "p50": get_percentile( durations, 50 ),
+            "p90": get_percentile( durations, 90 ),
+            "p99": get_percentile( durations, 99 ),
+            "max": durations[-1]
+        } )
+
+    order = dict( ( get_scale_bucket( bucket ), index ) for index, bucket in enumerate( scale_buckets ) )
+
+    return sorted( rows, key = lambda row: ( row["operation"], order.get( row["bucket"], len( order ) ) ) )
+
+def format_report( rows ):
+    if len( rows ) < 1:
+        return "No records."
+
+    lines = [ "%-32s %-16s %6s %6s %9s %9s %9s %9s" % ( "Operation", "Scale", "Runs", "Failed", "p50 (s)", "p90 (s)", "p99 (s)", "Max (s)" ) ]
+
+    for row in rows:
+        lines.append( "%-32s %-16s %6d %6d %9.3f %9.3f %9.3f %9.3f" % ( row["operation"], row["bucket"], row["count"], row["failed"], row["p50"], row["p90"], row["p99"], row["max"] ) )
+
+    return "\n".join( lines )
+
+def main( arguments ):
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Percentiles of how long CoDCharacterTools operations took, by operation and joint count." )
+    parser.add_argument( "directory", help = "Telemetry directory, CoDCharacterTools/Telemetry in the Maya scripts directory" )
+    parser.add_argument( "--operation", help = "Only this operation, like \"Rig converter\"" )
+    parser.add_argument( "--json", action = "store_true", help = "Print the rows as JSON" )
+    options = parser.parse_args( arguments )
+
+    rows = analyze( load_records( options.directory ), options.operation )
+
+    if options.json:
+        print( json.dumps( rows, indent = 4 ) )
+    else:
+        print( format_report( rows ) )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit( main( sys.argv[1:] ) )
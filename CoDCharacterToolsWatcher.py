@@ -0,0 +1,122 @@
+#   Copyright (C) 2023  Kyle Wood
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Watches directories for files being added, changed or removed
+#
+# Native change notifications need a different library on every platform, so the directories
+# are polled instead. A poll lists the directory and stats its files, nothing is read, and a
+# directory's callback is only called when something in it changed since the last poll.
+
+import os
+import stat
+import threading
+
+# Seconds between polls
+poll_interval = 2.0
+
+# { directory: { "extensions", "callback", "snapshot" } }, the snapshot is None until the first poll
+watches = {}
+watches_lock = threading.Lock()
+
+# The thread polling them, stopped by setting stopping
+watcher = None
+stopping = threading.Event()
+
+def get_snapshot( directory, extensions ):
+    # { file name: ( mtime, size ) } for the files with one of the extensions, empty if the directory doesn't exist
+    snapshot = {}
+
+    try:
+        names = os.listdir( directory )
+    except OSError:
+        return snapshot
+
+    for name in names:
+        if not name.lower().endswith( extensions ):
+            continue
+
+        # It can be removed between listing and getting here
+        try:
+            result = os.stat( os.path.join( directory, name ) )
+        except OSError:
+            continue
+
+        if stat.S_ISREG( result.st_mode ):
+            snapshot[name] = ( result.st_mtime, result.st_size )
+
+    return snapshot
+
+def compare_snapshots( old, new ):
+    # Returns the added, changed and removed file names, sorted
+    added = sorted( [ name for name in new if name not in old ] )
+    changed = sorted( [ name for name in new if name in old and new[name] != old[name] ] )
+    removed = sorted( [ name for name in old if name not in new ] )
+
+    return added, changed, removed
+
+def watch( directory, extensions, callback ):
+    # callback( directory, snapshot, added, changed, removed ) is called on the watcher thread when something changes,
+    # it mustn't touch Maya. The first poll calls it with everything as added. Watching a directory again replaces the callback
+    with watches_lock:
+        watches[directory] = { "extensions": tuple( [ extension.lower() for extension in extensions ] ), "callback": callback, "snapshot": None }
+
+    start()
+
+def unwatch( directory ):
+    with watches_lock:
+        watches.pop( directory, None )
+
+def poll():
+    with watches_lock:
+        items = list( watches.items() )
+
+    for directory, entry in items:
+        snapshot = get_snapshot( directory, entry["extensions"] )
+
+        if entry["snapshot"] != None and snapshot == entry["snapshot"]:
+            continue
+
+        added, changed, removed = compare_snapshots( entry["snapshot"] or {}, snapshot )
+        entry["snapshot"] = snapshot
+
+        # One callback failing mustn't stop the others, or the next poll
+        try:
+            entry["callback"]( directory, snapshot, added, changed, removed )
+        except Exception as exception:
+            print( "Watching " + directory + " failed: " + str( exception ) )
+
+def run_watcher():
+    while True:
+        poll()
+
+        if stopping.wait( poll_interval ):
+            break
+
+def start():
+    global watcher
+
+    with watches_lock:
+        if watcher == None or not watcher.is_alive():
+            stopping.clear()
+            watcher = threading.Thread( target = run_watcher, name = "CoDCharacterToolsWatcher" )
+            watcher.daemon = True
+            watcher.start()
+
+def stop():
+    # Waits for a poll that's running to finish
+    stopping.set()
+
+    if watcher != None:
+        watcher.join()